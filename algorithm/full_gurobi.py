@@ -12,6 +12,8 @@ class FullGurobi(GurobiAlgorithm):
         self.SCA_flag = False
         self.output = False
         self.time = None
+        # 矩阵D使用的距离度量，hop为跳数，latency为链路时延之和
+        self.distance = "hop"
 
         self.M = None
         self.W = None
@@ -79,12 +81,13 @@ class FullGurobi(GurobiAlgorithm):
         return np.array(A)
     
     def __matrix_L(self):
-        """微服务包含的层的数量"""
-        L = len(self.microservice_library)
+        """镜像层的数量，即镜像层注册表中的层数，微服务之间共享的层只算一次"""
+        L = self.get_layer_registry().L
         return L
     
     def __matrix_E_kil(self, K, L, A, K_id_list):
-        """每个应用程序k的微服务i所包含的l层,包括初始微服务"""
+        """每个应用程序k的微服务i所包含的l层,包括初始微服务，l为镜像层注册表中的层id"""
+        registry = self.get_layer_registry()
         E_kil = []
         for k in range(K):
             ms_number = A[k]
@@ -93,17 +96,14 @@ class FullGurobi(GurobiAlgorithm):
             e_kil = np.zeros((ms_number, L))
             for ms in range(1,ms_number):
                 ms_id = ms_ids[ms]
-                e_kil[ms, ms_id] = 1
+                e_kil[ms, registry.microservice_layers(ms_id)] = 1
             E_kil.append(e_kil)
         return E_kil
 
     
     def __matrix_S_l(self):
-        """微服务包含的层的大小,这里每个微服务的所有层都变成1层，列表指数为微服务id减一"""
-        S_l = [0]*len(self.microservice_library)
-        for microservice_id in self.microservice_library:
-            S_l[microservice_id-1] = self.get_microservice_size(microservice_id)
-        S_l = np.atleast_2d(np.array(S_l)).transpose()
+        """每个镜像层的大小，列表指数为镜像层注册表中的层id"""
+        S_l = np.atleast_2d(self.get_layer_registry().sizes).transpose()
         return S_l
     
     def __matrix_u(self, K, A, K_id_list):
@@ -138,9 +138,9 @@ class FullGurobi(GurobiAlgorithm):
             w.append(w_k)
         return w
     
-    def __matrix_D(self):
-        """多跳路径"""
-        return self.matrix_D
+    def __matrix_D(self, time):
+        """多跳路径，使用time时刻生效的拓扑，按照self.distance为跳数或时延"""
+        return self.database.get_topo_distance(self.distance, time)
     
     def __matrix_Source(self, K, Device_id_list, time):
         """源节点"""
@@ -162,7 +162,7 @@ class FullGurobi(GurobiAlgorithm):
         S_l = self.__matrix_S_l()
         u = self.__matrix_u(K, A, K_id_list)
         w = self.__matrix_w(K, A, K_id_list)
-        D = self.__matrix_D()
+        D = self.__matrix_D(time)
         Source = self.__matrix_Source(K, Device_id_list, time)
 
         para_dict = {}
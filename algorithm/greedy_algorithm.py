@@ -1,6 +1,9 @@
 import numpy as np
 import copy
+import bisect
 from algorithm.full_gurobi import FullGurobi
+from environment.server_pool import ServerPool, from_units
+from environment.layer_registry import LayerRegistry
 import random 
 
 class GreedyAlgorithm(FullGurobi):
@@ -81,16 +84,25 @@ class Deployment:
         self.b = dict["b_cloud"]
         self.D = dict["D"]
         
-        self.max_hop = int(np.max(self.D))
-        self.server_storage = self.C_S.copy()
-        self.server_cpu = self.C_C.copy().astype(float) #数据类型
+        # 从近到远的所有可达距离，D为跳数表时即0,1,2...，为时延表时是实际出现的时延值
+        self.distance_levels = np.unique(self.D[np.isfinite(self.D)])
+        # 服务器资源池，以整数单位保存剩余资源和每台服务器上的层，可行性判断在资源池中一次对所有服务器完成
+        self.pool = ServerPool(self.C_S, self.C_C, LayerRegistry.from_sizes(self.S_l))
+        # 剩余资源的浮点副本，由资源池同步，用于邻居索引中的排序
+        self.server_storage = from_units(self.pool.left_storage)
+        self.server_cpu = from_units(self.pool.left_computing)
 
-        # 服务器是否具有某一层
-        self.server_layer = np.zeros((self.N,self.L))
+        # 按距离分环的邻居索引，环内按剩余资源排序，部署时增量更新
+        self.neighbor_index = NeighborIndex(self.D, {"storage":self.server_storage, "cpu":self.server_cpu})
 
         # deployment 对应的是真实的数字
         self.deployment = self.__build_deployment()
 
+    @property
+    def server_layer(self):
+        """服务器是否具有某一层，(N, L)"""
+        return (self.pool.layer_count > 0).astype(float)
+
     def get_deployment(self):
         """
         获取部署策略
@@ -153,27 +165,32 @@ class Deployment:
             storage += self.S_l[l]
         return storage
 
+    def get_ms_demand(self, ms):
+        """
+        微服务列表在资源池中的合并需求，有微服务已经被部署时返回None
+        """
+        l_list, u_list = self.get_ms_layer_list(ms)
+        if l_list == False:
+            return None
+        return self.pool.demand(l_list, sum(u_list))
+
     def feasibility_of_deployment(self, ms, server_n):
         """
         :param ms: 微服务的编号列表,格式为[(k,i),(k,i),...]
         :param server_n: 服务器的编号
         判断微服务部署是否可行
         """
-        l_list, u_list = self.get_ms_layer_list(ms)
-        if l_list == False:
+        demand = self.get_ms_demand(ms)
+        if demand is None:
             return 1 # 已经被部署
+        layers, cpu = demand
 
-        count_storage_new = 0
-        for l in l_list:
-            if self.server_layer[server_n][l] == 1:
-                l_exist_in_server = 1
-            else:
-                count_storage_new += self.S_l[l]
-        if count_storage_new > self.server_storage[server_n]:
+        count_storage_new = self.pool.layer_sizes[layers][self.pool.layer_count[server_n, layers] == 0].sum()
+        if count_storage_new > self.pool.left_storage[server_n]:
             return 2 # 存储容量不足
-        if sum(u_list) > self.server_cpu[server_n]:
+        if cpu > self.pool.left_computing[server_n]:
             return 3 # 计算资源不足
-        return [l_list,sum(u_list),count_storage_new] # 可以部署
+        return demand # 可以部署
 
     def deploy_ms(self, ms, server_n):
         """
@@ -189,29 +206,36 @@ class Deployment:
         feasibility = self.feasibility_of_deployment(ms, server_n)
         if type(feasibility) == int:
             return feasibility
-        l_list, u, count_storage_new = feasibility[0], feasibility[1], feasibility[2]
 
         # 进行微服务部署
         # +1对应实际的服务器数值
         for (ms_k, ms_i) in ms:
             self.deployment[ms_k][ms_i] = server_n+1
 
-        for l in l_list:
-            self.server_layer[server_n][l] = 1
-        self.server_storage[server_n] -= count_storage_new
-        self.server_cpu[server_n] -= u
+        self.pool.deploy(server_n, *feasibility)
+        old_storage, old_cpu = self.server_storage[server_n], self.server_cpu[server_n]
+        self.server_storage[server_n] = from_units(self.pool.left_storage[server_n])
+        self.server_cpu[server_n] = from_units(self.pool.left_computing[server_n])
+        self.neighbor_index.update(server_n, "storage", old_storage)
+        self.neighbor_index.update(server_n, "cpu", old_cpu)
 
         return 0
 
     def deploy_ms_in_server_list(self, ms, server_list):
         """
-        根据给定的服务器列表部署微服务
+        根据给定的服务器列表部署微服务，先由资源池一次得到所有服务器能否部署，再按列表顺序部署到第一个可以部署的服务器
         """
+        if type(ms) == tuple:
+            ms = [ms]
+        demand = self.get_ms_demand(ms)
+        if demand is None:
+            return 1 # 已经被部署
+        feasible = self.pool.feasible(*demand)
         for server_n in server_list:
-            deploy_result = self.deploy_ms(ms, server_n)
-            if deploy_result == 0:
-                return 0
-        return deploy_result
+            if feasible[server_n]:
+                return self.deploy_ms(ms, server_n)
+        # 都不能部署时与逐个尝试一致，返回最后一台服务器的错误代码
+        return self.feasibility_of_deployment(ms, server_list[-1])
 
     def find_ms_from_l(self,l):
         """
@@ -228,11 +252,7 @@ class Deployment:
         """
         找到服务器n的hop跳可达服务器
         """
-        server_list = []
-        for n in range(self.N):
-            if self.D[server_n,n] == hop:
-                server_list.append(n)
-        return server_list
+        return self.neighbor_index.ring(server_n,hop).tolist()
 
     def find_deployment_from_ms(self, ms):
         """
@@ -360,8 +380,7 @@ class Deployment:
         对每台服务器都生成一些初始就有的层，让后面的差距起来
         """
         for n in range(self.N):
-            for l in random.sample([n for n in range(self.L)], 1):
-                self.server_layer[n][l] = 1
+            self.pool.mark_layers(n, random.sample([n for n in range(self.L)], 1))
 
     #下面两个用于检查原本的通讯和空间占用
     def calculate_storage_total(self):
@@ -497,36 +516,16 @@ class Simple_deployment(Deployment):
 
     def get_max_index_list_from_server_list(self,server_list,resource = "storage"):
         """
-        获取服务器列表中的按照资源大小排序后的列表
+        获取服务器列表中的按照资源大小排序后的列表，资源相同时保持列表中原有的顺序
         """
-        sort_list = []
-        resource_list = []
-        for server_n in server_list:
-            if resource == "storage":
-                resource_data,_ = self.get_resource_from_server(server_n)
-            else:
-                _,resource_data = self.get_resource_from_server(server_n)
-            if sort_list == []:
-                sort_list.append(server_n)
-                resource_list.append(resource_data)
-            else:
-                for i in range(len(sort_list)):
-                    if resource_data > resource_list[i]:
-                        sort_list.insert(i,server_n)
-                        resource_list.insert(i,resource_data)
-                        break
-                    elif i == len(sort_list)-1:
-                        sort_list.append(server_n)
-                        resource_list.append(resource_data)
-                        break
-        return sort_list
+        resource_data = self.server_storage if resource == "storage" else self.server_cpu
+        return sorted(server_list, key = lambda server_n: -resource_data[server_n])
 
     def get_max_index_list_from_server(self,server_n,hop,resource = "storage"):
         """
-        给定服务器n,获取服务器n的hop跳邻居中按照资源排序的服务器列表
+        给定服务器n,获取服务器n的hop跳邻居中按照资源排序的服务器列表，直接从邻居索引中读取
         """
-        hop_server_list = self.find_close_server(server_n,hop)
-        return self.get_max_index_list_from_server_list(hop_server_list, resource=resource)
+        return self.neighbor_index.sorted_ring(server_n,hop,resource)
 
     def get_max_b_list_from_server_list(self,server_list):
         """
@@ -591,12 +590,19 @@ class Simple_deployment(Deployment):
         :param server_n: 待部署的服务器
         :return: 成功则返回部署的服务器编号，失败则返回-1
         """
-        for hop in range(self.max_hop+1):
+        if type(ms) == tuple:
+            ms = [ms]
+        demand = self.get_ms_demand(ms)
+        if demand is None:
+            return -1
+        # 部署前所有服务器的可行性不变，只计算一次
+        feasible = self.pool.feasible(*demand)
+        for hop in self.distance_levels:
             hop_server_list = self.get_max_index_list_from_server(server_n,hop,resource="storage")
             for hop_server in hop_server_list:
                 # 遍历服务器部署微服务
-                deploy_result = self.deploy_ms(ms, hop_server)
-                if deploy_result == 0:
+                if feasible[hop_server]:
+                    self.deploy_ms(ms, hop_server)
                     return hop_server
         return -1
 
@@ -665,6 +671,55 @@ class Simple_deployment(Deployment):
             
         return [best_single_ms], best_ms
 
+class NeighborIndex:
+    """
+    按距离分环的服务器邻居索引，每个服务器的邻居按照距离分组，同一环内的服务器编号升序排列
+    环内按剩余资源从大到小的排序在第一次查询时建立，之后服务器资源变化时只对包含该服务器的环做二分删除和插入
+    """
+    def __init__(self, D, resources:dict):
+        self.N = D.shape[0]
+        # 资源数组为引用，由部署过程原地修改后调用update
+        self.resources = resources
+        # rings[n]为服务器n的 距离->服务器编号数组
+        self.rings = []
+        order = np.argsort(D, axis=1, kind="stable")
+        for n in range(self.N):
+            distance = D[n, order[n]]
+            finite = np.isfinite(distance)
+            levels, starts = np.unique(distance[finite], return_index=True)
+            self.rings.append(dict(zip(levels.tolist(), np.split(order[n][finite], starts[1:]))))
+        # 已经排序的环，(resource, n, hop) -> [(-剩余资源, 服务器编号), ...]
+        self.sorted_rings = {}
+        # 每个服务器所在的已排序环，资源变化时只需要更新这些环
+        self.server_in_rings = [[] for _ in range(self.N)]
+
+    def ring(self, server_n, hop):
+        """服务器n距离为hop的所有服务器，按编号升序"""
+        return self.rings[server_n].get(hop, np.array([], dtype=int))
+
+    def sorted_ring(self, server_n, hop, resource = "storage"):
+        """服务器n距离为hop的所有服务器，按剩余资源从大到小排序，资源相同时编号小的在前"""
+        key = (resource, server_n, hop)
+        if key not in self.sorted_rings:
+            resource_data = self.resources[resource]
+            members = self.ring(server_n, hop).tolist()
+            self.sorted_rings[key] = sorted((-resource_data[m], m) for m in members)
+            for m in members:
+                self.server_in_rings[m].append(key)
+        return [m for _, m in self.sorted_rings[key]]
+
+    def update(self, server_n, resource, old_value):
+        """服务器n的资源由old_value变为当前值后，更新所有包含该服务器的已排序环"""
+        new_value = self.resources[resource][server_n]
+        if new_value == old_value:
+            return
+        for key in self.server_in_rings[server_n]:
+            if key[0] != resource:
+                continue
+            sorted_ring = self.sorted_rings[key]
+            del sorted_ring[bisect.bisect_left(sorted_ring, (-old_value, server_n))]
+            bisect.insort(sorted_ring, (-new_value, server_n))
+
 class ListNode:
     #链节点类，用于存储归一化数据
     def __init__(self,data_form = None,ms = None,data = None,next = None):
@@ -838,12 +893,7 @@ class Layer_match_deployment(Deployment):
         """
         根据给定的微服务层，查询包含这些层大小最多的边缘服务器列表
         """
-        layers_in_server = np.zeros(self.N)
-        for n in range(self.N):
-            for layer in layers:
-                if self.server_layer[n][layer]:
-                    # layers_in_server[n] += self.S_l[layer]
-                    layers_in_server[n] += 1
+        layers_in_server = (self.pool.layer_count[:, layers] > 0).sum(axis=1).astype(float)
         # 将已有的层按照总大小从大到小排序得出服务器列表
         sort_list = np.argsort(layers_in_server)[::-1]
         return sort_list
@@ -853,8 +903,7 @@ class Layer_match_deployment(Deployment):
         对每台服务器都生成一些初始就有的层，让后面的差距起来
         """
         for n in range(self.N):
-            for l in random.sample([n for n in range(self.L)], 1):
-                self.server_layer[n][l] = 1
+            self.pool.mark_layers(n, random.sample([n for n in range(self.L)], 1))
 
 def layer_match_deployment(para_dict):
     """
@@ -882,13 +931,7 @@ class kubernetes_deployment(Deployment):
         """
         根据给定的微服务层，查询包含这些层大小最多的边缘服务器列表
         """
-        layers_in_server = np.zeros(self.N)
-        for n in range(self.N):
-            for layer in layers:
-                if self.server_layer[n][layer]:
-                    layers_in_server[n] += self.S_l[layer]
-                    b = self.S_l[layer]
-                    a = 1
+        layers_in_server = (self.pool.layer_count[:, layers] > 0) @ self.S_l[layers]
         # 将已有的层按照总大小从大到小排序得出服务器列表
         sort_list = np.argsort(layers_in_server)[::-1]
         return sort_list
@@ -898,8 +941,7 @@ class kubernetes_deployment(Deployment):
         对每台服务器都生成一些初始就有的层，让后面的差距起来
         """
         for n in range(self.N):
-            for l in random.sample([n for n in range(self.L)], 1):
-                self.server_layer[n][l] = 1
+            self.pool.mark_layers(n, random.sample([n for n in range(self.L)], 1))
 
 def k8s_deployment(para_dict):
     """
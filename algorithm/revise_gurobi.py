@@ -4,7 +4,6 @@ from environment.application import Microservice, Application
 import random
 import copy
 import numpy as np
-import networkx as nx
 import gurobipy as gp
 from gurobipy import GRB
 
@@ -24,6 +23,8 @@ class ReviseGurobiAlgorithm:
         self.solve_result = {}
         self.microservice_deployment_last = None
         self.server_deploy_microservice = None
+        # 服务器上已有的镜像层，行下标为服务器id，列下标为镜像层注册表中的层id
+        self.server_layer_array = None
         self.device_connected_server_last = None
 
         self.output = False  # 算法求解输出
@@ -33,6 +34,10 @@ class ReviseGurobiAlgorithm:
         self.x = None
         self.m_list = None
         self.k_list = None
+        # 当前求解的时刻，用于获取该时刻生效的拓扑
+        self.time = None
+        # 矩阵D使用的距离度量，hop为跳数，latency为链路时延之和
+        self.distance = "hop"
 
     # ------------------------基础数据模块，通过对数据库的访问返回基础数据------------------------
     @property
@@ -59,6 +64,10 @@ class ReviseGurobiAlgorithm:
     def migration_cost_config(self):
         return self.database.static_data["migration_cost"]
 
+    @property
+    def migration_cost_table(self):
+        return self.database.get_migration_cost_table()
+
     @property
     def microservice_library(self):
         return self.database.static_data["microservice_library"]
@@ -70,13 +79,10 @@ class ReviseGurobiAlgorithm:
     @property
     def matrix_D(self):
         """
-        该函数的作用是计算矩阵D，函数系列4
+        该函数的作用是返回矩阵D，函数系列4
+        距离矩阵在创建拓扑时已经计算好并存放在数据库中，这里直接返回当前求解时刻生效的跳数表或时延表
         """
-        D = np.zeros((self.server_num, self.server_num))
-        for i in range(self.server_num):
-            for j in range(self.server_num):
-                D[i][j] = self.get_server_hops(i + 1, j + 1)
-        return D
+        return self.database.get_topo_distance(self.distance, self.time)
 
     # ------------------------时变数据获取模块，通过对数据库的访问返回时变数据------------------------
 
@@ -91,6 +97,11 @@ class ReviseGurobiAlgorithm:
         返回给定时刻服务器部署的微服务列表
         """
         self.server_deploy_microservice = self.database.data[time]["state"]["server_microservice_deployment"]
+        server_layers = self.database.data[time]["state"]["server_deployed_layers"]
+        self.server_layer_array = self.get_layer_registry().presence_matrix(server_layers, max(server_layers.keys()) + 1)
+        # 启用镜像层缓存时，服务器上缓存的层也不需要拉取
+        for server_id, layers in self.database.data[time]["state"].get("server_cached_layers", {}).items():
+            self.server_layer_array[server_id, self.get_layer_registry().get_ids(layers)] = True
 
     def application_contain_microservice_ids(self, app_id: int):
         """
@@ -132,6 +143,19 @@ class ReviseGurobiAlgorithm:
         microservice: Microservice = self.microservice_library[microservice_id]
         return sum(microservice.layers.values())
 
+    def get_layer_registry(self):
+        """
+        镜像层注册表
+        """
+        return self.database.static_data["layer_registry"]
+
+    def get_microservice_pull_size(self, microservice_id: int, server_id: int):
+        """
+        该函数的作用是获得给定微服务部署到服务器上需要拉取的镜像层大小，服务器上已有的层（包括其他微服务共享的层）不需要拉取
+        """
+        registry = self.get_layer_registry()
+        return registry.pull_size(registry.microservice_layers(microservice_id), self.server_layer_array[server_id])
+
     def get_microservice_cpu(self, microservice_id: int):
         """
         该函数的作用是获得给定微服务的计算能力
@@ -195,19 +219,17 @@ class ReviseGurobiAlgorithm:
         """
         deploy_dict: dict = self.server_deploy_microservice[server_id]
         device_dict: dict
-        application_dict: dict
         for device_dict in deploy_dict.values():
-            for application_dict in device_dict.values():
-                for ms_id in application_dict.keys():
-                    if ms_id == microservice_id:
-                        return True
+            for ms_ids in device_dict.values():
+                if microservice_id in ms_ids:
+                    return True
 
     def get_server_hops(self, server_id_1: int, server_id_2: int):
         """
         该函数的作用是获得给定两个服务器之间的跳数
         """
-        topo = self.database.static_data["topo"]
-        return nx.shortest_path_length(topo, source=server_id_1, target=server_id_2)
+        hop_matrix = self.database.get_topo_distance(self.distance, self.time)
+        return hop_matrix[server_id_1 - 1, server_id_2 - 1]
 
     def get_communication(self, application_id: int, microservice_id_1: int, microservice_id_2: int):
         """
@@ -232,34 +254,31 @@ class ReviseGurobiAlgorithm:
 
     # ------------------------和算法有关的功能函数，数值计算部分------------------------
 
-    def _get_migration_cost_details(self, microservice_id: int, server_id: int):
+    def _get_migration_cost_details(self, microservice_id: int, server_id: int, from_server_id: int = None):
         """
-        获取给定微服务迁移到服务器的迁移代价，函数系列1（理论上应该是从服务器1迁移到服务器2的代价，目前没有考虑）
+        获取给定微服务迁移到服务器的迁移代价，函数系列1，给出源服务器时使用从源服务器迁移到该服务器的代价
         """
-        for one in self.migration_cost_config:
-            if one["microservice_id"] == microservice_id and one["server_id"] == server_id:
-                return one["cost"]
-        if microservice_id == 0:
-            return 0
+        return self.migration_cost_table.cost(microservice_id, server_id, from_server_id)
 
     def _calculate_C_m_k_i_1_n(self, device_id: int, application_id: int, microservice_id: int, server_id: int):
         """
         该函数的作用是计算迁移代价，函数系列1
         """
         x_m_k_i_t_pre = self.get_deployemnt(device_id, application_id, microservice_id)
+        server_ids = np.array(self.server_ids)
         I_i_n = np.zeros(self.server_num)
-        for ids in self.server_ids:
-            I_i_n[ids - 1] = self._get_migration_cost_details(microservice_id, server_id)
+        I_i_n[server_ids - 1] = self.migration_cost_table.cost(np.full(len(server_ids), microservice_id), np.full(len(server_ids), server_id), server_ids)
         return np.dot(x_m_k_i_t_pre, I_i_n)
 
     def calculate_C_m_k_i_1(self, device_id: int, application_id: int, microservice_id: int):
         """
-        该函数的作用是计算迁移代价，函数系列1
+        该函数的作用是计算迁移代价，函数系列1，行为源服务器、列为目标服务器的迁移代价矩阵一次查表得到
         """
-        C_m_k_i_1 = np.zeros(self.server_num)
-        for server_id in self.server_ids:
-            C_m_k_i_1[server_id - 1] = self._calculate_C_m_k_i_1_n(device_id, application_id, microservice_id, server_id)
-        return C_m_k_i_1
+        x_m_k_i_t_pre = self.get_deployemnt(device_id, application_id, microservice_id)
+        server_ids = np.array(self.server_ids)
+        I = np.zeros((self.server_num, self.server_num))
+        I[np.ix_(server_ids - 1, server_ids - 1)] = self.migration_cost_table.cost_matrix(microservice_id, server_ids)
+        return np.dot(x_m_k_i_t_pre, I)
 
     def _calculate_C_m_k_i_2_n(self, microservice_id: int, server_id: int):
         """
@@ -270,7 +289,7 @@ class ReviseGurobiAlgorithm:
         if self.check_server_deploy_microservice(server_id, microservice_id):
             return 0
         else:
-            return self.get_microservice_size(microservice_id) / self.get_server_bandwidth(server_id)
+            return self.get_microservice_pull_size(microservice_id, server_id) / self.get_server_bandwidth(server_id)
 
     def calculate_C_m_k_i_2(self, device_id: int, application_id: int, microservice_id: int):
         """
@@ -665,6 +684,7 @@ class ReviseGurobiAlgorithm:
 
     # ------------------------求解算法的主体部分，可调用的函数------------------------
     def get_data(self, time: int):
+        self.time = time
         self.get_deployment_from_database(time - 1)
         self.get_server_deploy_microservice(time - 1)
         m_k_dict = self.get_changed_devices_and_applications(time)
@@ -131,6 +131,10 @@ CONFIG_ENVIRONMENT = {
     ],
 }
 import random
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 
 
 class ConfigGenerate:
@@ -147,9 +151,15 @@ class ConfigGenerate:
         microservice_number: int = 30,
         start_mode: str = "running",
         end_time: int = 40,
+        topology_type: str = "random",
+        topology_params: dict = None,
+        image_type: str = "single",
+        image_params: dict = None,
     ):
         self.config = {}
         random.seed(seed)
+        # 拓扑生成器单独使用numpy的随机数，不影响其余配置的随机序列
+        self.rng = np.random.default_rng(seed)
 
         self.device_number = device_number
         self.server_number = server_number
@@ -159,6 +169,10 @@ class ConfigGenerate:
         self.application = None
         self.start_mode = start_mode  # running, solve
         self.end_time = end_time
+        self.topology_type = topology_type  # random, ring_of_clusters, fat_tree, random_geometric, barabasi_albert
+        self.topology_params = topology_params if topology_params is not None else {}
+        self.image_type = image_type  # single, shared
+        self.image_params = image_params if image_params is not None else {}
 
     def generate(self):
         """生成配置文件"""
@@ -201,7 +215,25 @@ class ConfigGenerate:
         return server
 
     def generate_topology(self):
-        """生成拓扑，拓扑属性为边缘服务器之间的链接关系"""
+        """
+        生成拓扑，拓扑属性为边缘服务器之间的链接关系
+        random为原有的随机稠密拓扑，返回字典列表；其余类型由numpy生成器直接返回(E,2)的边数组，元素为服务器id
+        """
+        if self.topology_type == "random":
+            return self.topology_random()
+        generators = {
+            "ring_of_clusters": self.topology_ring_of_clusters,
+            "fat_tree": self.topology_fat_tree,
+            "random_geometric": self.topology_random_geometric,
+            "barabasi_albert": self.topology_barabasi_albert,
+        }
+        if self.topology_type not in generators:
+            raise ValueError("Topology type error!")
+        edges = generators[self.topology_type](**self.topology_params)
+        return self._normalize_edges(edges)
+
+    def topology_random(self):
+        """链式拓扑加上随机数量的额外边，边数为O(N^2)，只适合小规模服务器"""
         topo = []
         for i in range(self.server_number - 1):
             topo.append({"server_1": i + 1, "server_2": i + 2})
@@ -213,24 +245,171 @@ class ConfigGenerate:
         topo += random.sample(candidate_topo, random.randint(0, len(candidate_topo)))
         return topo
 
+    def topology_ring_of_clusters(self, cluster_size: int = 8):
+        """
+        环形簇拓扑，连续的cluster_size个服务器组成一个簇，簇内成环且所有成员连接簇头（簇内第一个服务器），各簇头之间成环
+        """
+        n = self.server_number
+        ids = np.arange(n)
+        cluster = ids // cluster_size
+        head = cluster * cluster_size
+        tail = np.minimum(head + cluster_size, n) - 1
+        # 簇内成环：每个服务器连接簇内下一个服务器，簇尾连接回簇头
+        next_id = np.where(ids == tail, head, ids + 1)
+        ring = np.stack([ids, next_id], axis=1)
+        # 簇内星形：成员连接簇头
+        star = np.stack([head, ids], axis=1)
+        # 簇头之间成环
+        heads = np.arange(0, n, cluster_size)
+        head_ring = np.stack([heads, np.roll(heads, -1)], axis=1)
+        return np.concatenate([ring, star, head_ring]) + 1
+
+    def topology_fat_tree(self, core_number: int = 2, aggregation_number: int = None, uplink_number: int = 2):
+        """
+        分层的边缘-汇聚-核心拓扑，服务器id依次为核心层、汇聚层、边缘层
+        汇聚层服务器连接所有核心层服务器，边缘层服务器连接uplink_number个相邻的汇聚层服务器
+        """
+        n = self.server_number
+        if aggregation_number is None:
+            aggregation_number = max(1, int(np.sqrt(n)))
+        core_number = min(core_number, n)
+        aggregation_number = min(aggregation_number, n - core_number)
+        if aggregation_number == 0:
+            return np.stack(np.triu_indices(core_number, k=1), axis=1) + 1
+        core = np.arange(core_number)
+        aggregation = np.arange(core_number, core_number + aggregation_number)
+        edge = np.arange(core_number + aggregation_number, n)
+        # 汇聚层与核心层全连接
+        agg_core = np.stack([np.repeat(aggregation, core_number), np.tile(core, aggregation_number)], axis=1)
+        # 核心层之间成链，只有一个核心层服务器时为空
+        core_link = np.stack([core[:-1], core[1:]], axis=1)
+        # 边缘层按顺序分配到汇聚层，连接相邻的uplink_number个汇聚层服务器
+        uplink_number = min(uplink_number, aggregation_number)
+        offset = np.arange(uplink_number)
+        edge_agg_index = (np.arange(len(edge))[:, None] + offset[None, :]) % aggregation_number
+        edge_agg = np.stack([np.repeat(edge, uplink_number), aggregation[edge_agg_index.ravel()]], axis=1)
+        return np.concatenate([agg_core, core_link, edge_agg]) + 1
+
+    def topology_random_geometric(self, radius: float = None):
+        """
+        随机几何图，服务器均匀分布在单位正方形内，距离小于radius的服务器之间连边，默认半径保证平均度数约为log(N)
+        生成后若不连通，则依次连接各连通分量中最近的服务器对
+        """
+        n = self.server_number
+        if radius is None:
+            radius = np.sqrt(max(np.log(n), 1) / (np.pi * n))
+        position = self.rng.random((n, 2))
+        tree = cKDTree(position)
+        edges = tree.query_pairs(radius, output_type="ndarray").reshape(-1, 2)
+        edges = np.concatenate([edges, self._connect_components(edges, position)])
+        return edges + 1
+
+    def topology_barabasi_albert(self, m: int = 2):
+        """
+        Barabási–Albert无标度拓扑，每个新加入的服务器按度数成比例地连接m个已有服务器
+        初始m+1个服务器成环，度数通过端点数组上的均匀采样实现按度数成比例的选择
+        """
+        n = self.server_number
+        if n <= m + 1:
+            return np.stack(np.triu_indices(n, k=1), axis=1) + 1
+        seed_nodes = np.arange(m + 1)
+        seed_edges = np.stack([seed_nodes, np.roll(seed_nodes, -1)], axis=1)
+        if m == 1:
+            seed_edges = seed_edges[:1]
+        total_edges = len(seed_edges) + (n - m - 1) * m
+        # 所有边的端点，服务器出现的次数即其度数
+        endpoints = np.empty(2 * total_edges, dtype=int)
+        endpoints[: 2 * len(seed_edges)] = seed_edges.ravel()
+        count = 2 * len(seed_edges)
+        edges = np.empty((total_edges, 2), dtype=int)
+        edges[: len(seed_edges)] = seed_edges
+        edge_count = len(seed_edges)
+        for node in range(m + 1, n):
+            targets = set()
+            while len(targets) < m:
+                targets.update(endpoints[self.rng.integers(0, count, m - len(targets))].tolist())
+            targets = np.fromiter(targets, dtype=int, count=m)
+            edges[edge_count : edge_count + m, 0] = node
+            edges[edge_count : edge_count + m, 1] = targets
+            endpoints[count : count + 2 * m] = np.stack([np.full(m, node), targets], axis=1).ravel()
+            edge_count += m
+            count += 2 * m
+        return edges + 1
+
+    def _connect_components(self, edges, position):
+        """
+        若拓扑不连通，按连通分量的顺序将每个分量连接到前一个分量中距离最近的服务器，返回需要补充的边（下标从0开始）
+        """
+        n = self.server_number
+        graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+        component_number, labels = connected_components(graph, directed=False)
+        extra = []
+        for c in range(1, component_number):
+            members = np.nonzero(labels == c)[0]
+            previous = np.nonzero(labels < c)[0]
+            distance, index = cKDTree(position[previous]).query(position[members])
+            i = np.argmin(distance)
+            extra.append([members[i], previous[index[i]]])
+        return np.array(extra, dtype=int).reshape(-1, 2)
+
+    def _normalize_edges(self, edges):
+        """去掉自环和重复边，统一为server_1小于server_2的(E,2)整型数组"""
+        edges = np.sort(np.asarray(edges, dtype=int).reshape(-1, 2), axis=1)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        return np.unique(edges, axis=0)
+
     def generate_microservice(self):
         """
         生成微服务，微服务属性有微服务id，所包含的层，占用的cpu算力，微服务名称
-        目前的配置是只生成一个layer，后续可以扩展
+        image_type为single时每个微服务只有一个独有的layer，为shared时在独有的layer之下还有共享的基础镜像层和运行时层，见generate_image_library
         "microservice": [ # 层单位GB
         {"id": 1, "layers": {"layer1":0.3}, "cpu": 5, "name": "microservice_1"},
+        {"id": 2, "layers": {"base_1":0.08, "runtime_3":0.35, "layer2":0.4}, "cpu": 3, "name": "microservice_2"},
         """
+        if self.image_type not in ["single", "shared"]:
+            raise ValueError("Image type error!")
+        if self.image_type == "shared":
+            runtimes, runtime_popularity = self.generate_image_library()
         microservice = []
         for i in range(self.microservice_number):
             microservice_dict = {}
             microservice_dict["id"] = i + 1
             layer_str = "layer" + str(i + 1)
             microservice_dict["layers"] = {layer_str: random.randint(1, 10) / 5}
+            if self.image_type == "shared":
+                # 基础镜像层和运行时层在下，独有的层在上，共享层使用numpy的随机数，与single时的其余配置相同
+                runtime = runtimes[self.rng.choice(len(runtimes), p=runtime_popularity)]
+                microservice_dict["layers"] = {**runtime, **microservice_dict["layers"]}
             microservice_dict["cpu"] = random.randint(1, 10)
             microservice_dict["name"] = "microservice_" + str(i + 1)
             microservice.append(microservice_dict)
         return microservice
 
+    def generate_image_library(self):
+        """
+        生成共享的镜像层：base_number个基础镜像层（操作系统），runtime_number个运行时层（语言运行时、框架），每个运行时构建在一个基础镜像之上，
+        基础镜像和运行时的流行度都服从幂律分布，第r个的概率与1/r^alpha成正比，返回每个运行时包含的层{层名称:大小}和运行时的流行度
+        image_params: base_number（默认5），runtime_number（默认10），alpha（默认1.2），base_size、runtime_size为大小的范围(GB)
+        """
+        base_number = self.image_params.get("base_number", 5)
+        runtime_number = self.image_params.get("runtime_number", 10)
+        alpha = self.image_params.get("alpha", 1.2)
+        base_size = self.image_params.get("base_size", (0.03, 0.3))
+        runtime_size = self.image_params.get("runtime_size", (0.1, 0.8))
+
+        def power_law(number):
+            weight = 1 / np.arange(1, number + 1) ** alpha
+            return weight / weight.sum()
+
+        base_sizes = np.round(self.rng.uniform(*base_size, size=base_number), 2)
+        runtime_sizes = np.round(self.rng.uniform(*runtime_size, size=runtime_number), 2)
+        runtime_base = self.rng.choice(base_number, size=runtime_number, p=power_law(base_number))
+        runtimes = []
+        for r in range(runtime_number):
+            base = runtime_base[r]
+            runtimes.append({"base_" + str(base + 1): float(base_sizes[base]), "runtime_" + str(r + 1): float(runtime_sizes[r])})
+        return runtimes, power_law(runtime_number)
+
     def generate_application(self):
         """生成应用程序，属性包括id，名称，包含的微服务id列表，消息列表，源消息数据"""
         application = []
@@ -333,11 +512,15 @@ def get_config(
     microservice_number: int = 30,
     start_mode: str = "running",
     end_time: int = 40,
+    topology_type: str = "random",
+    topology_params: dict = None,
+    image_type: str = "single",
+    image_params: dict = None,
 ):
     """
     生成配置文件
     """
-    config_f = ConfigGenerate(seed, device_number, server_number, application_number, microservice_number, start_mode, end_time)
+    config_f = ConfigGenerate(seed, device_number, server_number, application_number, microservice_number, start_mode, end_time, topology_type, topology_params, image_type, image_params)
     return config_f.generate()
 
 
@@ -2,7 +2,12 @@
 import time
 import csv
 import os
+import bisect
+import pickle
+from collections.abc import Mapping
+import numpy as np
 import pandas as pd
+from storage.metrics_writer import split_evaluate
 
 class Database:
     """
@@ -15,6 +20,9 @@ class Database:
         # 该部分存储静态数据
         self.static_data = {}
 
+        # 拓扑发生变化的时刻，升序排列，用于查找某一时刻生效的跳数表和时延表
+        self.topo_times = []
+
     def add(self, t:int, type:str, key, value):
         """
         type: state, action, evaluate,data存储数据格式为:data = {state:{}, action:{}, evaluate:{}}
@@ -41,38 +49,154 @@ class Database:
     def add_static_data(self, key, value):
         self.static_data[key] = value
 
+    def add_topo_data(self, t:int, topo_data:dict):
+        """
+        记录从t时刻开始生效的拓扑数据，key为topo_hop、topo_latency、topo_bandwidth，只在拓扑发生变化的时刻存储
+        """
+        if "topo_history" not in self.static_data:
+            self.static_data["topo_history"] = {}
+        self.static_data["topo_history"][t] = topo_data
+        if t not in self.topo_times:
+            bisect.insort(self.topo_times, t)
+
+    def add_topo_hop(self, t:int, hop_matrix):
+        """
+        记录从t时刻开始生效的服务器跳数表
+        """
+        self.add_topo_data(t, {"topo_hop": hop_matrix})
+
+    def get_topo_data(self, key:str, t:int = None):
+        """
+        获取t时刻生效的拓扑数据，t为None时返回最近一次拓扑变化后的数据，t之前拓扑没有变化时返回初始拓扑的数据
+        """
+        if not self.topo_times:
+            return self.static_data[key]
+        if t is None:
+            idx = len(self.topo_times) - 1
+        else:
+            idx = bisect.bisect_right(self.topo_times, t) - 1
+        # 从后向前查找最近一次记录了该数据的拓扑变化
+        while idx >= 0:
+            topo_data = self.static_data["topo_history"][self.topo_times[idx]]
+            if key in topo_data:
+                return topo_data[key]
+            idx -= 1
+        return self.static_data[key]
+
+    def get_topo_hop(self, t:int = None):
+        """
+        获取t时刻生效的服务器跳数表
+        """
+        return self.get_topo_data("topo_hop", t)
+
+    def get_topo_latency(self, t:int = None):
+        """
+        获取t时刻生效的服务器最短路时延表
+        """
+        return self.get_topo_data("topo_latency", t)
+
+    def get_topo_bandwidth(self, t:int = None):
+        """
+        获取t时刻生效的服务器最短路瓶颈带宽表
+        """
+        return self.get_topo_data("topo_bandwidth", t)
+
+    def get_topo_distance(self, distance:str = "hop", t:int = None):
+        """
+        按照距离度量获取t时刻生效的距离矩阵，distance为hop（跳数）或latency（时延）
+        """
+        if distance == "hop":
+            return self.get_topo_hop(t)
+        elif distance == "latency":
+            return self.get_topo_latency(t)
+        raise ValueError("distance must be 'hop' or 'latency'")
+
+    def get_migration_cost_table(self):
+        """
+        获取编译后的迁移成本表，环境在add_db_fixed时创建，没有时根据静态数据中的migration_cost列表创建
+        """
+        if "migration_cost_table" not in self.static_data:
+            self.static_data["migration_cost_table"] = MigrationCostTable(self.static_data["migration_cost"])
+        return self.static_data["migration_cost_table"]
+
+    def derive_server_deployment(self, deployment_rows):
+        """
+        由(设备id, 应用id, 微服务id, 服务器id)推导服务器上部署的微服务id元组，供不存储该状态的子类使用，
+        与Server.get_deployed_ms_ids相同，元组内的顺序可能不同
+        """
+        server_deployment = {server_id: {} for server_id in self.static_data["server_library"]}
+        for device_id, app_id, ms_id, server_id in deployment_rows:
+            server_deployment[server_id].setdefault(device_id, {}).setdefault(app_id, []).append(ms_id)
+        return {server_id: {device_id: {app_id: tuple(ms_ids) for app_id, ms_ids in app_dict.items()} for device_id, app_dict in device_dict.items()}
+                for server_id, device_dict in server_deployment.items()}
+
+    def derive_server_layers(self, deployment_rows):
+        """由(设备id, 应用id, 微服务id, 服务器id)推导服务器上每个镜像层被多少个微服务使用，与Server.deployed_layers相同"""
+        microservice_library:dict = self.static_data["microservice_library"]
+        server_layers = {server_id: {} for server_id in self.static_data["server_library"]}
+        for _, _, ms_id, server_id in deployment_rows:
+            layers = server_layers[server_id]
+            for layer_name in microservice_library[ms_id].layers:
+                layers[layer_name] = layers.get(layer_name, 0) + 1
+        return server_layers
+
     def get_state(self, t:int):
         return self.data[t]["state"]
     
     def get_action(self, t:int):
         return self.data[t]["action"]
     
-    def save_to_csv(self, name = "data"):
-        self.data_fix()
-
+    def save_to_csv(self, name = "data", scalar_only:bool = True):
+        """
+        每个时刻一行保存为csv，返回文件路径：
+        scalar_only为True时只保存evaluate中的标量指标，运行过程中逐时刻保存可以使用storage.metrics_writer.MetricsWriter，
+        为False时与原有的格式相同，保存所有的state、action和evaluate，列为(类型, 键)的两层表头
+        """
         timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
         name_with_timestamp = name + "_" + timestamp + ".csv"
         parent_dir = os.getcwd() + "/output/"
-        
-        df = pd.DataFrame(columns=['time', 'level_2_key', 'level_3_key', 'value'])
+
         rows = []
-        for level_1_key, level_2_dict in self.data.items():
-            for level_2_key, level_3_dict in level_2_dict.items():
-                for level_3_key, value in level_3_dict.items():
-                    rows.append({'time': level_1_key,
-                                    'level_2_key': level_2_key,
-                                    'level_3_key': level_3_key,
-                                    'value': value})
-        df = pd.concat([df, pd.DataFrame(rows)])
+        times = sorted(self.data.keys())
+        for t in times:
+            if scalar_only:
+                scalar, _ = split_evaluate(self.data[t].get("evaluate", {}))
+                rows.append({"time": t, **scalar})
+            else:
+                rows.append({(type, key): value for type, values in self.data[t].items() for key, value in values.items()})
+        if scalar_only:
+            df = pd.DataFrame(rows)
+        else:
+            df = pd.DataFrame(rows, index=times)
+            df = df[sorted(df.columns)]
+            df.columns = pd.MultiIndex.from_tuples(df.columns)
+            df.insert(0, "time", times)
+        df.to_csv(parent_dir+name_with_timestamp, index=False)
+        return parent_dir+name_with_timestamp
 
-        # 按照time和level_2_key+level_3_key创建透视表
-        df_pivoted = df.pivot_table(index='time', columns=['level_2_key', 'level_3_key'], values='value',aggfunc='sum')
+    def save_to_pickle(self, name = "run"):
+        """
+        将整个数据库（包括静态数据）保存为pickle文件，用于运行结束后的离线重新评估，返回文件路径
+        """
+        timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+        path = os.getcwd() + "/output/" + name + "_" + timestamp + ".pkl"
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+        return path
 
-        # 添加时间戳列到透视表
-        df_pivoted.insert(0, 'time', df_pivoted.index)
+    def save_to_parquet(self, name = "run", format = "parquet"):
+        """
+        将运行数据导出为带类型和压缩的列式文件，format为parquet或arrow，返回导出的目录，用storage.run_export.RunData读取
+        """
+        # pyarrow只在导出时需要
+        from storage.run_export import save_run
+        return save_run(self, name, format)
 
-        # 将透视表写入csv文件
-        df_pivoted.to_csv(parent_dir+name_with_timestamp, index=False)
+    @staticmethod
+    def load_from_pickle(path:str):
+        """读取save_to_pickle保存的数据库"""
+        with open(path, "rb") as f:
+            return pickle.load(f)
 
     def reset(self):
         self.data = {}
@@ -80,20 +204,86 @@ class Database:
     def reset_complete(self):
         self.data = {}
         self.static_data = {}
+        self.topo_times = []
+
+class LazyState(Mapping):
+    """
+    某一时刻的状态字典，供Database的子类使用，由子类存储的键在读取时通过database.restore_state还原，其余的键直接存放
+    """
+    def __init__(self, database:Database, t:int):
+        self.database = database
+        self.t = t
+        self.values = {}
+        # 键的写入顺序，值为True时由database还原
+        self.key_restored = {}
+
+    def __getitem__(self, key):
+        if key not in self.key_restored:
+            raise KeyError(key)
+        if self.key_restored[key]:
+            return self.database.restore_state(self.t, key)
+        return self.values[key]
 
-    def data_fix(self):
+    def __setitem__(self, key, value):
+        self.database.add(t = self.t, type = "state", key = key, value = value)
+
+    def __contains__(self, key):
+        return key in self.key_restored
+
+    def __iter__(self):
+        return iter(self.key_restored)
+
+    def __len__(self):
+        return len(self.key_restored)
+
+class MigrationCostTable:
+    """
+    迁移成本表，将配置文件中的migration_cost列表编译为(微服务id, 目标服务器id)的稠密矩阵，
+    与源服务器有关的迁移成本（从服务器a迁移到服务器b）稀疏存储，存在时覆盖稠密矩阵中的成本
+    矩阵直接用id作为下标，第0行对应算法中的虚拟源微服务，迁移成本为0，没有配置的位置为nan
+    """
+    def __init__(self, migration_cost:list, origin_cost:list = None, microservice_ids:list = None, server_ids:list = None):
+        origin_cost = origin_cost if origin_cost is not None else []
+        ms_max = max([one["microservice_id"] for one in migration_cost + origin_cost] + list(microservice_ids or []) + [0])
+        server_max = max([one["server_id"] for one in migration_cost + origin_cost] + [one["from_server_id"] for one in origin_cost] + list(server_ids or []) + [0])
+        self.server_max = server_max
+        self.matrix = np.full((ms_max+1, server_max+1), np.nan)
+        self.matrix[0] = 0
+        # 与原有的线性查找一致，同一位置出现多次时使用第一个
+        for one in reversed(migration_cost):
+            self.matrix[one["microservice_id"], one["server_id"]] = one["cost"]
+        self.matrix.setflags(write=False)
+
+        # 与源服务器有关的成本，按照 (微服务id, 源服务器id, 目标服务器id) 编码为升序的整数键
+        keys = np.array([self._encode(one["microservice_id"], one["from_server_id"], one["server_id"]) for one in origin_cost], dtype=np.int64)
+        costs = np.array([one["cost"] for one in origin_cost], dtype=float)
+        keys, index = np.unique(keys, return_index=True)
+        self.origin_keys = keys
+        self.origin_costs = costs[index]
+
+    def _encode(self, microservice_id, from_server_id, server_id):
+        return (np.asarray(microservice_id, dtype=np.int64) * (self.server_max+1) + from_server_id) * (self.server_max+1) + server_id
+
+    def cost(self, microservice_id, server_id, from_server_id = None):
+        """
+        微服务迁移到服务器的成本，参数可以是标量也可以是等长的数组，给出源服务器时优先使用与源服务器有关的成本
         """
-        数据保存的时候server_microservice_deployment会有问题，返回的是一个dict_keys对象，需要转换成list
+        cost = self.matrix[microservice_id, server_id]
+        if from_server_id is None or len(self.origin_keys) == 0:
+            return cost
+        keys = self._encode(microservice_id, from_server_id, server_id)
+        index = np.minimum(np.searchsorted(self.origin_keys, keys), len(self.origin_keys)-1)
+        found = self.origin_keys[index] == keys
+        return np.where(found, self.origin_costs[index], cost)
+
+    def cost_matrix(self, microservice_id:int, server_ids:list):
+        """
+        给定微服务在server_ids之间迁移的成本矩阵，行为源服务器，列为目标服务器
         """
-        for data in self.data.values():
-            for key, value in data.items():
-                if key == "state":
-                    if "server_microservice_deployment" in value.keys():
-                        for value1 in value["server_microservice_deployment"].values():
-                            for value2 in value1.values():
-                                for key3 in value2.keys():
-                                    value2[key3] = list(value2[key3].keys())
-        
+        server_ids = np.asarray(server_ids)
+        from_server_id, server_id = np.meshgrid(server_ids, server_ids, indexing="ij")
+        return self.cost(np.full(from_server_id.shape, microservice_id), server_id, from_server_id)
+
 if __name__ == "__main__":
     DB = Database()
     DB.add(1, "state", "a", 1)
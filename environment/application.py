@@ -1,11 +1,14 @@
 # 应用程序和微服务基类
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt 
 
 class Microservice:
     """
-    微服务类
+    微服务类，作为微服务库和应用模板中的微服务，设备请求的应用中使用MicroserviceInstance
     """
+    __slots__ = ("layers", "cpu", "id", "name", "next_ms", "previous_ms", "subordinate_app", "subordinate_device", "_deployed_server")
+
     def __init__(self, id:int, layers:dict, cpu:float, name:str = None):
         self.layers = layers #传入的layer是个字典，包括名称和大小
         self.cpu = cpu
@@ -30,6 +33,8 @@ class Message:
     """
     消息类，用于传递数据
     """
+    __slots__ = ("data", "sender", "receiver")
+
     def __init__(self, data:float, sender:int, receiver:int, frequency:int = 1):
         self.data = data * frequency
         self.sender = sender
@@ -47,6 +52,12 @@ class Application:
         self.app_id = app_id
         self.subordinate_device = None
         self.source_message = None
+        # 预编译的消息边，添加微服务或消息后失效，在get_edges中重新编译
+        self._edges = None
+        self._message_data = None
+        self._edge_paths = None
+        # 微服务id在应用中的下标，与ApplicationInstance中部署服务器表的下标一致
+        self._ms_index = None
 
     def reset(self):
         pass
@@ -95,6 +106,8 @@ class Application:
             raise ValueError("Microservice id already in application!")
         self.microservice_library[ms.id] = ms
         self.length += 1
+        self._edges = None
+        self._ms_index = None
         ms.subordinate_app = self.app_id
 
     def add_microservices(self, ms_list:list):
@@ -132,18 +145,69 @@ class Application:
         """
         通过消息获取数据
         """
-        id_keys = [0] + list(self.microservice_library.keys())
-        if sender not in id_keys or receiver not in id_keys:
+        if (sender != 0 and sender not in self.microservice_library) or (receiver != 0 and receiver not in self.microservice_library):
             raise ValueError("microservice id not in application!")
         
         if sender == 0 and receiver == self.find_head():
             return self.source_message["data"]
         
-        message:Message
-        for message in self.message:
-            if message.sender == sender and message.receiver == receiver:
-                return message.data
-        return 0
+        self.get_edges()
+        return self._message_data.get((sender, receiver), 0)
+
+    def get_edges(self):
+        """
+        获取预编译的消息边，返回微服务id列表和三个等长数组：发送方下标、接收方下标、数据量，下标为微服务在id列表中的位置
+        """
+        if self._edges is None:
+            ms_ids = list(self.microservice_library.keys())
+            ms_index = {ms_id: index for index, ms_id in enumerate(ms_ids)}
+            sender = np.array([ms_index[message.sender] for message in self.message], dtype=int)
+            receiver = np.array([ms_index[message.receiver] for message in self.message], dtype=int)
+            data = np.array([message.data for message in self.message], dtype=float)
+            self._edges = (ms_ids, sender, receiver, data)
+            # 同一对微服务有多条消息时与原有的查找一致，使用第一条
+            self._message_data = {}
+            for message in self.message:
+                self._message_data.setdefault((message.sender, message.receiver), message.data)
+            self._edge_paths = self._compile_edge_paths(ms_ids, sender, receiver)
+        return self._edges
+
+    def get_edge_paths(self):
+        """
+        每条消息边的发送方从头节点出发的路径数，顺序与get_edges相同，
+        通讯开销沿头节点出发的每条路径累计，汇聚节点之后的消息按路径数重复计算，头节点不可达的消息不计算
+        """
+        self.get_edges()
+        return self._edge_paths
+
+    def _compile_edge_paths(self, ms_ids:list, sender:np.ndarray, receiver:np.ndarray):
+        """按拓扑序传播从头节点出发的路径数"""
+        paths = np.zeros(len(ms_ids))
+        if len(ms_ids) == 0:
+            return paths[sender]
+        paths[ms_ids.index(self.find_head())] = 1
+        in_degree = np.bincount(receiver, minlength=len(ms_ids))
+        queue = list(np.flatnonzero(in_degree == 0))
+        while queue:
+            index = queue.pop()
+            for edge in np.flatnonzero(sender == index):
+                paths[receiver[edge]] += paths[index]
+                in_degree[receiver[edge]] -= 1
+                if in_degree[receiver[edge]] == 0:
+                    queue.append(receiver[edge])
+        return paths[sender]
+
+    def get_ms_index(self):
+        """微服务id -> 在微服务库中的下标"""
+        if self._ms_index is None:
+            self._ms_index = {ms_id: index for index, ms_id in enumerate(self.microservice_library.keys())}
+        return self._ms_index
+
+    def instantiate(self):
+        """
+        创建设备请求的应用实例，实例共享该应用作为模板，创建实例后不应再修改模板
+        """
+        return ApplicationInstance(self)
 
     def add_message(self, message:Message):
         """
@@ -151,6 +215,7 @@ class Application:
         """
         if message.sender in self.microservice_library.keys() and message.receiver in self.microservice_library.keys():
             self.message.append(message)
+            self._edges = None
             self.microservice_library[message.sender].next_ms.append(message.receiver)
             self.microservice_library[message.receiver].previous_ms.append(message.sender)
         else:
@@ -205,6 +270,140 @@ class Application:
         nx.draw(G, pos, with_labels=True)
         plt.show()
         
+class MicroserviceInstance:
+    """
+    设备请求的应用中的微服务，属性来自应用模板中的微服务，部署的服务器存放在应用实例的部署服务器表中
+    """
+    __slots__ = ("app", "index", "template")
+
+    def __init__(self, app:"ApplicationInstance", index:int, template:Microservice):
+        self.app = app
+        self.index = index
+        self.template = template
+
+    @property
+    def id(self):
+        return self.template.id
+
+    @property
+    def layers(self):
+        return self.template.layers
+
+    @property
+    def cpu(self):
+        return self.template.cpu
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def next_ms(self):
+        return self.template.next_ms
+
+    @property
+    def previous_ms(self):
+        return self.template.previous_ms
+
+    @property
+    def subordinate_app(self):
+        return self.app.app_id
+
+    @property
+    def subordinate_device(self):
+        return self.app.subordinate_device
+
+    def set_deployed_server_from_id(self, server_id = None):
+        self.app.deployed_server[self.index] = server_id
+
+    def get_deployed_server_id(self):
+        return self.app.deployed_server[self.index]
+
+    def reset(self):
+        pass
+
+class ApplicationInstance:
+    """
+    设备请求的应用，微服务、消息和预编译的消息边都共享应用模板，
+    每个实例只保存所属设备和每个微服务部署的服务器，不再对每个设备深拷贝整个应用
+    """
+    __slots__ = ("template", "subordinate_device", "deployed_server", "_microservice_library")
+
+    def __init__(self, template:Application):
+        self.template = template
+        self.subordinate_device = None
+        # 与模板微服务库顺序相同的部署服务器id，未部署为None
+        self.deployed_server = [None] * template.length
+        self._microservice_library = None
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def app_id(self):
+        return self.template.app_id
+
+    @property
+    def message(self):
+        return self.template.message
+
+    @property
+    def length(self):
+        return self.template.length
+
+    @property
+    def source_message(self):
+        return self.template.source_message
+
+    @property
+    def microservice_library(self):
+        """微服务id -> MicroserviceInstance，第一次使用时创建"""
+        if self._microservice_library is None:
+            self._microservice_library = {ms_id: MicroserviceInstance(self, index, ms)
+                                          for index, (ms_id, ms) in enumerate(self.template.microservice_library.items())}
+        return self._microservice_library
+
+    def reset(self):
+        pass
+
+    def find_head(self):
+        return self.template.find_head()
+
+    def check_deployment(self):
+        """检查应用程序的部署情况"""
+        return all(server_id is not None for server_id in self.deployed_server)
+
+    def get_microservice_from_id(self, id:int):
+        return self.get_ms_from_id(id)
+
+    def set_subordinate_device(self, device_id:int):
+        """设置应用程序和微服务所属设备"""
+        self.subordinate_device = device_id
+
+    def get_ms_from_id(self, id:int):
+        if id not in self.template.microservice_library:
+            raise ValueError("No such microservice in application!")
+        return self.microservice_library[id]
+
+    def ms_id_in_app(self, id:int):
+        return id in self.template.microservice_library
+
+    def get_data_from_message(self, sender:int, receiver:int):
+        return self.template.get_data_from_message(sender, receiver)
+
+    def get_edges(self):
+        return self.template.get_edges()
+
+    def get_edge_paths(self):
+        return self.template.get_edge_paths()
+
+    def draw_the_app(self):
+        self.template.draw_the_app()
+
+    def draw_the_app_with_data(self):
+        self.template.draw_the_app_with_data()
+
 def create_test_app():
     test_ms_1 = Microservice(id = 1, layers = {"layer1": 1}, cpu = 1)
     test_ms_2 = Microservice(id = 2, layers = {"layer2": 1}, cpu = 0.4)
@@ -1,9 +1,13 @@
 # 基础环境包括参数的基本定义，和强化学习环境差不多
 from environment.application import Application, Microservice, Message
 from environment.hardware import Server, Device
+from environment.layer_registry import LayerRegistry
 from database import Database
 import copy
 import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path, dijkstra
 import matplotlib.pyplot as plt
 import random
 
@@ -47,6 +51,12 @@ class Production_hardware:
         self.device_number = 0
 
         self.G = nx.Graph()
+        # 所有服务器两两之间的跳数、时延和瓶颈带宽，行列下标为服务器id-1，在add_topo时一次性计算
+        self.hop_matrix = None
+        self.latency_matrix = None
+        self.bandwidth_matrix = None
+        # 为True时每次链路变化后检查增量更新的距离矩阵与完全重建的结果一致，用于调试
+        self.topo_check = False
         self.db = database
 
     def add_db_hardware(self):
@@ -56,6 +66,9 @@ class Production_hardware:
         self.db.add_static_data(key = "server_number", value = self.server_number)
         self.db.add_static_data(key = "device_number", value = self.device_number)
         self.db.add_static_data(key = "topo", value = self.G)
+        self.db.add_static_data(key = "topo_hop", value = self.hop_matrix)
+        self.db.add_static_data(key = "topo_latency", value = self.latency_matrix)
+        self.db.add_static_data(key = "topo_bandwidth", value = self.bandwidth_matrix)
 
     # 根据配置文件进行环境创建
 
@@ -94,24 +107,133 @@ class Production_hardware:
             raise Exception("Device id not found")
 
     # 网络拓扑模块
-    def add_topo(self, config:list):
+    def add_topo(self, config):
         """根据配置文件添加网络拓扑"""
         self.topo_add_node()
         self.topo_add_edge(config)
+        self.topo_build_distance_matrix()
 
     def topo_add_node(self):
         """添加节点"""
         for key in self.server_library:
             self.G.add_node(key)
 
-    def topo_add_edge(self, config:list):
-        """添加边"""
+    def topo_add_edge(self, config):
+        """
+        添加边，边上可以带有可选的latency（链路时延，单位ms，默认为1）和bandwidth（链路带宽，单位Gbps，默认不受限）
+        所有链路时延都为1时，时延矩阵与跳数矩阵相同
+        config也可以是拓扑生成器直接给出的(E,2)边数组，元素为服务器id，此时所有链路使用默认属性
+        """
+        if isinstance(config, np.ndarray):
+            self.G.add_edges_from(config.tolist(), latency = 1, bandwidth = np.inf)
+            return
         for edge in config:
-            self.G.add_edge(edge["server_1"], edge["server_2"])
+            self._topo_add_edge(edge["server_1"], edge["server_2"], edge.get("latency", 1), edge.get("bandwidth", np.inf))
+
+    def _topo_add_edge(self, server_id_1:int, server_id_2:int, latency:float = 1, bandwidth:float = np.inf):
+        """添加一条带有时延和带宽属性的边"""
+        # csgraph中权重为0的边会被当成不存在，因此时延必须为正数
+        if latency <= 0:
+            raise ValueError("Link latency must be positive!")
+        if bandwidth <= 0:
+            raise ValueError("Link bandwidth must be positive!")
+        self.G.add_edge(server_id_1, server_id_2, latency = latency, bandwidth = bandwidth)
+
+    def topo_csgraph(self, weight:str = None):
+        """
+        将拓扑转换为csgraph使用的稀疏邻接矩阵，下标为服务器id-1，weight为None时每条边的权重为1
+        """
+        edges = list(self.G.edges(data = True))
+        rows = np.array([edge[0]-1 for edge in edges], dtype = int)
+        cols = np.array([edge[1]-1 for edge in edges], dtype = int)
+        if weight is None:
+            data = np.ones(len(edges))
+        else:
+            data = np.array([edge[2][weight] for edge in edges], dtype = float)
+        return csr_matrix((data, (rows, cols)), shape = (self.server_number, self.server_number))
+
+    def topo_link_bandwidth(self):
+        """链路带宽的稠密矩阵，没有直接链路的位置为0"""
+        link_bandwidth = np.zeros((self.server_number, self.server_number))
+        for server_id_1, server_id_2, bandwidth in self.G.edges(data = "bandwidth"):
+            link_bandwidth[server_id_1-1, server_id_2-1] = bandwidth
+            link_bandwidth[server_id_2-1, server_id_1-1] = bandwidth
+        return link_bandwidth
+
+    def topo_build_distance_matrix(self):
+        """
+        计算所有服务器两两之间的跳数、时延和瓶颈带宽，矩阵的行列下标为服务器id-1，不可达时跳数和时延为inf
+        环境、评估模块和求解算法都通过数据库中的topo_hop和topo_latency直接索引，不再重复进行图搜索
+        """
+        rows = np.arange(self.server_number)
+        self.hop_matrix = np.full((self.server_number, self.server_number), np.inf)
+        self.latency_matrix = np.full((self.server_number, self.server_number), np.inf)
+        self.bandwidth_matrix = np.zeros((self.server_number, self.server_number))
+        self._topo_update_rows(rows)
+
+    def _topo_update_rows(self, rows):
+        """
+        利用csgraph重新计算给定行（源服务器下标）的跳数、时延和瓶颈带宽，其余行保持不变
+        更新后的矩阵都是新的只读数组，之前记录到数据库中的矩阵不会被修改
+        """
+        hop_matrix = np.array(self.hop_matrix)
+        latency_matrix = np.array(self.latency_matrix)
+        bandwidth_matrix = np.array(self.bandwidth_matrix)
+        if len(rows) > 0:
+            hop_matrix[rows] = shortest_path(self.topo_csgraph(), method = "D", directed = False, unweighted = True, indices = rows)
+            latency, predecessors = dijkstra(self.topo_csgraph("latency"), directed = False, indices = rows, return_predecessors = True)
+            latency_matrix[rows] = latency
+            bandwidth_matrix[rows] = bottleneck_bandwidth(rows, predecessors, self.topo_link_bandwidth())
+        # 矩阵被多个模块共享，设置为只读避免被意外修改
+        for matrix in [hop_matrix, latency_matrix, bandwidth_matrix]:
+            matrix.setflags(write = False)
+        self.hop_matrix = hop_matrix
+        self.latency_matrix = latency_matrix
+        self.bandwidth_matrix = bandwidth_matrix
+
+    def topo_update_add_edge(self, server_id_1:int, server_id_2:int):
+        """
+        添加边之后增量更新距离矩阵，只重新计算经过新边后距离可能变短的行，调用前需要先在self.G中添加该边
+        """
+        i, j = server_id_1-1, server_id_2-1
+        latency = self.G.edges[server_id_1, server_id_2]["latency"]
+        # 到两个端点的距离相差不小于边权的源节点，其最短路才可能经过新边，
+        # 相差等于边权时距离不变，但最短路可能改为经过新边，瓶颈带宽需要与完全重建时选择的路径一致
+        with np.errstate(invalid = "ignore"):
+            hop_rows = np.abs(self.hop_matrix[:, i] - self.hop_matrix[:, j]) >= 1
+            latency_diff = np.abs(self.latency_matrix[:, i] - self.latency_matrix[:, j])
+            latency_rows = (latency_diff > latency) | np.isclose(latency_diff, latency)
+        self._topo_update_rows(np.nonzero(hop_rows | latency_rows)[0])
+
+    def topo_update_remove_edge(self, server_id_1:int, server_id_2:int, latency:float):
+        """
+        删除边之后增量更新距离矩阵，只重新计算最短路可能经过该边的行，调用前需要先从self.G中删除该边
+        """
+        i, j = server_id_1-1, server_id_2-1
+        # 到两个端点的距离恰好相差边权的源节点，其某条最短路才会经过被删除的边
+        with np.errstate(invalid = "ignore"):
+            hop_rows = np.abs(self.hop_matrix[:, i] - self.hop_matrix[:, j]) == 1
+            latency_rows = np.isclose(np.abs(self.latency_matrix[:, i] - self.latency_matrix[:, j]), latency)
+        self._topo_update_rows(np.nonzero(hop_rows | latency_rows)[0])
+
+    def topo_check_distance_matrix(self):
+        """检查增量更新的跳数、时延和瓶颈带宽矩阵与完全重建的结果一致，不一致时抛出异常"""
+        matrices = (self.hop_matrix, self.latency_matrix, self.bandwidth_matrix)
+        self.topo_build_distance_matrix()
+        for name, matrix, rebuilt in zip(["hop", "latency", "bandwidth"], matrices, (self.hop_matrix, self.latency_matrix, self.bandwidth_matrix)):
+            if not np.allclose(matrix, rebuilt, equal_nan = True):
+                raise ValueError("Incremental topo_{} differs from full rebuild!".format(name))
+        # 保留增量更新的矩阵对象，之前记录到数据库中的矩阵不受影响
+        self.hop_matrix, self.latency_matrix, self.bandwidth_matrix = matrices
+        return True
 
     def topo_get_hop(self, server_id_1:int, server_id_2:int):
         """获取两个服务器之间的跳数"""
-        return nx.shortest_path_length(self.G, source = server_id_1, target = server_id_2)
+        return self.hop_matrix[server_id_1-1, server_id_2-1]
+
+    def topo_get_latency(self, server_id_1:int, server_id_2:int):
+        """获取两个服务器之间的最短路时延"""
+        return self.latency_matrix[server_id_1-1, server_id_2-1]
     
     def show_hardware(self):
         """
@@ -149,6 +271,9 @@ class Production_software:
         self.microservice_number = 0
         self.application_number = 0
 
+        # 微服务库中所有镜像层的注册表，层名称驻留为整数id
+        self.layer_registry = LayerRegistry()
+
         self.db = database
 
     def add_db_software(self):
@@ -157,6 +282,7 @@ class Production_software:
         self.db.add_static_data(key = "application_library", value = self.application_library)
         self.db.add_static_data(key = "microservice_number", value = self.microservice_number)
         self.db.add_static_data(key = "application_number", value = self.application_number)
+        self.db.add_static_data(key = "layer_registry", value = self.layer_registry)
 
     # 根据配置文件设置生产环境参数
     def add_config_to_microservice_library(self, config:list):
@@ -166,6 +292,7 @@ class Production_software:
     def _add_config_to_microservice_library(self, id:int, config:dict):
         # config 包括 layers, cpu, name
         self.microservice_library[id] = Microservice(id = id, layers = config["layers"], cpu = config["cpu"], name = config["name"])
+        self.layer_registry.add_microservice(self.microservice_library[id])
         self.microservice_number += 1
 
     def add_config_to_application_library(self, config:list):
@@ -177,9 +304,12 @@ class Production_software:
         self.check_microservice_library(config["ms_id_list"])
         candidate_app = Application(name = config["name"], app_id = config["id"])
 
+        # 应用中的微服务有各自的前后继关系，其余属性与微服务库共享，不深拷贝镜像层字典
         ms_list = []
+        library_ms:Microservice
         for ms_id in config["ms_id_list"]:
-            ms_list.append(copy.deepcopy(self.microservice_library[ms_id]))
+            library_ms = self.microservice_library[ms_id]
+            ms_list.append(Microservice(id = ms_id, layers = library_ms.layers, cpu = library_ms.cpu, name = library_ms.name))
         candidate_app.add_microservices(ms_list)
 
         message_list = []
@@ -263,4 +393,28 @@ class base_Prodution(Production_software, Production_hardware):
         server:Server
         for server in self.server_library.values():
             print("Server {} deployed microservices:".format(server.id), server.deployed_ms_number)
-            server.show_deployed_ms()
\ No newline at end of file
+            server.show_deployed_ms()
+
+def bottleneck_bandwidth(rows, predecessors, link_bandwidth):
+    """
+    根据csgraph返回的前驱矩阵计算最短路上的瓶颈带宽（路径上各链路带宽的最小值）
+    rows为源服务器下标，predecessors的第r行对应源服务器rows[r]，自身到自身以及不可达时前驱为负数
+    使用倍增的方式沿前驱向源服务器跳跃，迭代次数为最短路最大边数的对数
+    """
+    rows = np.asarray(rows)
+    has_pred = predecessors >= 0
+    cols = np.broadcast_to(np.arange(predecessors.shape[1]), predecessors.shape)
+    # 没有前驱的位置指向自身，跳跃到这里后不再移动
+    ancestor = np.where(has_pred, predecessors, cols)
+    bandwidth = np.where(has_pred, link_bandwidth[ancestor, cols], np.inf)
+    row_index = np.arange(len(rows))[:, None]
+    while True:
+        next_ancestor = ancestor[row_index, ancestor]
+        if np.array_equal(next_ancestor, ancestor):
+            break
+        bandwidth = np.minimum(bandwidth, bandwidth[row_index, ancestor])
+        ancestor = next_ancestor
+    # 不可达的位置带宽为0
+    reachable = has_pred
+    reachable[np.arange(len(rows)), rows] = True
+    return np.where(reachable, bandwidth, 0)
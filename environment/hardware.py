@@ -1,5 +1,6 @@
 #服务器和生产设备基类
 from environment.application import Microservice, Application
+from environment.server_pool import ServerPool, from_units
 # from application import Microservice, Application
 class Server:
     def __init__(self, id:int, storage:float, computing:float, bandwidth:float):
@@ -12,22 +13,52 @@ class Server:
         # 服务器id
         self.id = id
 
-        self.left_storage = storage
-        self.left_computing = computing
+        # 服务器资源池和该服务器在资源池中的下标，设置后剩余资源和镜像层引用计数都保存在资源池中
+        self.pool = None
+        self.pool_index = None
+
+        self._left_storage = storage
+        self._left_computing = computing
+        self._deployed_layers = {}
 
-        self.deployed_layers = {}
         self.deployed_ms_library = {}
         self.deployed_ms_number = 0
 
         self.connected_devices_id = []
 
+    @property
+    def left_storage(self):
+        if self.pool is not None:
+            return float(from_units(self.pool.left_storage[self.pool_index]))
+        return self._left_storage
+
+    @property
+    def left_computing(self):
+        if self.pool is not None:
+            return float(from_units(self.pool.left_computing[self.pool_index]))
+        return self._left_computing
+
+    @property
+    def deployed_layers(self):
+        """已部署的镜像层，{layer_name:使用该层的微服务数量}"""
+        if self.pool is not None:
+            return self.pool.server_layers(self.pool_index)
+        return self._deployed_layers
+
     def reset(self):
-        self.left_storage = self.storage
-        self.left_computing = self.computing
-        self.deployed_layers = {}
+        self._left_storage = self.storage
+        self._left_computing = self.computing
+        self._deployed_layers = {}
         self.deployed_ms_library = {}
         self.connected_devices_id = []
         self.deployed_ms_number = 0
+        if self.pool is not None:
+            self.pool.reset_server(self.pool_index)
+
+    def attach_pool(self, pool:ServerPool, index:int):
+        """使用服务器资源池保存剩余资源和镜像层引用计数，需要在部署微服务之前设置"""
+        self.pool = pool
+        self.pool_index = index
 
     def add_device(self, device_id:int):
         self.connected_devices_id.append(device_id)
@@ -38,12 +69,10 @@ class Server:
     def feasibility_of_deploy(self, ms:Microservice):
         """判断是否可以部署微服务"""
         # 判断是否已经部署过该微服务
-        deployed_ms:Microservice
-        if ms.subordinate_device in self.deployed_ms_library.keys():
-            if ms.subordinate_app in self.deployed_ms_library[ms.subordinate_device].keys():
-                for deployed_ms in self.deployed_ms_library[ms.subordinate_device][ms.subordinate_app].values():
-                    if ms.id == deployed_ms.id:
-                        raise ValueError("Microservice m,k,i already deployed!")
+        if ms.id in self.deployed_ms_library.get(ms.subordinate_device, {}).get(ms.subordinate_app, {}):
+            raise ValueError("Microservice m,k,i already deployed!")
+        if self.pool is not None:
+            return self.pool.feasible_on(self.pool_index, *self.pool.microservice_demand(ms))
         # 判断是否有足够的存储空间
         occupy_storage = 0
         for key in ms.layers.keys():
@@ -68,16 +97,19 @@ class Server:
             elif ms.subordinate_app not in self.deployed_ms_library[ms.subordinate_device].keys():
                     self.deployed_ms_library[ms.subordinate_device][ms.subordinate_app] = {}
             self.deployed_ms_library[ms.subordinate_device][ms.subordinate_app][ms.id] = ms
-            # 对层去重
-            occupy_storage = 0
-            for key in ms.layers.keys():
-                if key not in self.deployed_layers.keys():
-                    self.deployed_layers[key] = 1
-                    occupy_storage += ms.layers[key]
-                else:
-                    self.deployed_layers[key] += 1
-            self.left_storage -= occupy_storage
-            self.left_computing -= ms.cpu
+            if self.pool is not None:
+                self.pool.deploy(self.pool_index, *self.pool.microservice_demand(ms))
+            else:
+                # 对层去重
+                occupy_storage = 0
+                for key in ms.layers.keys():
+                    if key not in self._deployed_layers.keys():
+                        self._deployed_layers[key] = 1
+                        occupy_storage += ms.layers[key]
+                    else:
+                        self._deployed_layers[key] += 1
+                self._left_storage -= occupy_storage
+                self._left_computing -= ms.cpu
             self.deployed_ms_number += 1
             ms.set_deployed_server_from_id(self.id)
             return True
@@ -86,12 +118,16 @@ class Server:
 
     def deploy_mss(self, mss:list):
         """部署微服务列表"""
-        ms_all = Microservice(-1, {}, 0)
         ms:Microservice
-        for ms in mss:
-            ms_all.layers.update(ms.layers)
-            ms_all.cpu += ms.cpu
-        if self.feasibility_of_deploy(ms_all):
+        if self.pool is not None:
+            feasible = self.pool.feasible_on(self.pool_index, *self.pool.combine([self.pool.microservice_demand(ms) for ms in mss]))
+        else:
+            ms_all = Microservice(-1, {}, 0)
+            for ms in mss:
+                ms_all.layers.update(ms.layers)
+                ms_all.cpu += ms.cpu
+            feasible = self.feasibility_of_deploy(ms_all)
+        if feasible:
             for ms in mss:
                 self.deploy_ms(ms)
         else:
@@ -107,15 +143,18 @@ class Server:
                     self.deployed_ms_library.pop(ms.subordinate_device)
         except:
             raise ValueError("Microservice not deployed!")
-        for key in ms.layers.keys():
-            if key in self.deployed_layers.keys():
-                self.deployed_layers[key] -= 1
-                if self.deployed_layers[key] == 0:
-                    self.deployed_layers.pop(key)
-                    self.left_storage += ms.layers[key]
-        # for value in ms.layers.values():
-        #     self.left_storage += value
-        self.left_computing += ms.cpu
+        if self.pool is not None:
+            self.pool.undeploy(self.pool_index, *self.pool.microservice_demand(ms))
+        else:
+            for key in ms.layers.keys():
+                if key in self._deployed_layers.keys():
+                    self._deployed_layers[key] -= 1
+                    if self._deployed_layers[key] == 0:
+                        self._deployed_layers.pop(key)
+                        self._left_storage += ms.layers[key]
+            # for value in ms.layers.values():
+            #     self.left_storage += value
+            self._left_computing += ms.cpu
         self.deployed_ms_number -= 1
         ms.set_deployed_server_from_id(None)
 
@@ -128,6 +167,10 @@ class Server:
                 return
         raise ValueError("No such microservice in server!")
 
+    def get_deployed_ms_ids(self):
+        """按照设备、应用分类的已部署微服务id元组，{device_id:{app_id:(ms_id,...)}}"""
+        return {device_id: {app_id: tuple(ms_dict) for app_id, ms_dict in app_dict.items()} for device_id, app_dict in self.deployed_ms_library.items()}
+
     def show_deployed_ms(self):
         """
         按照设备、应用的分类显示已部署的微服务
@@ -0,0 +1,143 @@
+# 边缘服务器上的镜像层缓存，卸载后没有微服务使用的层留在空闲存储中，再次部署时不需要重新拉取
+import numpy as np
+
+POLICIES = ["lru", "lfu", "size"]
+
+class LayerCache:
+    """
+    服务器资源池的镜像层缓存，服务器和层都使用资源池中的下标：
+    引用计数归零的层不立即删除，而是作为缓存继续占用服务器的剩余存储，每台服务器缓存的层总大小不超过capacity，
+    超过容量或者部署微服务时剩余存储不足，按照淘汰策略删除缓存的层：lru删除最久没有使用的层，lfu删除使用次数最少的层，size删除最大的层
+    """
+    def __init__(self, pool, policy:str = "lru", capacity:float = 0.25):
+        """capacity为每台服务器缓存容量占服务器存储的比例"""
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of {}".format(POLICIES))
+        self.pool = pool
+        self.policy = policy
+        self.capacity = np.floor(pool.storage * capacity).astype(np.int64)
+        self.cached = np.zeros((pool.N, pool.L), dtype=bool)
+        self.cached_size = np.zeros(pool.N, dtype=np.int64)
+        # 淘汰策略使用的最近一次使用时刻（按部署操作计数）和使用次数
+        self.clock = 0
+        self.last_used = np.zeros((pool.N, pool.L), dtype=np.int64)
+        self.frequency = np.zeros((pool.N, pool.L), dtype=np.int64)
+        # 由预取放入、还没有被部署使用的层，是cached的子集
+        self.prefetched = np.zeros((pool.N, pool.L), dtype=bool)
+        # 每台服务器因部署拉取的层大小，预取用来计算剩余的空闲带宽，由预取模块清零
+        self.pulled = np.zeros(pool.N, dtype=np.int64)
+        self.stats = self._new_stats()
+
+    def _new_stats(self):
+        return {"hit": 0, "miss": 0, "eviction": 0, "hit_size": 0, "miss_size": 0, "evicted_size": 0,
+                "prefetch_hit": 0, "prefetch_hit_size": 0}
+
+    def pop_stats(self):
+        """返回上一次调用以来的命中、未命中和淘汰统计，大小为资源池的整数单位"""
+        stats = self.stats
+        self.stats = self._new_stats()
+        return stats
+
+    def reset_server(self, n:int):
+        self.cached[n] = False
+        self.cached_size[n] = 0
+        self.last_used[n] = 0
+        self.frequency[n] = 0
+        self.prefetched[n] = False
+        self.pulled[n] = 0
+
+    # ------------------------可行性------------------------
+
+    def reclaimable(self, layers:np.ndarray):
+        """部署需要这些层时每台服务器可以通过淘汰缓存释放的存储，需求中命中缓存的层不会被淘汰，长度N"""
+        return self.cached_size - self.cached[:, layers] @ self.pool.layer_sizes[layers]
+
+    def reclaimable_on(self, n:int, layers:np.ndarray):
+        return self.cached_size[n] - self.pool.layer_sizes[layers][self.cached[n, layers]].sum()
+
+    # ------------------------部署、卸载------------------------
+
+    def take(self, n:int, layers:np.ndarray):
+        """
+        部署前调用，需求中缓存的层命中并移出缓存（仍然占用存储），没有微服务使用也不在缓存中的层未命中，需要拉取
+        """
+        sizes = self.pool.layer_sizes[layers]
+        hit = self.cached[n, layers]
+        miss = (self.pool.layer_count[n, layers] == 0) & ~hit
+        self.stats["hit"] += int(hit.sum())
+        self.stats["hit_size"] += int(sizes[hit].sum())
+        self.stats["miss"] += int(miss.sum())
+        self.stats["miss_size"] += int(sizes[miss].sum())
+        prefetch_hit = self.prefetched[n, layers]
+        self.stats["prefetch_hit"] += int(prefetch_hit.sum())
+        self.stats["prefetch_hit_size"] += int(sizes[prefetch_hit].sum())
+        self.pulled[n] += sizes[miss].sum()
+        self.cached[n, layers[hit]] = False
+        self.prefetched[n, layers] = False
+        self.cached_size[n] -= sizes[hit].sum()
+        self.clock += 1
+        self.last_used[n, layers] = self.clock
+        self.frequency[n, layers] += 1
+
+    def put(self, n:int, layers:np.ndarray):
+        """卸载后引用计数归零的层放入缓存，超过缓存容量时淘汰"""
+        self.cached[n, layers] = True
+        self.cached_size[n] += self.pool.layer_sizes[layers].sum()
+        while self.cached_size[n] > self.capacity[n]:
+            self._evict_one(n)
+
+    def evict(self, n:int, storage:int):
+        """淘汰缓存的层，直到服务器n的剩余存储不少于storage或者缓存为空"""
+        while self.pool.left_storage[n] < storage and self.cached_size[n] > 0:
+            self._evict_one(n)
+
+    def prefetch(self, n:int, layers:np.ndarray, limit:int):
+        """
+        把服务器n上没有的层按顺序预取到缓存中，总大小不超过limit，只使用剩余存储和缓存容量，
+        空间不足时只淘汰不是预取放入的缓存层，放不下的层跳过，返回放入的层id数组
+        """
+        taken = []
+        for layer_id in layers[self.pool.absent()[n, layers]]:
+            size = self.pool.layer_sizes[layer_id]
+            if size > limit or self.pool.layer_sizes[self.prefetched[n]].sum() + size > self.capacity[n]:
+                continue
+            evictable = self.cached[n] & ~self.prefetched[n]
+            while (self.cached_size[n] + size > self.capacity[n] or self.pool.left_storage[n] < size) and evictable.any():
+                self._evict_one(n, evictable)
+                evictable = self.cached[n] & ~self.prefetched[n]
+            if self.cached_size[n] + size > self.capacity[n] or self.pool.left_storage[n] < size:
+                continue
+            self.cached[n, layer_id] = True
+            self.prefetched[n, layer_id] = True
+            self.cached_size[n] += size
+            self.pool.left_storage[n] -= size
+            self.clock += 1
+            self.last_used[n, layer_id] = self.clock
+            limit -= size
+            taken.append(layer_id)
+        return np.array(taken, dtype=np.intp)
+
+    def _evict_one(self, n:int, mask:np.ndarray = None):
+        candidates = np.flatnonzero(self.cached[n] if mask is None else mask)
+        if self.policy == "lru":
+            victim = candidates[np.argmin(self.last_used[n, candidates])]
+        elif self.policy == "lfu":
+            # 使用次数相同时淘汰最久没有使用的层
+            victim = candidates[np.lexsort((self.last_used[n, candidates], self.frequency[n, candidates]))[0]]
+        else:
+            victim = candidates[np.argmax(self.pool.layer_sizes[candidates])]
+        size = self.pool.layer_sizes[victim]
+        self.cached[n, victim] = False
+        self.prefetched[n, victim] = False
+        self.cached_size[n] -= size
+        self.pool.left_storage[n] += size
+        self.stats["eviction"] += 1
+        self.stats["evicted_size"] += int(size)
+
+    def cached_layers(self, n:int):
+        """服务器n上缓存的层名称"""
+        return [self.pool.registry.names[layer_id] for layer_id in np.flatnonzero(self.cached[n])]
+
+    def prefetched_layers(self, n:int):
+        """服务器n上预取且还没有被使用的层名称"""
+        return [self.pool.registry.names[layer_id] for layer_id in np.flatnonzero(self.prefetched[n])]
@@ -0,0 +1,86 @@
+# 基于设备移动预测的镜像层预取，利用服务器空闲的带宽和存储提前拉取设备正在运行的微服务的镜像层
+import numpy as np
+from environment.server_pool import ServerPool, to_units
+from environment.layer_cache import LayerCache
+
+class LayerPrefetcher:
+    """
+    从数据库的移动历史中学习每个设备在服务器之间的转移次数，预测设备下一步连接的服务器，
+    把设备正在运行的微服务的镜像层预取到这些服务器的镜像层缓存中，服务器都使用资源池中的下标：
+    设备在当前服务器上有转移记录时使用设备自己的统计，否则使用所有设备的统计，
+    取概率最大的top_k个且概率不低于min_probability的服务器，每台服务器每个时刻预取的拉取时间不超过pull_budget，
+    其中已经扣除了这一时刻部署拉取层占用的时间
+    """
+    def __init__(self, pool:ServerPool, bandwidth, top_k:int = 1, min_probability:float = 0.3, pull_budget:float = 20.0):
+        if pool.cache is None:
+            raise ValueError("Layer prefetch needs a layer cache!")
+        self.pool = pool
+        self.cache:LayerCache = pool.cache
+        self.top_k = top_k
+        self.min_probability = min_probability
+        # 每台服务器每个时刻可以用于拉取的层大小（整数单位）
+        self.budget = np.atleast_1d(to_units(np.asarray(bandwidth, dtype=float) * pull_budget, exact = False))
+        # 设备id -> {当前服务器: {下一服务器: 次数}}，以及所有设备合计的(N, N)转移次数
+        self.device_transition = {}
+        self.transition = np.zeros((pool.N, pool.N), dtype=np.int64)
+        # 已经学习过的最后时刻，避免重复统计
+        self.observed_time = None
+
+    def reset(self):
+        """环境重置时调用，转移统计保留，多次运行可以继续学习"""
+        self.observed_time = None
+
+    # ------------------------学习、预测------------------------
+
+    def observe(self, database, t:int, server_index:dict):
+        """
+        学习t时刻的设备移动，movement只在point规则下记录，这里用相邻时刻的device_connect_to_server得到每次移动的起止服务器，
+        server_index为服务器id -> 资源池下标
+        """
+        if self.observed_time is not None and t <= self.observed_time:
+            return
+        self.observed_time = t
+        if t-1 not in database.data:
+            return
+        last_connect = database.get_state(t-1)["device_connect_to_server"]
+        for device_id, server_id in database.get_state(t)["device_connect_to_server"].items():
+            last_server_id = last_connect.get(device_id)
+            if last_server_id is None or last_server_id == server_id:
+                continue
+            origin, dest = server_index[last_server_id], server_index[server_id]
+            counts = self.device_transition.setdefault(device_id, {}).setdefault(origin, {})
+            counts[dest] = counts.get(dest, 0) + 1
+            self.transition[origin, dest] += 1
+
+    def predict(self, device_id:int, n:int):
+        """连接在服务器n上的设备下一步可能连接的服务器，[(服务器下标, 概率)]，按概率从大到小排列"""
+        counts = self.device_transition.get(device_id, {}).get(n)
+        if counts:
+            servers = np.array(list(counts.keys()), dtype=np.intp)
+            count = np.array(list(counts.values()), dtype=float)
+        else:
+            servers = np.flatnonzero(self.transition[n])
+            count = self.transition[n, servers].astype(float)
+        if len(servers) == 0:
+            return []
+        probability = count / count.sum()
+        order = np.argsort(-probability, kind="stable")[:self.top_k]
+        return [(int(servers[i]), float(probability[i])) for i in order if probability[i] >= self.min_probability]
+
+    # ------------------------预取------------------------
+
+    def prefetch(self, candidates:list):
+        """
+        candidates为[(概率, 服务器下标, 层id数组)]，按概率从大到小预取，返回每台服务器预取的层id数组{服务器下标: 层id数组}
+        """
+        budget = np.maximum(self.budget - self.cache.pulled, 0)
+        self.cache.pulled[:] = 0
+        prefetched = {}
+        for _, n, layers in sorted(candidates, key=lambda candidate: -candidate[0]):
+            if budget[n] <= 0:
+                continue
+            taken = self.cache.prefetch(n, layers, budget[n])
+            if len(taken) > 0:
+                budget[n] -= self.pool.layer_sizes[taken].sum()
+                prefetched[n] = np.concatenate([prefetched.get(n, np.zeros(0, dtype=np.intp)), taken])
+        return prefetched
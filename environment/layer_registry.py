@@ -0,0 +1,81 @@
+# 镜像层注册表，把层名称驻留为整数id，层的存在和引用计数都可以用数组表示
+import numpy as np
+
+class LayerRegistry:
+    """
+    层名称 -> 层id（从0开始连续编号），sizes为按层id索引的层大小，
+    微服务的镜像层按微服务id缓存为层id数组，拉取量等计算都变成数组上的掩码点积
+    """
+    def __init__(self):
+        self.layer_ids = {}
+        self.names = []
+        # 层大小的缓冲区，容量不足时翻倍，注册L个层的总开销为O(L)，sizes为前L个元素的视图
+        self._sizes = np.zeros(16)
+        # 微服务id -> 层id数组
+        self.ms_layers = {}
+
+    @classmethod
+    def from_sizes(cls, sizes):
+        """只有层大小的注册表，层名称即为层下标，用于以矩阵表示层的算法"""
+        registry = cls()
+        for index, size in enumerate(np.atleast_1d(sizes)):
+            registry.intern(index, size)
+        return registry
+
+    @property
+    def L(self):
+        return len(self.names)
+
+    @property
+    def sizes(self):
+        return self._sizes[:len(self.names)]
+
+    def intern(self, name, size:float):
+        """注册镜像层，返回层id，同名的层只注册一次"""
+        layer_id = self.layer_ids.get(name)
+        if layer_id is None:
+            layer_id = len(self.names)
+            if layer_id == len(self._sizes):
+                self._sizes = np.concatenate([self._sizes, np.zeros(len(self._sizes))])
+            self._sizes[layer_id] = size
+            self.layer_ids[name] = layer_id
+            self.names.append(name)
+        elif self._sizes[layer_id] != size:
+            raise ValueError("Layer {} registered with different sizes!".format(name))
+        return layer_id
+
+    def add_microservice(self, ms):
+        """注册微服务的所有镜像层，并缓存微服务的层id数组"""
+        self.ms_layers[ms.id] = np.array([self.intern(name, size) for name, size in ms.layers.items()], dtype=np.intp)
+        return self.ms_layers[ms.id]
+
+    def get_ids(self, layers):
+        """层名称的集合（或{名称:大小}） -> 层id数组，未注册的层被忽略"""
+        return np.array([self.layer_ids[name] for name in layers if name in self.layer_ids], dtype=np.intp)
+
+    def microservice_layers(self, ms_id:int):
+        return self.ms_layers[ms_id]
+
+    def presence(self, layers):
+        """层名称的集合 -> 长度L的布尔数组"""
+        has_layer = np.zeros(self.L, dtype=bool)
+        has_layer[self.get_ids(layers)] = True
+        return has_layer
+
+    def presence_matrix(self, server_layers:dict, rows:int):
+        """{server_id:{layer_name:count}} -> (rows, L)的布尔矩阵，行下标为服务器id"""
+        has_layer = np.zeros((rows, self.L), dtype=bool)
+        for server_id, layers in server_layers.items():
+            has_layer[server_id, self.get_ids(layers)] = True
+        return has_layer
+
+    def pull_size(self, layer_ids:np.ndarray, has_layer:np.ndarray):
+        """
+        部署层id为layer_ids的微服务需要拉取的层大小，has_layer为一台服务器的长度L数组时返回标量，
+        为(N, L)矩阵时一次返回所有服务器的长度N数组
+        """
+        return (~has_layer[..., layer_ids]) @ self.sizes[layer_ids]
+
+    def layer_dict(self, count:np.ndarray):
+        """一台服务器的层引用计数数组 -> {layer_name:count}，只包含计数不为0的层"""
+        return {self.names[layer_id]: int(count[layer_id]) for layer_id in np.flatnonzero(count)}
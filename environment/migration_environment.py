@@ -1,7 +1,10 @@
 from environment.application import Application, Microservice
 from environment.hardware import Server
+from environment.server_pool import ServerPool, from_units
+from environment.layer_cache import LayerCache
+from environment.layer_prefetch import LayerPrefetcher
 from environment.moveable_device import Moveable_device, Production_hardware_with_moveable_device
-from database import Database
+from database import Database, MigrationCostTable
 from environment.base_environment import Running_time, Production_software
 from algorithm.main_algorithm import Algorithm
 import copy
@@ -14,6 +17,10 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         self.running_time = Running_time(start_time, end_time)
         self.db = database
         self.config = None
+        # 服务器资源池，在创建环境时由create_server_pool建立
+        self.server_pool = None
+        # 可选的镜像层预取，由create_layer_prefetcher建立
+        self.layer_prefetcher = None
         self.algorithm = Algorithm(database=self.db, algorithm_type=algorithm_type)
         Production_hardware_with_moveable_device.__init__(self, running_time = self.running_time, database=self.db)
         Production_software.__init__(self,database=self.db)
@@ -57,24 +64,43 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
             microservice_deployment[device_id] = device_deployment
         self.db.add(t = self.running_time.current_time, type = "state", key = "microservice_deployment", value = microservice_deployment)
 
-        # 不同时刻各个服务器上部署的微服务情况和层、空间情况
+        # 不同时刻各个服务器上部署的微服务情况和层、空间情况，部署的微服务只记录id元组，不复制微服务对象
         server_microservice_deployment = {}
         server_deployed_layers = {}
         server_left_storage = {}
         server_left_computing = {}
         for server_id in self.server_library:
             server:Server = self.server_library[server_id]
-            server_microservice_deployment[server_id] = copy.deepcopy(server.deployed_ms_library)
-            server_deployed_layers[server_id] = copy.deepcopy(server.deployed_layers)
-            server_left_storage[server_id] = copy.deepcopy(server.left_storage)
-            server_left_computing[server_id] = copy.deepcopy(server.left_computing)
+            server_microservice_deployment[server_id] = server.get_deployed_ms_ids()
+            server_deployed_layers[server_id] = dict(server.deployed_layers)
+            server_left_storage[server_id] = server.left_storage
+            server_left_computing[server_id] = server.left_computing
         self.db.add(t = self.running_time.current_time, type = "state", key = "server_microservice_deployment", value = server_microservice_deployment)
         self.db.add(t = self.running_time.current_time, type = "state", key = "server_deployed_layers", value = server_deployed_layers)
         self.db.add(t = self.running_time.current_time, type = "state", key = "server_left_storage", value = server_left_storage)
         self.db.add(t = self.running_time.current_time, type = "state", key = "server_left_computing", value = server_left_computing)
 
+        # 启用镜像层缓存时记录每个服务器缓存的层，以及这一时刻的缓存命中、未命中和淘汰统计
+        if self.server_pool is not None and self.server_pool.cache is not None:
+            cache:LayerCache = self.server_pool.cache
+            server_cached_layers = {}
+            for server_id in self.server_library:
+                server_cached_layers[server_id] = cache.cached_layers(self.server_library[server_id].pool_index)
+            self.db.add(t = self.running_time.current_time, type = "state", key = "server_cached_layers", value = server_cached_layers)
+            for key, value in cache.pop_stats().items():
+                value = float(from_units(value)) if key.endswith("_size") else value
+                self.db.add(t = self.running_time.current_time, type = "evaluate", key = "layer_cache_" + key, value = value)
+            server_prefetched_layers = {}
+            for server_id in self.server_library:
+                server_prefetched_layers[server_id] = cache.prefetched_layers(self.server_library[server_id].pool_index)
+            self.db.add(t = self.running_time.current_time, type = "state", key = "server_prefetched_layers", value = server_prefetched_layers)
+
     def add_db_fixed(self):
         self.db.add_static_data(key = "migration_cost", value = self.config["migration_cost"])
+        # 迁移成本编译为稠密矩阵，migration_cost_origin为可选的与源服务器有关的迁移成本
+        migration_cost_table = MigrationCostTable(self.config["migration_cost"], self.config.get("migration_cost_origin", []),
+                                                  [one["id"] for one in self.config["microservice"]], [one["id"] for one in self.config["server"]])
+        self.db.add_static_data(key = "migration_cost_table", value = migration_cost_table)
         self.add_db_hardware()
         self.add_db_software()
 
@@ -217,11 +243,13 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
                 for ms in app.microservice_library.values():
                     if ms.get_deployed_server_id() == None:
                         deploy_flag = False
+                        # 一次得到所有服务器能否部署，再按打乱的顺序选择第一个可以部署的服务器
+                        feasible = self.server_pool.feasible(*self.server_pool.microservice_demand(ms))
                         server_shuffle = list(self.server_library.values())
                         random.shuffle(server_shuffle)
                         # for server in self.server_library.values():
                         for server in server_shuffle:
-                            if server.deploy_ms(ms):
+                            if feasible[server.pool_index] and server.deploy_ms(ms):
                                 deploy_flag = True
                                 break
                         if not deploy_flag:
@@ -263,6 +291,12 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         else:
             raise ValueError("Movement type error!")
         
+    def topo_change_from_config(self, topo_change:dict):
+        """
+        根据topo_change,添加或删除服务器之间的链路
+        """
+        self.change_topo_with_point(topo_change, output = not self.no_output)
+
     def request_from_config(self, request:dict):
         """
         根据request,请求应用
@@ -281,7 +315,8 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         device_request_apps_last = device.get_request_app_ids()
         for app_id in application_id:
             if app_id not in device_request_apps_last:
-                app = copy.deepcopy(self.application_library[app_id])
+                # 设备请求的应用共享应用库中的模板，只创建保存部署情况的应用实例
+                app = self.application_library[app_id].instantiate()
                 device.request_app(app)
         for app_id in device_request_apps_last:
             if app_id not in application_id:
@@ -310,6 +345,34 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
                     raise ValueError("Application {}  in device {} not deployed!".format(app.app_id, device.id))
         return True
 
+    def prefetch_layers(self):
+        """
+        根据移动历史预测每个设备下一步连接的服务器，把设备正在运行的微服务的镜像层预取到这些服务器上，
+        记录这一时刻每个服务器预取的层
+        """
+        server_index = {server_id: server.pool_index for server_id, server in self.server_library.items()}
+        server_ids = {index: server_id for server_id, index in server_index.items()}
+        self.layer_prefetcher.observe(self.db, self.running_time.current_time, server_index)
+        candidates = []
+        device:Moveable_device
+        app:Application
+        for device_id, device in self.device_library.items():
+            predicted = self.layer_prefetcher.predict(device_id, server_index[device.connected_server_id])
+            if len(predicted) == 0:
+                continue
+            for app in device.request_app_library.values():
+                for microservice in app.microservice_library.values():
+                    if microservice.get_deployed_server_id() is None:
+                        continue
+                    layers, _ = self.server_pool.microservice_demand(microservice)
+                    for n, probability in predicted:
+                        candidates.append((probability, n, layers))
+        prefetched = self.layer_prefetcher.prefetch(candidates)
+        layer_prefetch = {}
+        for n, layers in prefetched.items():
+            layer_prefetch[server_ids[n]] = [self.layer_registry.names[layer_id] for layer_id in layers]
+        self.db.add(t = self.running_time.current_time, type = "state", key = "layer_prefetch", value = layer_prefetch)
+
     # ------------------------对外可以调用的函数模块------------------------
 
     # ------------------------生产环境创建---------------------
@@ -324,10 +387,46 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         # 先添加微服务再添加应用，这个顺序不能变
         self.add_config_to_microservice_library(config["microservice"])
         self.add_config_to_application_library(config["application"])
+        self.create_server_pool()
+        # 可选的镜像层缓存，例如"layer_cache": {"policy": "lru", "capacity": 0.25}
+        if config.get("layer_cache") is not None:
+            self.create_layer_cache(**config["layer_cache"])
+        # 可选的镜像层预取，例如"layer_prefetch": {"top_k": 1, "min_probability": 0.3, "pull_budget": 20.0}
+        if config.get("layer_prefetch") is not None:
+            self.create_layer_prefetcher(**config["layer_prefetch"])
         self.config = config
 
         self.add_db_fixed()
 
+    def create_server_pool(self):
+        """
+        由服务器库和镜像层注册表创建服务器资源池，资源池中的下标为服务器id-1，层下标为注册表中的层id
+        """
+        server_ids = sorted(self.server_library.keys())
+        self.server_pool = ServerPool(storage = [self.server_library[server_id].storage for server_id in server_ids],
+                                      computing = [self.server_library[server_id].computing for server_id in server_ids],
+                                      registry = self.layer_registry)
+        for index, server_id in enumerate(server_ids):
+            self.server_library[server_id].attach_pool(self.server_pool, index)
+
+    def create_layer_cache(self, policy:str = "lru", capacity:float = 0.25):
+        """
+        在服务器资源池上启用镜像层缓存，卸载后没有微服务使用的层留在服务器上，policy为lru、lfu或size，
+        capacity为每台服务器缓存容量占存储的比例，需要在部署之前调用
+        """
+        self.server_pool.attach_cache(LayerCache(self.server_pool, policy = policy, capacity = capacity))
+
+    def create_layer_prefetcher(self, top_k:int = 1, min_probability:float = 0.3, pull_budget:float = 20.0):
+        """
+        启用基于设备移动预测的镜像层预取，预取的层放在镜像层缓存中，没有启用缓存时使用默认参数启用，
+        pull_budget为每台服务器每个时刻可以用于预取的拉取时间，需要在部署之前调用
+        """
+        if self.server_pool.cache is None:
+            self.create_layer_cache()
+        server_ids = sorted(self.server_library.keys())
+        self.layer_prefetcher = LayerPrefetcher(self.server_pool, [self.server_library[server_id].bandwidth for server_id in server_ids],
+                                                top_k = top_k, min_probability = min_probability, pull_budget = pull_budget)
+
     # ------------------------生产环境预部署---------------------
 
     def deploy_start(self, config):
@@ -378,6 +477,9 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
 
         # 软件不需要进行重置，本身就是从软件库中取出的
 
+        if self.layer_prefetcher is not None:
+            self.layer_prefetcher.reset()
+
         # 时间重置
         self.running_time.reset_time()
 
@@ -391,6 +493,8 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         # 下一步测试算法能否使用，进一步看一下实时的数据统计是不是对的
         self.deploy(action)
         self.check_deployment()
+        if self.layer_prefetcher is not None:
+            self.prefetch_layers()
         
         self.add_db_dynamic_after_action()
 
@@ -407,6 +511,7 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         获取当前的状态,并更新时间，若更新时间成功，返回True
         可以认为该模块是强化学习中的get observation
         """
+        self.topo_change_from_config(self.config.get("topo_change", {}))
         self.move_device_from_config(self.config["movement"])
         self.request_from_config(self.config["request"])
         # 某些数据统计以这个为分界线
@@ -440,10 +545,12 @@ class Prodution(Production_software, Production_hardware_with_moveable_device):
         movement = {"type":"point","point":{appointed_time_slot:self.config["movement"]["point"][appointed_time_slot]}}
         return movement
 
-    def get_state_with_input(self, movement, request):
+    def get_state_with_input(self, movement, request, topo_change:dict = None):
         """
         根据外部输入进行系统参数的变化
         """
+        if topo_change is not None:
+            self.topo_change_from_config(topo_change)
         self.move_device_from_config(movement)
         self.request_from_config(request)
         # 某些数据统计以这个为分界线
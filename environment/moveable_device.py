@@ -3,6 +3,7 @@ from environment.hardware import Server, Device
 from database import Database
 from environment.base_environment import Running_time, Production_hardware
 import random, copy
+import numpy as np
 
 class Moveable_device(Device):
     """
@@ -35,7 +36,7 @@ class Production_hardware_with_moveable_device(Production_hardware):
         server_connect_to_device = {}
         for server_id in self.server_library:
             server:Server = self.server_library[server_id]
-            server_connect_to_device[server_id] = server.connected_devices_id
+            server_connect_to_device[server_id] = list(server.connected_devices_id)
         self.db.add(t = self.running_time.current_time, type = "state", key = "server_connect_to_device", value = server_connect_to_device)
 
     def add_config_to_device_library(self, config:list):
@@ -94,7 +95,9 @@ class Production_hardware_with_moveable_device(Production_hardware):
         # 更新设备的连接时间
         device.connected_time = self.running_time.current_time
         if output:
-            print("Move device %d from server %d to server %d at time %d" % (device_id, ori_server_id, server_id, self.running_time.current_time))
+            # 设备的微服务仍在原服务器附近，输出移动后到原服务器的最短路时延
+            print("Move device %d from server %d to server %d at time %d, latency to server %d: %.1f" % (device_id, ori_server_id, server_id, self.running_time.current_time,
+                                                                                                      ori_server_id, self.get_device_server_latency(device_id, ori_server_id)))
         return True
 
     # ------------------------不同的设备移动规则------------------------
@@ -121,7 +124,7 @@ class Production_hardware_with_moveable_device(Production_hardware):
         time_interval:[3,6,2,4,6], server_id:[1,2,3,4,5]，表示在第3个时间间隔后移动到服务器1，再过6个时间间隔后移动到服务器2，以此类推
         """
         for device_id in path:
-            current_server_id = self.device_library[device_id].connected_server
+            current_server_id = self.device_library[device_id].connected_server_id
             try:
                 current_server_id_index = path[device_id]["server_id"].index(current_server_id)
             except ValueError:
@@ -149,13 +152,80 @@ class Production_hardware_with_moveable_device(Production_hardware):
                 time_rule.remove(movement)
         self.db.add(t= self.running_time.current_time, type="state", key="movement", value=time_rule)
 
+    # ------------------------网络拓扑的动态变化------------------------
+
+    def add_link(self, server_id_1:int, server_id_2:int, latency:float = 1, bandwidth:float = np.inf, output:bool = True):
+        """
+        在当前时刻添加服务器之间的链路（链路修复），距离矩阵增量更新并记录到数据库
+        """
+        self.find_server_from_id(server_id_1)
+        self.find_server_from_id(server_id_2)
+        if server_id_1 == server_id_2:
+            raise ValueError("Link must connect two different servers!")
+        if self.G.has_edge(server_id_1, server_id_2):
+            if output:
+                print("Link %d-%d already exists!" % (server_id_1, server_id_2))
+            return False
+        self._topo_add_edge(server_id_1, server_id_2, latency, bandwidth)
+        self.topo_update_add_edge(server_id_1, server_id_2)
+        self.add_db_topo_change({"server_1": server_id_1, "server_2": server_id_2, "type": "add", "latency": latency, "bandwidth": bandwidth})
+        if output:
+            print("Add link %d-%d at time %d" % (server_id_1, server_id_2, self.running_time.current_time))
+        return True
+
+    def remove_link(self, server_id_1:int, server_id_2:int, output:bool = True):
+        """
+        在当前时刻删除服务器之间的链路（链路故障），距离矩阵增量更新并记录到数据库
+        """
+        if not self.G.has_edge(server_id_1, server_id_2):
+            if output:
+                print("Link %d-%d does not exist!" % (server_id_1, server_id_2))
+            return False
+        latency = self.G.edges[server_id_1, server_id_2]["latency"]
+        self.G.remove_edge(server_id_1, server_id_2)
+        self.topo_update_remove_edge(server_id_1, server_id_2, latency)
+        self.add_db_topo_change({"server_1": server_id_1, "server_2": server_id_2, "type": "remove"})
+        if output:
+            print("Remove link %d-%d at time %d" % (server_id_1, server_id_2, self.running_time.current_time))
+            if np.isinf(self.hop_matrix).any():
+                print("Warning: topology is disconnected after removing link %d-%d!" % (server_id_1, server_id_2))
+        return True
+
+    def change_topo_with_point(self, rule:dict, output:bool = True):
+        """
+        给定时刻的链路变化，最上层是一个time为key的字典，每个字典内都是一个list，
+        list内的每个元素都是一个字典，包含server_1、server_2和type（add或remove），添加链路时可以带有latency和bandwidth
+        """
+        if self.running_time.current_time not in rule.keys():
+            return
+        for change in rule[self.running_time.current_time]:
+            if change["type"] == "add":
+                self.add_link(change["server_1"], change["server_2"], change.get("latency", 1), change.get("bandwidth", np.inf), output = output)
+            elif change["type"] == "remove":
+                self.remove_link(change["server_1"], change["server_2"], output = output)
+            else:
+                raise ValueError("Topology change type error!")
+
+    def add_db_topo_change(self, change:dict):
+        """
+        记录当前时刻的链路变化和变化后生效的距离矩阵，评估模块和求解算法据此使用t时刻的拓扑
+        """
+        current_time = self.running_time.current_time
+        topo_change = []
+        if current_time in self.db.data and "state" in self.db.data[current_time]:
+            topo_change = self.db.data[current_time]["state"].get("topo_change", [])
+        self.db.add(t = current_time, type = "state", key = "topo_change", value = topo_change + [change])
+        if self.topo_check:
+            self.topo_check_distance_matrix()
+        self.db.add_topo_data(t = current_time, topo_data = {"topo_hop": self.hop_matrix, "topo_latency": self.latency_matrix, "topo_bandwidth": self.bandwidth_matrix})
+
     # ------------------------获取设备到服务器的跳数------------------------
 
     def get_device_server_hop(self, device_id:int, server_id:int):
         """
         获取设备和服务器之间的跳数
         """
-        device_server_id = self.device_library[device_id].connected_server
+        device_server_id = self.device_library[device_id].connected_server_id
         return self.topo_get_hop(device_server_id, server_id)
     
     def get_server_server_hop(self, server_id_1:int, server_id_2:int):
@@ -163,5 +233,12 @@ class Production_hardware_with_moveable_device(Production_hardware):
         获取服务器和服务器之间的跳数
         """
         return self.topo_get_hop(server_id_1, server_id_2)
+
+    def get_device_server_latency(self, device_id:int, server_id:int):
+        """
+        获取设备和服务器之间的最短路时延
+        """
+        device_server_id = self.device_library[device_id].connected_server_id
+        return self.topo_get_latency(device_server_id, server_id)
     
     # 还可以获取设备到服务器的通讯路径，可以自行实现
\ No newline at end of file
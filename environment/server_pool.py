@@ -0,0 +1,169 @@
+# 服务器资源池，剩余存储、剩余算力和镜像层都用数组保存，一次调用得到微服务在所有服务器上能否部署
+import warnings
+import numpy as np
+from environment.layer_registry import LayerRegistry
+
+# 容量以0.01为单位保存为整数，与原有round(x,2)的比较精度一致，比较时没有浮点误差
+CAPACITY_UNIT = 100
+# 转换时允许的舍入误差（原单位），超过时说明数值的精度高于0.01
+UNIT_TOLERANCE = 1e-6
+
+def to_units(value, exact:bool = True):
+    """
+    将存储、算力或层大小转换为整数单位，标量返回int，数组返回int64数组，
+    exact为True时数值舍入到0.01后变化超过UNIT_TOLERANCE会发出RuntimeWarning，只用作预算等允许舍入的数值时为False
+    """
+    value = np.asarray(value, dtype=float)
+    units = np.rint(value * CAPACITY_UNIT)
+    rounded = np.abs(units / CAPACITY_UNIT - value) > UNIT_TOLERANCE
+    if exact and np.any(rounded):
+        warnings.warn("{} rounded to multiples of {}!".format(value[rounded] if value.ndim else value, 1 / CAPACITY_UNIT), RuntimeWarning, stacklevel = 2)
+    units = units.astype(np.int64)
+    return int(units) if units.ndim == 0 else units
+
+def from_units(units):
+    return units / CAPACITY_UNIT
+
+class ServerPool:
+    """
+    N台服务器的资源池，服务器和镜像层都用下标表示：
+    left_storage、left_computing为长度N的剩余存储、剩余算力（整数单位），layer_count为(N, L)的镜像层引用计数矩阵，
+    层下标为registry中的层id，微服务的需求表示为(层id数组, 算力整数单位)，层id不重复，
+    整数单位为0.01（CAPACITY_UNIT），存储、算力和层大小的精度与原有round(x,2)的比较相同，更精细的数值在转换时舍入并发出警告
+    """
+    def __init__(self, storage, computing, registry:LayerRegistry):
+        self.storage = np.atleast_1d(to_units(storage))
+        self.computing = np.atleast_1d(to_units(computing))
+        self.registry = registry
+        self.layer_sizes = to_units(registry.sizes).reshape(-1)
+        self.left_storage = self.storage.copy()
+        self.left_computing = self.computing.copy()
+        self.layer_count = np.zeros((len(self.storage), len(self.layer_sizes)), dtype=np.int32)
+        # 微服务id -> 需求，同一id的微服务镜像层和算力相同
+        self.demand_cache = {}
+        # 可选的镜像层缓存，缓存的层占用剩余存储，部署时存储不足可以淘汰
+        self.cache = None
+
+    @property
+    def N(self):
+        return len(self.storage)
+
+    @property
+    def L(self):
+        return len(self.layer_sizes)
+
+    def attach_cache(self, cache):
+        self.cache = cache
+
+    def reset(self):
+        for n in range(self.N):
+            self.reset_server(n)
+
+    def reset_server(self, n:int):
+        self.left_storage[n] = self.storage[n]
+        self.left_computing[n] = self.computing[n]
+        self.layer_count[n] = 0
+        if self.cache is not None:
+            self.cache.reset_server(n)
+
+    def absent(self):
+        """(N, L)，服务器上既没有微服务使用也没有缓存的层"""
+        if self.cache is None:
+            return self.layer_count == 0
+        return (self.layer_count == 0) & ~self.cache.cached
+
+    # ------------------------需求------------------------
+
+    def demand(self, layers, cpu:float):
+        """层下标列表和算力 -> 需求"""
+        return np.unique(np.asarray(layers, dtype=np.intp)), to_units(cpu)
+
+    def microservice_demand(self, ms):
+        """以名称表示层的微服务 -> 需求，按微服务id缓存"""
+        demand = self.demand_cache.get(ms.id)
+        if demand is None:
+            demand = self.demand(self.registry.microservice_layers(ms.id), ms.cpu)
+            self.demand_cache[ms.id] = demand
+        return demand
+
+    def combine(self, demands:list):
+        """多个微服务部署在同一台服务器上的合并需求，共享的层只计算一次"""
+        if len(demands) == 0:
+            return np.zeros(0, dtype=np.intp), 0
+        return np.unique(np.concatenate([layers for layers, _ in demands])), sum(cpu for _, cpu in demands)
+
+    # ------------------------可行性------------------------
+
+    def new_storage(self, layers:np.ndarray):
+        """每台服务器部署这些层需要新占用的存储，长度N"""
+        return self.absent()[:, layers] @ self.layer_sizes[layers]
+
+    def available_storage(self, layers:np.ndarray):
+        """部署这些层时每台服务器可用的存储，包括可以淘汰的缓存，长度N"""
+        if self.cache is None:
+            return self.left_storage
+        return self.left_storage + self.cache.reclaimable(layers)
+
+    def feasible(self, layers:np.ndarray, cpu:int):
+        """需求在每台服务器上能否部署，长度N的布尔数组"""
+        return (self.new_storage(layers) <= self.available_storage(layers)) & (cpu <= self.left_computing)
+
+    def feasible_batch(self, demands:list):
+        """M个需求分别在每台服务器上能否部署，(M, N)的布尔矩阵"""
+        need = np.zeros((len(demands), self.L), dtype=np.int64)
+        cpu = np.zeros(len(demands), dtype=np.int64)
+        for index, (layers, one_cpu) in enumerate(demands):
+            need[index, layers] = self.layer_sizes[layers]
+            cpu[index] = one_cpu
+        new_storage = need @ self.absent().T
+        available_storage = self.left_storage
+        if self.cache is not None:
+            available_storage = self.left_storage + self.cache.cached_size - need @ self.cache.cached.T
+        return (new_storage <= available_storage) & (cpu[:, None] <= self.left_computing)
+
+    def _new_storage_on(self, n:int, layers:np.ndarray):
+        absent = self.layer_count[n, layers] == 0
+        if self.cache is not None:
+            absent &= ~self.cache.cached[n, layers]
+        return self.layer_sizes[layers][absent].sum()
+
+    def feasible_on(self, n:int, layers:np.ndarray, cpu:int):
+        """需求在服务器n上能否部署"""
+        available_storage = self.left_storage[n]
+        if self.cache is not None:
+            available_storage += self.cache.reclaimable_on(n, layers)
+        return bool(self._new_storage_on(n, layers) <= available_storage and cpu <= self.left_computing[n])
+
+    # ------------------------部署、卸载------------------------
+
+    def deploy(self, n:int, layers:np.ndarray, cpu:int):
+        """在服务器n上部署需求，不检查可行性，返回新占用的存储，有缓存时先使用缓存的层，存储不足时淘汰其他缓存的层"""
+        new_storage = self._new_storage_on(n, layers)
+        if self.cache is not None:
+            self.cache.take(n, layers)
+            self.cache.evict(n, new_storage)
+        self.layer_count[n, layers] += 1
+        self.left_storage[n] -= new_storage
+        self.left_computing[n] -= cpu
+        return new_storage
+
+    def undeploy(self, n:int, layers:np.ndarray, cpu:int):
+        """卸载服务器n上的需求，引用计数归零的层释放存储（有缓存时放入缓存，超过缓存容量的部分被淘汰），返回释放的存储"""
+        left_storage = self.left_storage[n]
+        self.layer_count[n, layers] -= 1
+        freed = layers[self.layer_count[n, layers] == 0]
+        self.left_computing[n] += cpu
+        if self.cache is not None:
+            self.cache.put(n, freed)
+        else:
+            self.left_storage[n] += self.layer_sizes[freed].sum()
+        return self.left_storage[n] - left_storage
+
+    def server_layers(self, n:int):
+        """服务器n上的镜像层，{layer_name:count}"""
+        return self.registry.layer_dict(self.layer_count[n])
+
+    def mark_layers(self, n:int, layers):
+        """标记服务器n上已经存在的层，不占用剩余存储，用于生成服务器初始就有的层"""
+        layers = np.asarray(layers, dtype=np.intp)
+        self.layer_count[n, layers] = np.maximum(self.layer_count[n, layers], 1)
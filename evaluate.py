@@ -1,8 +1,12 @@
+import numpy as np
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
 from database import Database
 from environment.moveable_device import Moveable_device
 from environment.application import Application,Microservice
 from environment.hardware import Server
-import networkx as nx
+from environment.layer_registry import LayerRegistry
 from environment.base_environment import Running_time
 
 class Evaluate():
@@ -10,8 +14,13 @@ class Evaluate():
     功能是评估迁移成本、镜像拉取成本和通讯开销，给出基础函数就可以
     整个评估函数里面没有考虑请求app情况的变化
     """
-    def __init__(self, database:Database):
+    def __init__(self, database:Database, distance:str = "hop"):
         self.database = database
+        # 通讯开销使用的距离度量，hop为跳数，latency为链路时延之和
+        self.distance = distance
+        self.layer_registry = None
+        # 已编译的服务器镜像层矩阵，time -> (server_deployed_layers, 矩阵)，只保留最近使用的时刻
+        self.compiled_layers = {}
 
     # ------------------------可以调用的评估函数------------------------
 
@@ -31,6 +40,14 @@ class Evaluate():
         """设备移动后、部署策略执行前的通讯成本"""
         return self.communication_cost_after_move(time)
     
+    def evaluate_layer_sharing(self, time:int):
+        """微服务共享镜像层节省的存储和镜像拉取时间"""
+        return self.layer_sharing(time)
+
+    def evaluate_layer_prefetch(self, time:int):
+        """镜像层预取拉取的层大小和减少的镜像拉取时间"""
+        return self.layer_prefetch(time)
+
     def evaluate_production(self, time:int, theta_1:float, theta_2:float, theta_3:float):
         """
         评估迁移、新服务下载、通讯差距
@@ -66,16 +83,14 @@ class Evaluate():
         if last_deploy_server_id == current_deploy_server_id:
             return 0
         else:
-            return self._get_microservice_migration_cost(microservice_id, current_deploy_server_id)
+            return self._get_microservice_migration_cost(microservice_id, current_deploy_server_id, last_deploy_server_id)
 
-    def _get_microservice_migration_cost(self, microservice_id:int, server_id:int):
+    def _get_microservice_migration_cost(self, microservice_id:int, server_id:int, from_server_id:int = None):
         """
         访问得到迁移成本，没有任何判断，不对外开放使用
         """
-        # 基础数据，迁移到服务器i的成本，微服务i的部署位置和上一时刻部署位置
-        for i in self.database.static_data["migration_cost"]:
-            if i["microservice_id"] == microservice_id and i["server_id"] == server_id:
-                return i["cost"]
+        # 基础数据，迁移到服务器i的成本，给出上一时刻部署位置时使用与源服务器有关的成本
+        return self.database.get_migration_cost_table().cost(microservice_id, server_id, from_server_id)
             
     def _get_microservice_deployment_server(self, time:int, device_id:int, application_id:int, microservice_id:int):
         """
@@ -117,19 +132,118 @@ class Evaluate():
         """
         获取镜像拉取成本
         """
-        last_layers:dict = self._get_server_layers(time-1, server_id)
-        microservice:Microservice = self.database.static_data["microservice_library"][microservice_id]
-        ms_layers = microservice.layers
-        pull_layer = 0
-        for layer_name, layer_size in ms_layers.items():
-            if layer_name in last_layers.keys():
-                pass
-            else:
-                pull_layer += layer_size
+        # t-1时刻服务器上已经存在的镜像层不需要拉取
+        registry = self.get_layer_registry()
+        has_layer = self.get_server_layer_array(time-1)[server_id]
+        pull_layer = registry.pull_size(registry.microservice_layers(microservice_id), has_layer)
         server:Server = self.database.static_data["server_library"][server_id]
         server_bandwidth = server.bandwidth
         return pull_layer/server_bandwidth
 
+    def get_layer_registry(self):
+        """镜像层注册表，数据库中没有时（旧的运行数据）由微服务库建立"""
+        if self.layer_registry is None:
+            self.layer_registry = self.database.static_data.get("layer_registry")
+        if self.layer_registry is None:
+            self.layer_registry = LayerRegistry()
+            microservice:Microservice
+            for microservice in self.database.static_data["microservice_library"].values():
+                self.layer_registry.add_microservice(microservice)
+        return self.layer_registry
+
+    def get_server_layer_array(self, time:int):
+        """time时刻每个服务器是否具有某一镜像层，列下标为层id，行下标为服务器id"""
+        if time not in self.database.data.keys():
+            raise ValueError("Time error!")
+        server_layers = self.database.data[time]["state"]["server_deployed_layers"]
+        if time in self.compiled_layers and self.compiled_layers[time][0] is server_layers:
+            return self.compiled_layers[time][1]
+        registry = self.get_layer_registry()
+        has_layer = registry.presence_matrix(server_layers, max(self.database.static_data["server_library"].keys())+1)
+        # 启用镜像层缓存时，服务器上缓存的层也不需要拉取
+        server_cached_layers = self.database.data[time]["state"].get("server_cached_layers", {})
+        for server_id, layers in server_cached_layers.items():
+            has_layer[server_id, registry.get_ids(layers)] = True
+        # 每一步评估只会用到t和t-1时刻，较早的编译结果直接丢弃
+        for t in [t for t in self.compiled_layers if t < time-1]:
+            self.compiled_layers.pop(t)
+        self.compiled_layers[time] = (server_layers, has_layer)
+        return has_layer
+
+    def get_image_pull_size(self, time:int, microservice_id:int):
+        """time时刻把微服务部署到每个服务器上需要拉取的镜像层大小，下标为服务器id"""
+        registry = self.get_layer_registry()
+        return registry.pull_size(registry.microservice_layers(microservice_id), self.get_server_layer_array(time-1))
+
+    def layer_sharing(self, time:int):
+        """
+        layer_storage为服务器上镜像层实际占用的存储，layer_storage_saved为同一服务器上多个微服务共享镜像层节省的存储，
+        image_pull_saved为迁移、部署到新服务器时，因为服务器上t-1时刻已有部分镜像层而少拉取的时间
+        """
+        registry = self.get_layer_registry()
+        layer_storage = 0
+        layer_storage_saved = 0
+        for layers in self.database.data[time]["state"]["server_deployed_layers"].values():
+            for layer_name, count in layers.items():
+                size = registry.sizes[registry.layer_ids[layer_name]]
+                layer_storage += size
+                layer_storage_saved += (count - 1) * size
+
+        image_pull_saved = 0
+        device_set:dict = self.database.static_data["device_library"]
+        server_set:dict = self.database.static_data["server_library"]
+        device:Moveable_device
+        for device_id, device in device_set.items():
+            for app_id, app in device.request_app_library.items():
+                for ms_id in app.microservice_library.keys():
+                    last_deploy_server_id = self._get_microservice_deployment_server(time-1, device_id, app_id, ms_id)
+                    current_deploy_server_id = self._get_microservice_deployment_server(time, device_id, app_id, ms_id)
+                    if last_deploy_server_id != current_deploy_server_id:
+                        full_size = registry.sizes[registry.microservice_layers(ms_id)].sum()
+                        pull_size = self.get_image_pull_size(time, ms_id)[current_deploy_server_id]
+                        image_pull_saved += (full_size - pull_size) / server_set[current_deploy_server_id].bandwidth
+
+        self.database.add(t = time, type= "evaluate", key = "layer_storage", value = layer_storage)
+        self.database.add(t = time, type= "evaluate", key = "layer_storage_saved", value = layer_storage_saved)
+        self.database.add(t = time, type= "evaluate", key = "image_pull_saved", value = image_pull_saved)
+        return {"layer_storage": layer_storage, "layer_storage_saved": layer_storage_saved, "image_pull_saved": image_pull_saved}
+
+    def layer_prefetch(self, time:int):
+        """
+        prefetch_size、prefetch_time为time时刻预取的层大小和利用空闲带宽拉取的时间，
+        prefetch_pull_saved为迁移、部署到新服务器时，因为t-1时刻预取了部分镜像层而少拉取的时间，同一服务器上的层只计算一次
+        """
+        registry = self.get_layer_registry()
+        server_set:dict = self.database.static_data["server_library"]
+        prefetch_size = 0
+        prefetch_time = 0
+        for server_id, layers in self.database.data[time]["state"].get("layer_prefetch", {}).items():
+            size = registry.sizes[registry.get_ids(layers)].sum()
+            prefetch_size += size
+            prefetch_time += size / server_set[server_id].bandwidth
+
+        # 每个服务器上新部署的微服务需要的层中，t-1时刻是预取得到的层
+        prefetched = registry.presence_matrix(self.database.data[time-1]["state"].get("server_prefetched_layers", {}), max(server_set.keys())+1)
+        used = np.zeros_like(prefetched)
+        device_set:dict = self.database.static_data["device_library"]
+        device:Moveable_device
+        for device_id, device in device_set.items():
+            for app_id, app in device.request_app_library.items():
+                for ms_id in app.microservice_library.keys():
+                    last_deploy_server_id = self._get_microservice_deployment_server(time-1, device_id, app_id, ms_id)
+                    current_deploy_server_id = self._get_microservice_deployment_server(time, device_id, app_id, ms_id)
+                    if last_deploy_server_id != current_deploy_server_id:
+                        used[current_deploy_server_id, registry.microservice_layers(ms_id)] = True
+        saved_size = (prefetched & used) @ registry.sizes
+        prefetch_pull_saved = 0
+        for server_id, server in server_set.items():
+            prefetch_pull_saved += saved_size[server_id] / server.bandwidth
+
+        self.database.add(t = time, type= "evaluate", key = "prefetch_size", value = prefetch_size)
+        self.database.add(t = time, type= "evaluate", key = "prefetch_time", value = prefetch_time)
+        self.database.add(t = time, type= "evaluate", key = "prefetch_pull_saved", value = prefetch_pull_saved)
+        return {"prefetch_size": prefetch_size, "prefetch_time": prefetch_time, "prefetch_pull_saved": prefetch_pull_saved}
+
     def _get_server_layers(self, time:int, server_id:int):
         """
         获取服务器上的镜像层
@@ -164,9 +278,9 @@ class Evaluate():
         device_server_id = self.database.data[time]["state"]["device_connect_to_server"][device_id]
         head_id = app.find_head()
         ms_deployed_server_id = self._get_microservice_deployment_server(time, device_id, application_id, head_id)
-        hop = self._get_hops_of_two_server(device_server_id, ms_deployed_server_id)
+        hop = self._get_hops_of_two_server(time, device_server_id, ms_deployed_server_id)
         # 这里为什么hop不加1，这是因为服务请求发送到服务器必然会存在一跳的开销，这个开销时无法避免的，当然也可以通过+1变成真实的开销
-        cost = hop * app.source_message["data"] + self._calculate_communication(time, device_id, application_id, head_id)
+        cost = hop * app.source_message["data"] + self._calculate_communication(time, device_id, application_id)
         return cost
     
     def communication_cost_after_move(self, time:int):
@@ -193,31 +307,36 @@ class Evaluate():
         device_server_id = self.database.data[time]["state"]["device_connect_to_server"][device_id]
         head_id = app.find_head()
         ms_deployed_server_id = self._get_microservice_deployment_server(time-1, device_id, application_id, head_id)
-        hop = self._get_hops_of_two_server(device_server_id, ms_deployed_server_id)
+        hop = self._get_hops_of_two_server(time, device_server_id, ms_deployed_server_id)
         # 这里为什么hop不加1，这是因为服务请求发送到服务器必然会存在一跳的开销，这个开销时无法避免的
-        cost = hop * app.source_message["data"] + self._calculate_communication(time-1, device_id, application_id, head_id)
+        # 部署情况是上一时刻的，但链路使用的是当前时刻的拓扑
+        cost = hop * app.source_message["data"] + self._calculate_communication(time-1, device_id, application_id, topo_time=time)
         return cost
     
-    def _calculate_communication(self, time:int, device_id:int, application_id:int, microservice_id_1:int):
+    def _calculate_communication(self, time:int, device_id:int, application_id:int, topo_time:int = None):
         """
-        计算两个微服务之间的通讯开销
+        计算应用内所有微服务之间的通讯开销，与沿头节点递归累计的结果相同：每条消息边乘以从头节点到发送方的路径数，
+        topo_time为使用的拓扑时刻，默认与部署时刻相同
         """
         device:Moveable_device = self.database.static_data["device_library"][device_id]
         application:Application = device.request_app_library[application_id]
-        microservice_1:Microservice = application.microservice_library[microservice_id_1]
-        cost = 0
-        for next_ms in microservice_1.next_ms:
-            cost += self._calculate_communication_of_two_micriservice(time, device_id, application_id, microservice_1.id, next_ms)
-            cost += self._calculate_communication(time, device_id, application_id, next_ms)
-        return cost
+        ms_ids, sender, receiver, data = application.get_edges()
+        if len(data) == 0:
+            return 0
+        if time not in self.database.data.keys():
+            raise ValueError("Time error!")
+        app_deployment = self.database.data[time]["state"]["microservice_deployment"][device_id][application_id]
+        server_index = np.array([app_deployment[ms_id] for ms_id in ms_ids]) - 1
+        distance_matrix = self.database.get_topo_distance(self.distance, time if topo_time is None else topo_time)
+        return (distance_matrix[server_index[sender], server_index[receiver]] * data * application.get_edge_paths()).sum()
 
-    def _calculate_communication_of_two_micriservice(self, time:int, device_id:int, application_id:int, microservice_id_1:int, microservice_id_2:int):
+    def _calculate_communication_of_two_micriservice(self, time:int, device_id:int, application_id:int, microservice_id_1:int, microservice_id_2:int, topo_time:int = None):
         """
         计算任意两个微服务间的通讯开销
         """
         server_id_1 = self._get_microservice_deployment_server(time, device_id, application_id, microservice_id_1)
         server_id_2 = self._get_microservice_deployment_server(time, device_id, application_id, microservice_id_2)
-        hop = self._get_hops_of_two_server(server_id_1, server_id_2)
+        hop = self._get_hops_of_two_server(time if topo_time is None else topo_time, server_id_1, server_id_2)
         communication = self._get_data_of_two_micriservice(application_id, microservice_id_1, microservice_id_2)
         return hop * communication
     
@@ -228,9 +347,657 @@ class Evaluate():
         application:Application = self.database.static_data["application_library"][application_id]
         return application.get_data_from_message(microservice_id_1, microservice_id_2)
         
-    def _get_hops_of_two_server(self, server_id_1:int, server_id_2:int):
+    def _get_hops_of_two_server(self, time:int, server_id_1:int, server_id_2:int):
+        """
+        获取time时刻生效的拓扑下两个服务器之间的距离，按照self.distance为跳数或时延
+        """
+        distance_matrix = self.database.get_topo_distance(self.distance, time)
+        return distance_matrix[server_id_1-1, server_id_2-1]
+
+class ArrayEvaluate(Evaluate):
+    """
+    数组化的评估模块，结果与Evaluate相同
+    将所有设备请求的应用中的微服务实例展开为一维的槽位，t和t-1时刻的部署情况编译为整型数组，
+    迁移成本、镜像拉取成本和通讯开销都通过numpy在距离矩阵上的索引计算，不再逐个遍历嵌套字典
+    """
+    def __init__(self, database:Database, distance:str = "hop"):
+        super().__init__(database, distance)
+        # 静态结构，设备请求的应用发生变化时重新编译
+        self.structure = None
+        self.structure_key = None
+        # 已编译的部署数组，time -> (部署字典, 部署数组)，只保留最近使用的时刻
+        self.compiled_deployment = {}
+
+    # ------------------------静态结构的编译------------------------
+
+    def _get_structure_key(self):
+        """设备及其请求的应用，作为判断静态结构是否需要重新编译的依据"""
+        device_set:dict = self.database.static_data["device_library"]
+        return tuple((device_id, tuple(device.request_app_library.keys())) for device_id, device in device_set.items())
+
+    def get_structure(self):
+        """
+        获取编译后的静态结构，包括槽位、应用实例、消息边和按微服务id索引的迁移成本、镜像层矩阵
+        """
+        structure_key = self._get_structure_key()
+        if self.structure is None or structure_key != self.structure_key:
+            self.structure = self._compile_structure()
+            self.structure_key = structure_key
+            self.compiled_deployment = {}
+        return self.structure
+
+    def _compile_structure(self):
+        device_set:dict = self.database.static_data["device_library"]
+        device_ids = list(device_set.keys())
+        device_index = {device_id: index for index, device_id in enumerate(device_ids)}
+        slot_keys = []
+        slot_ms = []
+        instance_device = []
+        instance_head = []
+        instance_source = []
+        edge_u, edge_v, edge_data = [], [], []
+        instance_slot_start = []
+        instance_edge_start = [0]
+        device:Moveable_device
+        app:Application
+        for device_id, device in device_set.items():
+            for app_id, app in device.request_app_library.items():
+                instance_slot_start.append(len(slot_keys))
+                ms_slot = {}
+                for ms_id in app.microservice_library.keys():
+                    ms_slot[ms_id] = len(slot_keys)
+                    slot_keys.append((device_id, app_id, ms_id))
+                    slot_ms.append(ms_id)
+                head_id = app.find_head()
+                instance_device.append(device_index[device_id])
+                instance_head.append(ms_slot[head_id])
+                instance_source.append(app.source_message["data"])
+                # 应用的槽位与get_edges中的微服务id列表顺序相同，边的下标加上槽位起点即为槽位，数据量乘以路径数与Evaluate一致
+                _, sender, receiver, data = app.get_edges()
+                data = data * app.get_edge_paths()
+                edge_u.extend((sender + instance_slot_start[-1]).tolist())
+                edge_v.extend((receiver + instance_slot_start[-1]).tolist())
+                edge_data.extend(data.tolist())
+                instance_edge_start.append(len(edge_u))
+
+        # 每个槽位所属的应用实例
+        slot_instance = np.repeat(np.arange(len(instance_head)), np.diff(instance_slot_start + [len(slot_keys)]))
+        instance_device = np.array(instance_device, dtype=int)
+        structure = {
+            "device_ids": device_ids,
+            "slot_keys": slot_keys,
+            "slot_ms": np.array(slot_ms, dtype=int),
+            "slot_index": {key: slot for slot, key in enumerate(slot_keys)},
+            "slot_instance": slot_instance,
+            "instance_device": instance_device,
+            "device_instances": [np.nonzero(instance_device == index)[0] for index in range(len(device_ids))],
+            "instance_slot_start": np.array(instance_slot_start, dtype=int),
+            "instance_edge_start": np.array(instance_edge_start, dtype=int),
+            "instance_head": np.array(instance_head, dtype=int),
+            "instance_source": np.array(instance_source, dtype=float),
+            "edge_u": np.array(edge_u, dtype=int),
+            "edge_v": np.array(edge_v, dtype=int),
+            "edge_data": np.array(edge_data, dtype=float),
+        }
+        structure.update(self._compile_static_arrays())
+        return structure
+
+    def _compile_static_arrays(self):
         """
-        获取两个服务器之间的跳数
+        按微服务id和服务器id索引的静态数组：迁移成本表、微服务镜像层大小矩阵、服务器带宽
         """
-        G = self.database.static_data["topo"]
-        return nx.shortest_path_length(G, source = server_id_1, target = server_id_2)
+        microservice_library:dict = self.database.static_data["microservice_library"]
+        server_library:dict = self.database.static_data["server_library"]
+        ms_max = max(microservice_library.keys())
+        server_max = max(server_library.keys())
+
+        # 微服务包含的镜像层大小，列下标为注册表中的层id
+        registry = self.get_layer_registry()
+        ms_layer = np.zeros((ms_max+1, registry.L))
+        for ms_id in microservice_library.keys():
+            layer_ids = registry.microservice_layers(ms_id)
+            ms_layer[ms_id, layer_ids] = registry.sizes[layer_ids]
+
+        server_bandwidth = np.full(server_max+1, np.nan)
+        server:Server
+        for server_id, server in server_library.items():
+            server_bandwidth[server_id] = server.bandwidth
+        return {"migration_cost": self.database.get_migration_cost_table(), "ms_layer": ms_layer, "server_bandwidth": server_bandwidth}
+
+    # ------------------------动态数据的编译------------------------
+
+    def get_deployment_array(self, time:int):
+        """
+        将time时刻的微服务部署编译为与槽位对应的服务器id数组
+        """
+        structure = self.get_structure()
+        if time not in self.database.data.keys():
+            raise ValueError("Time error!")
+        deployment = self.database.data[time]["state"]["microservice_deployment"]
+        if time in self.compiled_deployment and self.compiled_deployment[time][0] is deployment:
+            return self.compiled_deployment[time][1]
+        array = np.fromiter((deployment[device_id][app_id][ms_id] for device_id, app_id, ms_id in structure["slot_keys"]), dtype=int, count=len(structure["slot_keys"]))
+        # 每一步评估只会用到t和t-1时刻，较早的编译结果直接丢弃
+        for t in [t for t in self.compiled_deployment if t < time-1]:
+            self.compiled_deployment.pop(t)
+        self.compiled_deployment[time] = (deployment, array)
+        return array
+
+    def get_device_server_array(self, time:int):
+        """time时刻每个设备连接的服务器id，顺序与structure中的device_ids相同"""
+        structure = self.get_structure()
+        device_connect_to_server = self.database.data[time]["state"]["device_connect_to_server"]
+        return np.array([device_connect_to_server[device_id] for device_id in structure["device_ids"]], dtype=int)
+
+    # ------------------------重写的内部函数------------------------
+
+    def migration_cost(self, time:int):
+        structure = self.get_structure()
+        last_deployment = self.get_deployment_array(time-1)
+        current_deployment = self.get_deployment_array(time)
+        moved = last_deployment != current_deployment
+        cost = structure["migration_cost"].cost(structure["slot_ms"][moved], current_deployment[moved], last_deployment[moved]).sum()
+        self.database.add(t = time, type= "evaluate", key = "migration_cost", value = cost)
+        return cost
+
+    def image_pull_cost(self, time:int):
+        structure = self.get_structure()
+        last_deployment = self.get_deployment_array(time-1)
+        current_deployment = self.get_deployment_array(time)
+        moved = last_deployment != current_deployment
+        ms_layer = structure["ms_layer"][structure["slot_ms"][moved]]
+        server_id = current_deployment[moved]
+        # 新服务器上t-1时刻已经存在的镜像层不需要拉取
+        has_layer = self.get_server_layer_array(time-1)[server_id]
+        pull_layer = np.where(has_layer, 0, ms_layer).sum(axis=1)
+        cost = (pull_layer / structure["server_bandwidth"][server_id]).sum()
+        self.database.add(t = time, type= "evaluate", key = "image_pull_cost", value = cost)
+        return cost
+
+    def communication_cost(self, time:int):
+        total_cost = self._array_communication_cost(device_time = time, deployment_time = time, topo_time = time)
+        self.database.add(t = time, type= "evaluate", key = "communication_cost", value = total_cost)
+        return total_cost
+
+    def communication_cost_after_move(self, time:int):
+        # 设备的连接服务器和拓扑是当前时刻的，部署情况是上一时刻的
+        total_cost = self._array_communication_cost(device_time = time, deployment_time = time-1, topo_time = time)
+        self.database.add(t = time, type= "evaluate", key = "communication_cost_after_move", value = total_cost)
+        return total_cost
+
+    def _array_communication_cost(self, device_time:int, deployment_time:int, topo_time:int):
+        """
+        源消息的开销为设备连接服务器到头节点部署服务器的距离乘以源消息数据量，其余为消息两端部署服务器的距离乘以数据量
+        """
+        structure = self.get_structure()
+        distance_matrix = self.database.get_topo_distance(self.distance, topo_time)
+        deployment = self.get_deployment_array(deployment_time) - 1
+        device_server = self.get_device_server_array(device_time) - 1
+        source_cost = distance_matrix[device_server[structure["instance_device"]], deployment[structure["instance_head"]]] * structure["instance_source"]
+        message_cost = distance_matrix[deployment[structure["edge_u"]], deployment[structure["edge_v"]]] * structure["edge_data"]
+        return source_cost.sum() + message_cost.sum()
+
+    def _instance_communication_cost(self, distance_matrix, deployment, device_server, instances):
+        """
+        计算给定应用实例的通讯开销，deployment和device_server为服务器下标（服务器id-1），返回与instances对应的数组
+        调用前需要已经通过get_structure编译静态结构
+        """
+        structure = self.structure
+        source_cost = distance_matrix[device_server[structure["instance_device"][instances]], deployment[structure["instance_head"][instances]]] * structure["instance_source"][instances]
+        # 每个实例的消息边在编译时是连续存放的，展开为边的下标
+        starts = structure["instance_edge_start"][instances]
+        counts = structure["instance_edge_start"][instances+1] - starts
+        offsets = np.cumsum(counts) - counts
+        edges = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+        message_cost = distance_matrix[deployment[structure["edge_u"][edges]], deployment[structure["edge_v"][edges]]] * structure["edge_data"][edges]
+        return source_cost + np.bincount(np.repeat(np.arange(len(instances)), counts), weights=message_cost, minlength=len(instances))
+
+class IncrementalEvaluate(ArrayEvaluate):
+    """
+    增量的评估模块，结果与Evaluate相同
+    保存上一时刻每个(设备, 应用)实例的通讯开销和部署数组，下一时刻只根据state中的movement和action中的deploy、migrate
+    更新受影响的实例，迁移成本和镜像拉取成本也只在发生变化的微服务上计算，开销与变化的数量成正比
+    拓扑变化、设备请求的应用变化、动作中有undeploy或者时刻不连续时退化为一次完整的计算
+    """
+    def __init__(self, database:Database, distance:str = "hop"):
+        super().__init__(database, distance)
+        # 上一次更新的时刻及该时刻的部署数组、设备连接的服务器和距离矩阵，数组中均为服务器下标
+        self.inc_time = None
+        self.inc_source = None
+        self.inc_deployment = None
+        self.inc_device_server = None
+        self.inc_distance_matrix = None
+        # 每个应用实例的通讯开销和总和
+        self.inc_instance_cost = None
+        self.inc_total = 0
+        # 每个时刻的四项评估结果
+        self.inc_result = {}
+
+    # ------------------------增量更新------------------------
+
+    def update(self, time:int):
+        """
+        计算time时刻的迁移成本、镜像拉取成本、通讯开销和移动后的通讯开销，能增量更新时只处理发生变化的部分
+        """
+        # 同一时刻可能多次执行step，部署字典被替换后需要重新计算
+        deployment_source = self.database.data[time]["state"]["microservice_deployment"]
+        if time in self.inc_result and deployment_source is self.inc_source:
+            return self.inc_result[time]
+        last_source = None
+        if time-1 in self.database.data:
+            last_source = self.database.data[time-1]["state"].get("microservice_deployment")
+        structure_key = self.structure_key
+        structure = self.get_structure()
+        distance_matrix = self.database.get_topo_distance(self.distance, time)
+        action = self.database.data[time].get("action")
+        if self.inc_time == time-1 and last_source is self.inc_source and structure_key == self.structure_key \
+            and distance_matrix is self.inc_distance_matrix and action is not None and not action.get("undeploy"):
+            result = self._incremental_update(time, structure, distance_matrix, action)
+        else:
+            result = self._full_update(time, structure, distance_matrix)
+        self.inc_time = time
+        self.inc_source = deployment_source
+        self.inc_distance_matrix = distance_matrix
+        # 评估结果只会被当前时刻和之后的时刻使用
+        self.inc_result = {time: result}
+        return result
+
+    def _full_update(self, time:int, structure:dict, distance_matrix):
+        """完整计算一次并重建增量状态"""
+        result = {
+            "migration_cost": ArrayEvaluate.migration_cost(self, time),
+            "image_pull_cost": ArrayEvaluate.image_pull_cost(self, time),
+            "communication_cost_after_move": self._array_communication_cost(device_time = time, deployment_time = time-1, topo_time = time),
+        }
+        self.inc_deployment = self.get_deployment_array(time) - 1
+        self.inc_device_server = self.get_device_server_array(time) - 1
+        self.inc_instance_cost = self._instance_communication_cost(distance_matrix, self.inc_deployment, self.inc_device_server, np.arange(len(structure["instance_head"])))
+        self.inc_total = self.inc_instance_cost.sum()
+        result["communication_cost"] = self.inc_total
+        return result
+
+    def _incremental_update(self, time:int, structure:dict, distance_matrix, action:dict):
+        """根据设备移动和部署动作更新上一时刻的增量状态"""
+        result = {}
+        # 设备移动：只有源消息的开销会变化
+        moved_devices = self._get_moved_devices(time, structure)
+        device_connect_to_server = self.database.data[time]["state"]["device_connect_to_server"]
+        for index in moved_devices:
+            self.inc_device_server[index] = device_connect_to_server[structure["device_ids"][index]] - 1
+        moved_instances = np.concatenate([structure["device_instances"][index] for index in moved_devices] + [np.array([], dtype=int)])
+        old_cost = self.inc_instance_cost[moved_instances]
+        new_cost = self._instance_communication_cost(distance_matrix, self.inc_deployment, self.inc_device_server, moved_instances)
+        self.inc_instance_cost[moved_instances] = new_cost
+        self.inc_total += new_cost.sum() - old_cost.sum()
+        result["communication_cost_after_move"] = self.inc_total
+
+        # 部署动作：迁移成本和镜像拉取成本只在部署服务器发生变化的微服务上计算
+        slots, server_ids = self._get_changed_slots(action, structure)
+        changed = self.inc_deployment[slots] != server_ids - 1
+        slots, server_ids = slots[changed], server_ids[changed]
+        ms_ids = structure["slot_ms"][slots]
+        result["migration_cost"] = structure["migration_cost"].cost(ms_ids, server_ids, self.inc_deployment[slots]+1).sum()
+        result["image_pull_cost"] = self._changed_image_pull_cost(time, ms_ids, server_ids)
+        self.inc_deployment[slots] = server_ids - 1
+
+        changed_instances = np.unique(structure["slot_instance"][slots])
+        old_cost = self.inc_instance_cost[changed_instances]
+        new_cost = self._instance_communication_cost(distance_matrix, self.inc_deployment, self.inc_device_server, changed_instances)
+        self.inc_instance_cost[changed_instances] = new_cost
+        self.inc_total += new_cost.sum() - old_cost.sum()
+        result["communication_cost"] = self.inc_total
+        return result
+
+    def _get_moved_devices(self, time:int, structure:dict):
+        """
+        time时刻连接服务器发生变化的设备下标，优先使用state中的movement，没有记录时比较所有设备的连接情况
+        """
+        state = self.database.data[time]["state"]
+        device_connect_to_server = state["device_connect_to_server"]
+        if "movement" in state:
+            device_ids = set(movement["device_id"] for movement in state["movement"])
+            candidates = [index for index, device_id in enumerate(structure["device_ids"]) if device_id in device_ids]
+        else:
+            candidates = range(len(structure["device_ids"]))
+        return [index for index in candidates if device_connect_to_server[structure["device_ids"][index]] - 1 != self.inc_device_server[index]]
+
+    def _get_changed_slots(self, action:dict, structure:dict):
+        """将动作中的deploy和migrate展开为槽位和目标服务器id数组"""
+        slots, server_ids = [], []
+        for action_type in ["deploy", "migrate"]:
+            for device_id, app_dict in action.get(action_type, {}).items():
+                for app_id, ms_dict in app_dict.items():
+                    for ms_id, server_id in ms_dict.items():
+                        slots.append(structure["slot_index"][(device_id, app_id, ms_id)])
+                        server_ids.append(server_id)
+        return np.array(slots, dtype=int), np.array(server_ids, dtype=int)
+
+    def _changed_image_pull_cost(self, time:int, ms_ids, server_ids):
+        """只对部署服务器发生变化的微服务查询t-1时刻服务器上的镜像层"""
+        structure = self.structure
+        if len(ms_ids) == 0:
+            return 0
+        has_layer = self.get_server_layer_array(time-1)[server_ids]
+        pull_layer = np.where(has_layer, 0, structure["ms_layer"][ms_ids]).sum(axis=1)
+        return (pull_layer / structure["server_bandwidth"][server_ids]).sum()
+
+    # ------------------------重写的内部函数------------------------
+
+    def migration_cost(self, time:int):
+        cost = self.update(time)["migration_cost"]
+        self.database.add(t = time, type= "evaluate", key = "migration_cost", value = cost)
+        return cost
+
+    def image_pull_cost(self, time:int):
+        cost = self.update(time)["image_pull_cost"]
+        self.database.add(t = time, type= "evaluate", key = "image_pull_cost", value = cost)
+        return cost
+
+    def communication_cost(self, time:int):
+        total_cost = self.update(time)["communication_cost"]
+        self.database.add(t = time, type= "evaluate", key = "communication_cost", value = total_cost)
+        return total_cost
+
+    def communication_cost_after_move(self, time:int):
+        total_cost = self.update(time)["communication_cost_after_move"]
+        self.database.add(t = time, type= "evaluate", key = "communication_cost_after_move", value = total_cost)
+        return total_cost
+
+class LatencyEvaluate(ArrayEvaluate):
+    """
+    应用端到端时延的评估模块
+    每个应用实例的时延为设备连接服务器到头节点的链路时延，加上微服务DAG关键路径上的链路时延和处理时间，
+    处理时间为微服务的cpu需求除以部署服务器的computing再乘以processing_factor，
+    所有实例按照DAG的层次一起计算，循环次数只与应用的最大深度有关
+    """
+    def __init__(self, database:Database, processing_factor:float = 1.0):
+        super().__init__(database, distance = "latency")
+        # 处理时间换算到链路时延单位的系数
+        self.processing_factor = processing_factor
+        self.latency_structure = None
+        self.latency_structure_source = None
+
+    def evaluate_app_latency(self, time:int):
+        """每个应用实例的端到端时延以及p50/p95/p99"""
+        return self.app_latency(time)
+
+    def get_latency_structure(self):
+        """
+        在静态结构的基础上编译时延计算需要的数组：每条消息边按接收方的层次分组、微服务cpu需求、服务器算力
+        """
+        structure = self.get_structure()
+        if self.latency_structure is not None and self.latency_structure_source is structure:
+            return self.latency_structure
+        edge_u, edge_v = structure["edge_u"], structure["edge_v"]
+        # 槽位在DAG中的层次，为从根节点出发的最长边数
+        depth = np.zeros(len(structure["slot_keys"]), dtype=int)
+        while len(edge_u) > 0:
+            new_depth = depth.copy()
+            np.maximum.at(new_depth, edge_v, depth[edge_u] + 1)
+            if np.array_equal(new_depth, depth):
+                break
+            depth = new_depth
+        edge_depth = depth[edge_v] if len(edge_v) > 0 else np.array([], dtype=int)
+        levels = [np.nonzero(edge_depth == d)[0] for d in range(1, edge_depth.max()+1)] if len(edge_depth) > 0 else []
+
+        microservice_library:dict = self.database.static_data["microservice_library"]
+        ms_cpu = np.zeros(max(microservice_library.keys())+1)
+        microservice:Microservice
+        for ms_id, microservice in microservice_library.items():
+            ms_cpu[ms_id] = microservice.cpu
+        server_library:dict = self.database.static_data["server_library"]
+        server_computing = np.full(max(server_library.keys())+1, np.nan)
+        server:Server
+        for server_id, server in server_library.items():
+            server_computing[server_id] = server.computing
+
+        instance_keys = [structure["slot_keys"][slot][:2] for slot in structure["instance_slot_start"]]
+        self.latency_structure = {"levels": levels, "slot_cpu": ms_cpu[structure["slot_ms"]], "server_computing": server_computing, "instance_keys": instance_keys}
+        self.latency_structure_source = structure
+        return self.latency_structure
+
+    def app_latency(self, time:int):
+        """
+        计算time时刻每个应用实例的端到端时延，顺序与静态结构中的应用实例一致，
+        时延数组、对应的(设备id, 应用id)和p50/p95/p99记录到数据库中
+        """
+        structure = self.get_structure()
+        latency_structure = self.get_latency_structure()
+        latency_matrix = self.database.get_topo_latency(time)
+        deployment = self.get_deployment_array(time)
+        device_server = self.get_device_server_array(time) - 1
+        processing = latency_structure["slot_cpu"] / latency_structure["server_computing"][deployment] * self.processing_factor
+        deployment = deployment - 1
+
+        # finish为每个微服务处理完成的时刻，从头节点不可达的微服务保持为-inf
+        finish = np.full(len(structure["slot_keys"]), -np.inf)
+        head = structure["instance_head"]
+        finish[head] = latency_matrix[device_server[structure["instance_device"]], deployment[head]] + processing[head]
+        edge_u, edge_v = structure["edge_u"], structure["edge_v"]
+        for level in latency_structure["levels"]:
+            u, v = edge_u[level], edge_v[level]
+            arrival = np.full(len(finish), -np.inf)
+            np.maximum.at(arrival, v, finish[u] + latency_matrix[deployment[u], deployment[v]])
+            finish[v] = np.maximum(finish[v], arrival[v] + processing[v])
+        latency = np.maximum.reduceat(finish, structure["instance_slot_start"]) if len(finish) > 0 else np.array([])
+
+        instance_keys = latency_structure["instance_keys"]
+        percentile = np.percentile(latency, [50, 95, 99]) if len(latency) > 0 else [np.nan] * 3
+        self.database.add(t = time, type= "evaluate", key = "app_latency", value = latency)
+        self.database.add(t = time, type= "evaluate", key = "app_latency_keys", value = instance_keys)
+        self.database.add(t = time, type= "evaluate", key = "app_latency_p50", value = percentile[0])
+        self.database.add(t = time, type= "evaluate", key = "app_latency_p95", value = percentile[1])
+        self.database.add(t = time, type= "evaluate", key = "app_latency_p99", value = percentile[2])
+        return {"latency": latency, "keys": instance_keys, "p50": percentile[0], "p95": percentile[1], "p99": percentile[2]}
+
+class WhatIfEvaluate(ArrayEvaluate):
+    """
+    候选动作的假设评估模块，不修改生产环境，也不向数据库写入评估结果
+    当前状态为time-1时刻的部署和服务器资源，设备连接和拓扑为time时刻的，
+    对一批候选动作按照Prodution.deploy的顺序检查服务器存储、算力和镜像层的可行性，启用镜像层缓存时缓存的层占用的存储可以淘汰，
+    可行的候选动作一起编译为部署矩阵，批量计算迁移成本、镜像拉取成本和通讯开销
+    """
+    def evaluate_actions(self, time:int, actions:list, theta:tuple = None):
+        """批量评估候选动作，theta为(theta_1, theta_2, theta_3)，给出时增加production"""
+        return self.score_actions(time, actions, theta)
+
+    def score_actions(self, time:int, actions:list, theta:tuple = None):
+        """
+        返回的字典中feasible、各项成本均为与actions对应的数组，不可行的候选动作成本为nan，reason为不可行的原因
+        """
+        structure = self.get_structure()
+        last_deployment = self.get_deployment_array(time-1)
+        feasible = np.zeros(len(actions), dtype=bool)
+        reason = [None] * len(actions)
+        candidates = []
+        for index, action in enumerate(actions):
+            deployment, reason[index] = self.check_action(time, action)
+            if deployment is not None:
+                feasible[index] = True
+                candidates.append(deployment)
+
+        migration_cost = np.full(len(actions), np.nan)
+        image_pull_cost = np.full(len(actions), np.nan)
+        communication_cost = np.full(len(actions), np.nan)
+        if len(candidates) > 0:
+            candidates = np.array(candidates, dtype=int)
+            number = len(candidates)
+            row, slot = np.nonzero(candidates != last_deployment)
+            ms_ids = structure["slot_ms"][slot]
+            server_ids = candidates[row, slot]
+            migration = structure["migration_cost"].cost(ms_ids, server_ids, last_deployment[slot])
+            migration_cost[feasible] = np.bincount(row, weights=migration, minlength=number)
+            # 新服务器上t-1时刻已经存在的镜像层不需要拉取
+            has_layer = self.get_server_layer_array(time-1)[server_ids]
+            pull_layer = np.where(has_layer, 0, structure["ms_layer"][ms_ids]).sum(axis=1)
+            image_pull_cost[feasible] = np.bincount(row, weights=pull_layer / structure["server_bandwidth"][server_ids], minlength=number)
+
+            distance_matrix = self.database.get_topo_distance(self.distance, time)
+            deployment = candidates - 1
+            device_server = self.get_device_server_array(time) - 1
+            source_cost = distance_matrix[device_server[structure["instance_device"]], deployment[:, structure["instance_head"]]] * structure["instance_source"]
+            message_cost = distance_matrix[deployment[:, structure["edge_u"]], deployment[:, structure["edge_v"]]] * structure["edge_data"]
+            communication_cost[feasible] = source_cost.sum(axis=1) + message_cost.sum(axis=1)
+
+        result = {"feasible": feasible, "reason": reason, "migration_cost": migration_cost, "image_pull_cost": image_pull_cost, "communication_cost": communication_cost}
+        if theta is not None:
+            result["production"] = theta[0] * migration_cost + theta[1] * image_pull_cost + theta[2] * communication_cost
+        return result
+
+    def check_action(self, time:int, action:dict):
+        """
+        在time-1时刻部署和服务器资源的副本上执行动作，顺序与Prodution.deploy相同：部署、整体迁移（先全部卸载再部署）、卸载
+        可行时返回(执行后的部署数组, None)，否则返回(None, 原因)
+        """
+        structure = self.get_structure()
+        slot_index:dict = structure["slot_index"]
+        deployment = self.get_deployment_array(time-1).copy()
+        deployed = np.ones(len(deployment), dtype=bool)
+        # 服务器id -> [镜像层计数, 剩余存储, 剩余算力]，只复制动作涉及的服务器
+        resource = {}
+        try:
+            for device_id, app_id, ms_id, server_id in self._iter_action(action.get("deploy", {})):
+                slot = self._get_action_slot(slot_index, device_id, app_id, ms_id)
+                if deployed[slot]:
+                    raise ValueError("Microservice already deployed!")
+                self._deploy_slot(time, resource, ms_id, server_id)
+                deployment[slot], deployed[slot] = server_id, True
+
+            migrate = list(self._iter_action(action.get("migrate", {})))
+            for device_id, app_id, ms_id, _ in migrate:
+                slot = self._get_action_slot(slot_index, device_id, app_id, ms_id)
+                if not deployed[slot]:
+                    raise ValueError("Microservice not deployed!")
+                self._undeploy_slot(time, resource, ms_id, deployment[slot])
+                deployed[slot] = False
+            for device_id, app_id, ms_id, server_id in migrate:
+                slot = slot_index[(device_id, app_id, ms_id)]
+                self._deploy_slot(time, resource, ms_id, server_id)
+                deployment[slot], deployed[slot] = server_id, True
+
+            for device_id, app_id, ms_id, _ in self._iter_action(action.get("undeploy", {})):
+                slot = self._get_action_slot(slot_index, device_id, app_id, ms_id)
+                if not deployed[slot]:
+                    raise ValueError("Microservice not deployed!")
+                self._undeploy_slot(time, resource, ms_id, deployment[slot])
+                deployed[slot] = False
+        except ValueError as error:
+            return None, str(error)
+        # 与Prodution.check_deployment相同，动作执行后所有微服务都需要被部署
+        if not deployed.all():
+            device_id, app_id, _ = structure["slot_keys"][np.nonzero(~deployed)[0][0]]
+            return None, "Application {}  in device {} not deployed!".format(app_id, device_id)
+        return deployment, None
+
+    def _iter_action(self, action_part:dict):
+        """展开{device_id:{application_id:{microservice_id:server_id}}}，卸载动作中的server_id为None"""
+        for device_id, app_dict in action_part.items():
+            for app_id, ms_dict in app_dict.items():
+                for ms_id in ms_dict:
+                    yield device_id, app_id, ms_id, ms_dict[ms_id] if isinstance(ms_dict, dict) else None
+
+    def _get_action_slot(self, slot_index:dict, device_id:int, app_id:int, ms_id:int):
+        if (device_id, app_id, ms_id) not in slot_index:
+            raise ValueError("Microservice id not in application!")
+        return slot_index[(device_id, app_id, ms_id)]
+
+    def _get_server_resource(self, time:int, resource:dict, server_id:int):
+        if server_id not in resource:
+            state = self.database.data[time-1]["state"]
+            if server_id not in state["server_deployed_layers"]:
+                raise ValueError("No such server!")
+            # 启用镜像层缓存时缓存的层（包括预取的层）都可以淘汰，计为剩余存储；需求中命中缓存的层移出缓存后继续占用存储，
+            # 因此与淘汰后重新占用相同，计入occupy_storage，可行性与Server.deploy_ms使用的ServerPool.feasible_on相同
+            registry = self.get_layer_registry()
+            cached_storage = float(registry.sizes[registry.get_ids(state.get("server_cached_layers", {}).get(server_id, []))].sum())
+            resource[server_id] = [dict(state["server_deployed_layers"][server_id]), state["server_left_storage"][server_id] + cached_storage,
+                                   state["server_left_computing"][server_id]]
+        return resource[server_id]
+
+    def _deploy_slot(self, time:int, resource:dict, ms_id:int, server_id:int):
+        """与Server.deploy_ms相同的可行性判断和资源更新"""
+        layers, left_storage, left_computing = self._get_server_resource(time, resource, server_id)
+        microservice:Microservice = self.database.static_data["microservice_library"][ms_id]
+        occupy_storage = sum(size for layer_name, size in microservice.layers.items() if layer_name not in layers)
+        # round是因为浮点数计算的误差
+        if occupy_storage > round(left_storage, 2):
+            raise ValueError("Not enough storage on server {}!".format(server_id))
+        if microservice.cpu > round(left_computing, 2):
+            raise ValueError("Not enough computing power on server {}!".format(server_id))
+        for layer_name in microservice.layers:
+            layers[layer_name] = layers.get(layer_name, 0) + 1
+        resource[server_id][1] = left_storage - occupy_storage
+        resource[server_id][2] = left_computing - microservice.cpu
+
+    def _undeploy_slot(self, time:int, resource:dict, ms_id:int, server_id:int):
+        """与Server.undeploy_ms相同的资源更新，镜像层计数为0时释放存储空间"""
+        layers, left_storage, left_computing = self._get_server_resource(time, resource, server_id)
+        microservice:Microservice = self.database.static_data["microservice_library"][ms_id]
+        for layer_name, size in microservice.layers.items():
+            if layer_name in layers:
+                layers[layer_name] -= 1
+                if layers[layer_name] == 0:
+                    layers.pop(layer_name)
+                    left_storage += size
+        resource[server_id][1] = left_storage
+        resource[server_id][2] = left_computing + microservice.cpu
+
+# ------------------------运行结束后的批量重新评估------------------------
+
+EVALUATE_METRICS = ["migration_cost", "image_pull_cost", "communication_cost", "communication_cost_after_move"]
+
+# 子进程中使用的评估模块，由_init_batch_worker创建
+_batch_evaluate = None
+
+def _init_batch_worker(database:Database, evaluate_class, distance:str):
+    global _batch_evaluate
+    _batch_evaluate = evaluate_class(database, distance)
+
+def _evaluate_time_range(times:list, theta:tuple = None, evaluate:Evaluate = None):
+    """
+    在一段连续的时刻上计算所有评估指标，返回列名到数值列表的字典
+    """
+    evaluate = evaluate if evaluate is not None else _batch_evaluate
+    columns = {"time": list(times)}
+    for metric in EVALUATE_METRICS:
+        columns[metric] = []
+    for t in times:
+        for metric in EVALUATE_METRICS:
+            columns[metric].append(getattr(evaluate, metric)(t))
+    if theta is not None:
+        columns["production"] = [theta[0] * columns["migration_cost"][i] + theta[1] * columns["image_pull_cost"][i] + theta[2] * columns["communication_cost"][i]
+                                 for i in range(len(times))]
+    return columns
+
+def evaluate_run(database, start_time:int = None, end_time:int = None, theta:tuple = None, evaluate_class = ArrayEvaluate,
+                 distance:str = "hop", workers:int = None):
+    """
+    对运行结束的数据库（或save_to_pickle保存的文件路径、save_to_parquet导出的目录）批量重新计算每个时刻的所有评估指标
+    时间范围被切分为连续的若干段交给进程池并行计算，返回以time为一列的pandas表格
+    theta为evaluate_production中的(theta_1, theta_2, theta_3)，给出时增加production列
+    evaluate_class和distance用于替换成本模型；workers为1时在当前进程中计算，评估结果会像直接调用Evaluate一样写入数据库
+    """
+    if isinstance(database, str) and os.path.isdir(database):
+        # save_to_parquet导出的目录，只读取需要的时间范围，包括评估需要的上一时刻
+        from storage.run_export import RunData
+        database = RunData(database).to_database(start_time-1 if start_time is not None else None, end_time)
+    elif isinstance(database, str):
+        database = Database.load_from_pickle(database)
+    # 每个时刻的评估都需要上一时刻的状态，因此从第二个有记录的时刻开始
+    recorded = sorted(t for t in database.data.keys() if "state" in database.data[t])
+    start_time = recorded[0] + 1 if start_time is None else start_time
+    end_time = recorded[-1] if end_time is None else end_time
+    times = [t for t in recorded if start_time <= t <= end_time and t-1 in database.data]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(times)))
+
+    if workers == 1:
+        columns = _evaluate_time_range(times, theta, evaluate_class(database, distance))
+        return pd.DataFrame(columns)
+
+    chunks = [[int(t) for t in chunk] for chunk in np.array_split(times, workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(database, evaluate_class, distance)) as executor:
+        results = list(executor.map(_evaluate_time_range, chunks, [theta] * len(chunks)))
+    table = pd.concat([pd.DataFrame(columns) for columns in results], ignore_index=True)
+    return table.sort_values("time", ignore_index=True)
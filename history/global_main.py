@@ -6,7 +6,8 @@ from environment.migration_environment import Prodution
 from algorithm.main_algorithm import Algorithm
 from config import get_config
 from database import Database
-from evaluate import Evaluate
+from storage.spill_database import SpillDatabase
+from evaluate import IncrementalEvaluate
 import matplotlib.pyplot as plt
 from threading import Thread, Lock
 import time, copy, os, pandas as pd
@@ -23,6 +24,8 @@ END_TIME_SLOT = 300  # 时隙数量
 PARALLEL_THRESHOLD = 3000  # 平行控制介入阈值
 
 PARALLEL_INTERVAL = 8  # 平行控制的时间间隔
+# 内存中保留的时刻数，不为None时使用SpillDatabase，更早的时刻写入output/spill，END_TIME_SLOT很大时内存不随时间增长
+SPILL_RETENTION = None
 parallel_control_action = None
 parallel_control_actionLock = Lock()
 parallel_control_flag = False
@@ -34,10 +37,10 @@ def main(set_seed):
     global parallel_control_action
 
     # 数据库创建
-    database = Database()
+    database = Database() if SPILL_RETENTION is None else SpillDatabase(retention=SPILL_RETENTION)
 
     # 评估模块创建
-    evaluate = Evaluate(database=database)
+    evaluate = IncrementalEvaluate(database=database)
 
     # 环境模块创建
     production = Prodution(database=database, end_time=END_TIME_SLOT, algorithm_type="None", no_output=True)
@@ -4,7 +4,7 @@
 
 from environment.migration_environment import Prodution
 from database import Database
-from evaluate import Evaluate
+from evaluate import IncrementalEvaluate
 from config import CONFIG_ENVIRONMENT, get_config
 import time, copy
 import matplotlib.pyplot as plt
@@ -22,9 +22,9 @@ def main():
     no_migration_database = copy.deepcopy(database)
 
     # 创建评估实例，用于评估算法的效果
-    evaluate = Evaluate(database=database)
-    virtual_evaluate = Evaluate(database=virtual_database)
-    no_migration_evaluate = Evaluate(database=no_migration_database)
+    evaluate = IncrementalEvaluate(database=database)
+    virtual_evaluate = IncrementalEvaluate(database=virtual_database)
+    no_migration_evaluate = IncrementalEvaluate(database=no_migration_database)
 
     # 创建实际的生产环境实例，入参的end_time是生产环境的最大时间，到达该事件后则会停止，算法种类为对应的求解算法采用哪种，目前为gurobi(论文中提出的算法)和greedy(贪心算法)和fullgurobi(完全gurobi求解算法)和base(随机算法)
 
@@ -156,7 +156,7 @@ def main():
     # production.reset()
 
     # 将实验数据存到csv文件中
-    database.save_to_csv()
+    database.save_to_csv(scalar_only=False)
 
 
 if __name__ == "__main__":
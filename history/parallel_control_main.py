@@ -6,7 +6,7 @@ from environment.migration_environment import Prodution
 from algorithm.main_algorithm import Algorithm
 from config import get_config
 from database import Database
-from evaluate import Evaluate
+from evaluate import IncrementalEvaluate
 import matplotlib.pyplot as plt
 from threading import Thread, Lock
 import time, copy
@@ -28,7 +28,7 @@ def main():
     database = Database()
 
     # 评估模块创建
-    evaluate = Evaluate(database=database)
+    evaluate = IncrementalEvaluate(database=database)
 
     # 环境模块创建
     production = Prodution(database=database, end_time=END_TIME_SLOT, algorithm_type="None", no_output=True)
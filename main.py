@@ -4,6 +4,7 @@
 
 from environment.migration_environment import Prodution
 from database import Database
+from storage.metrics_writer import MetricsWriter
 from evaluate import Evaluate
 from config import CONFIG_ENVIRONMENT, get_config
 import time
@@ -47,6 +48,9 @@ def main():
     production.algorithm.algorithm.output = False
     production.algorithm.algorithm.epsilon = 0.0001
 
+    # 每个时刻的评估指标在运行过程中写入output目录
+    writer = MetricsWriter(name="data")
+
     # 初始环境配置完成，启动系统运行
     while True:
         # 时间前进，若到达最大时间则停止
@@ -76,6 +80,7 @@ def main():
         # 决策前的通讯开销
         print("Communication cost after move: ", evaluate.evaluate_communication_cost_after_move(production.current_time))
         print("----------------------------------")
+        writer.write(production.current_time, database)
 
         # production.show()
         # production.show_hardware()
@@ -85,8 +90,8 @@ def main():
     # 重置环境
     # production.reset()
 
-    # 将实验数据存到csv文件中
-    database.save_to_csv()
+    # 实验数据已经逐时刻写入，关闭文件
+    writer.close()
 
 
 if __name__ == "__main__":
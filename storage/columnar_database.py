@@ -0,0 +1,193 @@
+# 列式存储的数据库，状态数据按时刻存放在预分配的numpy数组中
+from collections import OrderedDict
+import numpy as np
+from database import Database, LazyState
+
+class ColumnBlock:
+    """
+    时刻×键的二维数组，行对应时刻，列对应键（微服务实例、设备或服务器），行和列都按倍增的方式预分配
+    没有记录的位置为fill
+    """
+    def __init__(self, dtype, fill, capacity:int = 64):
+        self.dtype = dtype
+        self.fill = fill
+        self.array = np.full((capacity, 16), fill, dtype=dtype)
+        # 时刻 -> 行，键 -> 列
+        self.rows = {}
+        self.columns = {}
+        self.keys = []
+
+    def _reserve(self, row_number:int, column_number:int):
+        rows, columns = self.array.shape
+        if row_number <= rows and column_number <= columns:
+            return
+        while rows < row_number:
+            rows *= 2
+        while columns < column_number:
+            columns *= 2
+        array = np.full((rows, columns), self.fill, dtype=self.dtype)
+        array[:self.array.shape[0], :self.array.shape[1]] = self.array
+        self.array = array
+
+    def set_row(self, t:int, keys:list, values:list):
+        """写入t时刻的一行，同一时刻重复写入时覆盖"""
+        for key in keys:
+            if key not in self.columns:
+                self.columns[key] = len(self.keys)
+                self.keys.append(key)
+        row = self.rows.setdefault(t, len(self.rows))
+        self._reserve(len(self.rows), len(self.keys))
+        self.array[row] = self.fill
+        self.array[row, [self.columns[key] for key in keys]] = values
+
+    def get_row(self, t:int):
+        """t时刻的一行，长度与keys相同"""
+        return self.array[self.rows[t], :len(self.keys)]
+
+    def nbytes(self):
+        """已经使用的部分占用的字节数"""
+        return len(self.rows) * len(self.keys) * self.array.itemsize
+
+class ColumnarDatabase(Database):
+    """
+    与Database接口相同的列式存储数据库
+    微服务部署存放在时刻×微服务实例的数组中，设备连接的服务器存放在时刻×设备的数组中，服务器剩余存储和算力存放在时刻×服务器的数组中，
+    服务器上部署的微服务和镜像层计数由同一时刻的微服务部署和静态的微服务库推导，不单独存储，
+    微服务部署中的设备和应用另外保存，没有部署任何微服务的设备和应用也能还原，
+    每个时刻只占用几KB，读取时还原的嵌套字典缓存最近使用的若干个
+    """
+    # 存放在列中的状态，值为(数组类型, 空位的值)
+    COLUMN_KEYS = {
+        "microservice_deployment": (np.int32, -1),
+        "device_connect_to_server": (np.int32, -1),
+        "server_left_storage": (np.float64, np.nan),
+        "server_left_computing": (np.float64, np.nan),
+    }
+    # 由同一时刻的微服务部署推导的状态
+    DERIVED_KEYS = ["server_microservice_deployment", "server_deployed_layers"]
+    # 取值通常与上一时刻相同的状态，相同时共享上一时刻的对象
+    SHARED_KEYS = ["device_request_app"]
+
+    def __init__(self, capacity:int = 64, cache_size:int = 8):
+        super().__init__()
+        self.capacity = capacity
+        self.cache_size = cache_size
+        self.columns = {key: ColumnBlock(dtype, fill, capacity) for key, (dtype, fill) in self.COLUMN_KEYS.items()}
+        # (时刻, 键) -> 还原后的嵌套字典
+        self.state_cache = OrderedDict()
+        self.shared_last = {}
+        # 时刻 -> 微服务部署中的 {设备id: 应用id元组}，与上一时刻相同时共享
+        self.deployment_keys = {}
+
+    def add(self, t:int, type:str, key, value):
+        if type != "state":
+            return super().add(t, type, key, value)
+        state = self._get_state_record(t)
+        self.state_cache.pop((t, key), None)
+        if key in self.COLUMN_KEYS:
+            keys, values = self._flatten(key, value)
+            self.columns[key].set_row(t, keys, values)
+            state.key_restored[key] = True
+            if key == "microservice_deployment":
+                self._add_deployment_keys(t, value)
+        elif key in self.DERIVED_KEYS and state.key_restored.get("microservice_deployment"):
+            state.key_restored[key] = True
+        else:
+            if key in self.SHARED_KEYS:
+                if key in self.shared_last and self.shared_last[key] == value:
+                    value = self.shared_last[key]
+                self.shared_last[key] = value
+            state.values[key] = value
+            state.key_restored[key] = False
+
+    def add_dict(self, t:int, type:str, data:dict):
+        if type != "state":
+            return super().add_dict(t, type, data)
+        if t in self.data and "state" in self.data[t]:
+            return
+        for key, value in data.items():
+            self.add(t, type, key, value)
+
+    def _get_state_record(self, t:int):
+        if t not in self.data:
+            self.data[t] = {}
+        if "state" not in self.data[t]:
+            self.data[t]["state"] = LazyState(self, t)
+        return self.data[t]["state"]
+
+    def _add_deployment_keys(self, t:int, value:dict):
+        deployment_keys = {device_id: tuple(app_dict.keys()) for device_id, app_dict in value.items()}
+        last = self.shared_last.get("deployment_keys")
+        if last is not None and last == deployment_keys:
+            deployment_keys = last
+        self.shared_last["deployment_keys"] = deployment_keys
+        self.deployment_keys[t] = deployment_keys
+
+    # ------------------------嵌套字典与列的转换------------------------
+
+    def _flatten(self, key:str, value:dict):
+        if key == "microservice_deployment":
+            keys, values = [], []
+            for device_id, app_dict in value.items():
+                for app_id, ms_dict in app_dict.items():
+                    for ms_id, server_id in ms_dict.items():
+                        keys.append((device_id, app_id, ms_id))
+                        values.append(server_id)
+            return keys, values
+        return list(value.keys()), list(value.values())
+
+    def restore_state(self, t:int, key:str):
+        """读取t时刻列式存储的状态，还原为嵌套字典"""
+        if (t, key) in self.state_cache:
+            self.state_cache.move_to_end((t, key))
+            return self.state_cache[(t, key)]
+        if key == "microservice_deployment":
+            value = self._restore_deployment(t)
+        elif key == "server_microservice_deployment":
+            value = self.derive_server_deployment(self._iter_deployment(t))
+        elif key == "server_deployed_layers":
+            value = self.derive_server_layers(self._iter_deployment(t))
+        else:
+            block:ColumnBlock = self.columns[key]
+            row = block.get_row(t)
+            present = np.nonzero(~np.isnan(row) if np.isnan(block.fill) else row != block.fill)[0]
+            value = {block.keys[index]: row[index].item() for index in present}
+        self.state_cache[(t, key)] = value
+        while len(self.state_cache) > self.cache_size:
+            self.state_cache.popitem(last=False)
+        return value
+
+    def _iter_deployment(self, t:int):
+        """t时刻部署的(设备id, 应用id, 微服务id, 服务器id)"""
+        block:ColumnBlock = self.columns["microservice_deployment"]
+        row = block.get_row(t)
+        for index in np.nonzero(row != block.fill)[0]:
+            yield block.keys[index] + (int(row[index]),)
+
+    def _restore_deployment(self, t:int):
+        deployment = {device_id: {app_id: {} for app_id in app_ids} for device_id, app_ids in self.deployment_keys.get(t, {}).items()}
+        for device_id, app_id, ms_id, server_id in self._iter_deployment(t):
+            deployment.setdefault(device_id, {}).setdefault(app_id, {})[ms_id] = server_id
+        return deployment
+
+    # ------------------------其他------------------------
+
+    def nbytes(self):
+        """列式存储的状态占用的字节数"""
+        return sum(block.nbytes() for block in self.columns.values())
+
+    def reset(self):
+        super().reset()
+        self.columns = {key: ColumnBlock(dtype, fill, self.capacity) for key, (dtype, fill) in self.COLUMN_KEYS.items()}
+        self.state_cache = OrderedDict()
+        self.shared_last = {}
+        self.deployment_keys = {}
+
+    def reset_complete(self):
+        super().reset_complete()
+        self.reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["state_cache"] = OrderedDict()
+        return state
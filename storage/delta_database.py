@@ -0,0 +1,149 @@
+# 增量存储的数据库，部署等状态只记录与上一时刻的差异，每隔K个时刻保存一次完整的检查点
+import bisect
+from collections import OrderedDict
+from database import Database, LazyState
+
+class DeltaHistory:
+    """
+    单个状态键的历史，嵌套字典展开为 路径元组 -> 叶子值 的扁平字典，
+    检查点时刻保存完整的扁平字典，其余时刻只保存发生变化的路径和被删除的路径
+    """
+    # 空字典作为叶子时的占位，保证服务器上没有部署时的空字典可以被还原
+    EMPTY = "__empty__"
+
+    def __init__(self, checkpoint_interval:int):
+        self.checkpoint_interval = checkpoint_interval
+        # 时刻 -> ("checkpoint", 扁平字典) 或 ("delta", 变化的路径, 删除的路径)
+        self.records = {}
+        self.times = []
+        self.checkpoint_times = []
+        # 最后一个时刻的扁平字典，用于计算下一个时刻的差异
+        self.last_flat = None
+
+    def add(self, t:int, value:dict):
+        if self.times and t < self.times[-1]:
+            raise ValueError("Delta history only supports adding in time order!")
+        if self.times and t == self.times[-1]:
+            # 同一时刻重复写入，以上一个记录的时刻为基准重新计算
+            self.times.pop()
+            self.records.pop(t)
+            if self.checkpoint_times and self.checkpoint_times[-1] == t:
+                self.checkpoint_times.pop()
+            self.last_flat = self.get_flat(self.times[-1]) if self.times else None
+
+        flat = self.flatten(value)
+        since_checkpoint = len(self.times) - bisect.bisect_left(self.times, self.checkpoint_times[-1]) if self.checkpoint_times else None
+        if self.last_flat is None or since_checkpoint >= self.checkpoint_interval:
+            self.records[t] = ("checkpoint", flat)
+            self.checkpoint_times.append(t)
+        else:
+            last_flat = self.last_flat
+            changed = {path: leaf for path, leaf in flat.items() if path not in last_flat or last_flat[path] != leaf}
+            removed = tuple(path for path in last_flat if path not in flat)
+            self.records[t] = ("delta", changed, removed)
+        self.times.append(t)
+        self.last_flat = flat
+
+    def get_flat(self, t:int):
+        """从t之前最近的检查点开始依次应用差异，得到t时刻的扁平字典"""
+        index = bisect.bisect_right(self.checkpoint_times, t) - 1
+        if index < 0 or t not in self.records:
+            raise KeyError(t)
+        checkpoint_time = self.checkpoint_times[index]
+        flat = dict(self.records[checkpoint_time][1])
+        for record_time in self.times[bisect.bisect_right(self.times, checkpoint_time):bisect.bisect_right(self.times, t)]:
+            _, changed, removed = self.records[record_time]
+            for path in removed:
+                flat.pop(path)
+            flat.update(changed)
+        return flat
+
+    def get(self, t:int):
+        return self.unflatten(self.get_flat(t))
+
+    def flatten(self, value:dict, prefix:tuple = (), flat:dict = None):
+        flat = {} if flat is None else flat
+        if len(value) == 0 and len(prefix) > 0:
+            flat[prefix] = self.EMPTY
+        for key, child in value.items():
+            if isinstance(child, dict):
+                self.flatten(child, prefix + (key,), flat)
+            else:
+                flat[prefix + (key,)] = child
+        return flat
+
+    def unflatten(self, flat:dict):
+        value = {}
+        for path, leaf in flat.items():
+            node = value
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = {} if isinstance(leaf, str) and leaf == self.EMPTY else leaf
+        return value
+
+class DeltaDatabase(Database):
+    """
+    与Database接口相同的增量存储数据库
+    部署、设备连接、服务器镜像层和剩余资源等状态每个时刻只记录发生迁移的微服务、发生移动的设备和资源发生变化的服务器，
+    每隔checkpoint_interval个时刻保存一次完整的状态，读取t时刻的状态最多需要应用K个时刻的差异
+    """
+    # 增量存储的状态
+    DELTA_KEYS = ["microservice_deployment", "device_connect_to_server", "server_microservice_deployment",
+                  "server_deployed_layers", "server_left_storage", "server_left_computing", "device_request_app"]
+
+    def __init__(self, checkpoint_interval:int = 16, cache_size:int = 8):
+        super().__init__()
+        self.checkpoint_interval = checkpoint_interval
+        self.cache_size = cache_size
+        self.history = {key: DeltaHistory(checkpoint_interval) for key in self.DELTA_KEYS}
+        # (时刻, 键) -> 还原后的嵌套字典
+        self.state_cache = OrderedDict()
+
+    def add(self, t:int, type:str, key, value):
+        if type != "state":
+            return super().add(t, type, key, value)
+        if t not in self.data:
+            self.data[t] = {}
+        if "state" not in self.data[t]:
+            self.data[t]["state"] = LazyState(self, t)
+        state:LazyState = self.data[t]["state"]
+        self.state_cache.pop((t, key), None)
+        if key in self.history and isinstance(value, dict):
+            self.history[key].add(t, value)
+            state.key_restored[key] = True
+        else:
+            state.values[key] = value
+            state.key_restored[key] = False
+
+    def add_dict(self, t:int, type:str, data:dict):
+        if type != "state":
+            return super().add_dict(t, type, data)
+        if t in self.data and "state" in self.data[t]:
+            return
+        for key, value in data.items():
+            self.add(t, type, key, value)
+
+    def restore_state(self, t:int, key:str):
+        """读取t时刻增量存储的状态，还原为嵌套字典"""
+        if (t, key) in self.state_cache:
+            self.state_cache.move_to_end((t, key))
+            return self.state_cache[(t, key)]
+        value = self.history[key].get(t)
+        self.state_cache[(t, key)] = value
+        while len(self.state_cache) > self.cache_size:
+            self.state_cache.popitem(last=False)
+        return value
+
+    def reset(self):
+        super().reset()
+        self.history = {key: DeltaHistory(self.checkpoint_interval) for key in self.DELTA_KEYS}
+        self.state_cache = OrderedDict()
+
+    def reset_complete(self):
+        super().reset_complete()
+        self.reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["state_cache"] = OrderedDict()
+        return state
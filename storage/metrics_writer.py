@@ -0,0 +1,71 @@
+# 运行过程中逐时刻写入评估指标，代替运行结束后再整体保存的save_to_csv
+import os
+import json
+import math
+import time
+import pickle
+import numbers
+import pandas as pd
+
+def split_evaluate(evaluate:dict):
+    """将某一时刻的evaluate拆分为标量指标和其他数据（例如每个应用的时延数组）"""
+    scalar, other = {}, {}
+    for key, value in evaluate.items():
+        if value is None or isinstance(value, (numbers.Number, str)):
+            value = value.item() if hasattr(value, "item") else value
+            # json中没有nan，记为null
+            scalar[key] = None if isinstance(value, float) and math.isnan(value) else value
+        else:
+            other[key] = value
+    return scalar, other
+
+class MetricsWriter:
+    """
+    每个时刻向output目录追加一行标量指标（evaluate中的迁移成本、通讯开销、solve_time等），格式为json lines，
+    每个时刻的状态、动作和非标量的评估数据以pickle追加到同名的_state.pkl文件中，
+    每次写入后立即flush，运行中断时已经写入的时刻不会丢失，两个文件都可以边运行边读取
+    """
+    def __init__(self, name:str = "metrics", parent_dir:str = None, save_state:bool = True):
+        timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+        parent_dir = parent_dir if parent_dir is not None else os.getcwd() + "/output/"
+        os.makedirs(parent_dir, exist_ok=True)
+        self.path = os.path.join(parent_dir, name + "_" + timestamp + ".jsonl")
+        self.state_path = os.path.join(parent_dir, name + "_" + timestamp + "_state.pkl") if save_state else None
+        self.metrics_file = open(self.path, "a")
+        self.state_file = open(self.state_path, "ab") if save_state else None
+
+    def write(self, t:int, database):
+        """写入t时刻的数据，在该时刻的评估完成之后调用"""
+        record:dict = database.data[t]
+        scalar, other = split_evaluate(record.get("evaluate", {}))
+        self.metrics_file.write(json.dumps({"time": t, **scalar}) + "\n")
+        self.metrics_file.flush()
+        if self.state_file is not None:
+            # LazyState等按需还原的状态在这里转换为普通字典
+            state = {key: value for key, value in record.get("state", {}).items()}
+            pickle.dump((t, {"state": state, "action": record.get("action", {}), "evaluate": other}), self.state_file)
+            self.state_file.flush()
+
+    def close(self):
+        self.metrics_file.close()
+        if self.state_file is not None:
+            self.state_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_metrics(path:str, chunksize:int = None):
+    """读取MetricsWriter写入的指标，chunksize不为None时返回按块读取的迭代器"""
+    return pd.read_json(path, lines=True, chunksize=chunksize)
+
+def iter_state(path:str):
+    """依次读取_state.pkl中每个时刻的(时刻, {"state", "action", "evaluate"})，文件可以仍在写入中"""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
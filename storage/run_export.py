@@ -0,0 +1,189 @@
+# 运行数据导出为Parquet或Arrow IPC列式文件，以及按需读取列和时间范围的加载器
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from database import Database
+from storage.metrics_writer import split_evaluate
+
+def _deployment_columns(database:Database, times:list):
+    columns = {"time": [], "device_id": [], "app_id": [], "ms_id": [], "server_id": []}
+    for t in times:
+        deployment:dict = database.data[t]["state"]["microservice_deployment"]
+        for device_id, app_dict in deployment.items():
+            for app_id, ms_dict in app_dict.items():
+                columns["time"].extend([t] * len(ms_dict))
+                columns["device_id"].extend([device_id] * len(ms_dict))
+                columns["app_id"].extend([app_id] * len(ms_dict))
+                columns["ms_id"].extend(ms_dict.keys())
+                columns["server_id"].extend(ms_dict.values())
+    return pa.table({key: pa.array(value, type=pa.int32()) for key, value in columns.items()})
+
+def _connection_columns(database:Database, times:list):
+    columns = {"time": [], "device_id": [], "server_id": []}
+    for t in times:
+        connection:dict = database.data[t]["state"]["device_connect_to_server"]
+        columns["time"].extend([t] * len(connection))
+        columns["device_id"].extend(connection.keys())
+        columns["server_id"].extend(connection.values())
+    return pa.table({key: pa.array(value, type=pa.int32()) for key, value in columns.items()})
+
+def _server_columns(database:Database, times:list):
+    columns = {"time": [], "server_id": [], "left_storage": [], "left_computing": []}
+    for t in times:
+        state = database.data[t]["state"]
+        columns["time"].extend([t] * len(state["server_left_storage"]))
+        columns["server_id"].extend(state["server_left_storage"].keys())
+        columns["left_storage"].extend(state["server_left_storage"].values())
+        columns["left_computing"].extend(state["server_left_computing"][server_id] for server_id in state["server_left_storage"])
+    return pa.table({"time": pa.array(columns["time"], type=pa.int32()), "server_id": pa.array(columns["server_id"], type=pa.int32()),
+                     "left_storage": pa.array(columns["left_storage"], type=pa.float64()), "left_computing": pa.array(columns["left_computing"], type=pa.float64())})
+
+# 导出的服务器镜像层状态，部署的层记录使用的微服务个数，缓存和预取的层为层名称列表，count记为1
+LAYER_KEYS = ["server_deployed_layers", "server_cached_layers", "server_prefetched_layers"]
+
+def _layer_columns(database:Database, times:list, layer_keys:list):
+    columns = {"time": [], "server_id": [], "kind": [], "layer": [], "count": []}
+    for t in times:
+        state = database.data[t]["state"]
+        for kind, key in enumerate(layer_keys):
+            for server_id, layers in state[key].items():
+                counts = layers if isinstance(layers, dict) else dict.fromkeys(layers, 1)
+                columns["time"].extend([t] * len(counts))
+                columns["server_id"].extend([server_id] * len(counts))
+                columns["kind"].extend([kind] * len(counts))
+                columns["layer"].extend(counts.keys())
+                columns["count"].extend(counts.values())
+    return pa.table({"time": pa.array(columns["time"], type=pa.int32()), "server_id": pa.array(columns["server_id"], type=pa.int32()),
+                     "kind": pa.array(columns["kind"], type=pa.int8()), "layer": pa.array(columns["layer"], type=pa.string()),
+                     "count": pa.array(columns["count"], type=pa.int32())})
+
+def _metrics_columns(database:Database):
+    rows = [{"time": t, **split_evaluate(database.data[t].get("evaluate", {}))[0]} for t in sorted(database.data.keys())]
+    # 各时刻的指标不完全相同，由pandas合并所有列，缺失的位置为null
+    return pa.Table.from_pandas(pd.DataFrame(rows, columns=None if rows else ["time"]), preserve_index=False)
+
+def export_run(database:Database, path:str, format:str = "parquet", compression:str = "zstd"):
+    """
+    将数据库导出到path目录，每张表一个文件，均以time为第一列并按time升序排列：metrics为每个时刻的标量评估指标，deployment为每个时刻每个微服务实例部署的服务器，
+    connection为设备连接的服务器，server为服务器剩余存储和算力，layers为服务器上部署、缓存和预取的镜像层（kind为LAYER_KEYS中的下标），
+    static.pkl为静态数据、拓扑变化的时刻和layers中记录的状态，
+    format为parquet或arrow（Arrow IPC，可以直接内存映射），返回path
+    """
+    if format not in ["parquet", "arrow"]:
+        raise ValueError("format must be 'parquet' or 'arrow'")
+    os.makedirs(path, exist_ok=True)
+    times = sorted(t for t in database.data.keys() if "microservice_deployment" in database.data[t].get("state", {}))
+    connection_times = sorted(t for t in database.data.keys() if "device_connect_to_server" in database.data[t].get("state", {}))
+    # 只导出每个记录部署的时刻都有的镜像层状态，例如没有启用镜像层缓存时不记录缓存的层
+    layer_keys = [key for key in LAYER_KEYS if all(key in database.data[t]["state"] for t in times)]
+    tables = {"metrics": _metrics_columns(database), "deployment": _deployment_columns(database, times),
+              "connection": _connection_columns(database, connection_times), "server": _server_columns(database, times),
+              "layers": _layer_columns(database, times, layer_keys)}
+    for name, table in tables.items():
+        if format == "parquet":
+            # 按时刻分成较小的行组，按时间范围读取时可以跳过不需要的行组
+            pq.write_table(table, os.path.join(path, name + ".parquet"), compression=compression, row_group_size=64 * 1024)
+        else:
+            with ipc.new_file(os.path.join(path, name + ".arrow"), table.schema, options=ipc.IpcWriteOptions(compression=compression)) as writer:
+                writer.write_table(table, max_chunksize=64 * 1024)
+    with open(os.path.join(path, "static.pkl"), "wb") as f:
+        pickle.dump({"format": format, "static_data": database.static_data, "topo_times": database.topo_times, "layer_keys": layer_keys}, f)
+    return path
+
+class RunData:
+    """
+    export_run导出的运行数据的加载器，只读取需要的列和时间范围，Arrow IPC格式的文件直接内存映射
+    """
+    def __init__(self, path:str):
+        self.path = path
+        with open(os.path.join(path, "static.pkl"), "rb") as f:
+            static = pickle.load(f)
+        self.format = static["format"]
+        self.static_data = static["static_data"]
+        self.topo_times = static["topo_times"]
+        # 旧版本导出的目录没有layers表
+        self.layer_keys = static.get("layer_keys")
+        self.datasets = {}
+
+    def dataset(self, name:str):
+        if name not in self.datasets:
+            if self.format == "parquet":
+                self.datasets[name] = ds.dataset(os.path.join(self.path, name + ".parquet"), format="parquet")
+            else:
+                self.datasets[name] = ds.dataset(os.path.join(self.path, name + ".arrow"), format="ipc", filesystem=pafs.LocalFileSystem(use_mmap=True))
+        return self.datasets[name]
+
+    def read(self, name:str, columns:list = None, start_time:int = None, end_time:int = None):
+        """读取表name中[start_time, end_time]时间范围内的列，返回pyarrow.Table"""
+        condition = None
+        if start_time is not None:
+            condition = ds.field("time") >= start_time
+        if end_time is not None:
+            condition = ds.field("time") <= end_time if condition is None else condition & (ds.field("time") <= end_time)
+        return self.dataset(name).to_table(columns=columns, filter=condition)
+
+    def metrics(self, columns:list = None, start_time:int = None, end_time:int = None):
+        """标量评估指标，返回pandas表格"""
+        if columns is not None and "time" not in columns:
+            columns = ["time"] + list(columns)
+        return self.read("metrics", columns, start_time, end_time).to_pandas()
+
+    def to_database(self, start_time:int = None, end_time:int = None):
+        """
+        将时间范围内的部署、设备连接、服务器资源和镜像层还原为Database，用于evaluate_run重新评估，
+        镜像层使用运行时记录的状态，只有没有layers表时才由部署和微服务库推导部署的层
+        """
+        database = Database()
+        database.static_data = self.static_data
+        database.topo_times = list(self.topo_times)
+        for t, state in self._iter_state("connection", start_time, end_time, ["device_id", "server_id"]):
+            database.add(t, "state", "device_connect_to_server", dict(zip(state["device_id"].tolist(), state["server_id"].tolist())))
+        for t, state in self._iter_state("deployment", start_time, end_time, ["device_id", "app_id", "ms_id", "server_id"]):
+            rows = list(zip(*(state[key].tolist() for key in ["device_id", "app_id", "ms_id", "server_id"])))
+            deployment = {}
+            for device_id, app_id, ms_id, server_id in rows:
+                deployment.setdefault(device_id, {}).setdefault(app_id, {})[ms_id] = server_id
+            database.add(t, "state", "microservice_deployment", deployment)
+            if self.layer_keys is None:
+                database.add(t, "state", "server_deployed_layers", database.derive_server_layers(rows))
+            else:
+                for key in self.layer_keys:
+                    database.add(t, "state", key, {server_id: {} if key == "server_deployed_layers" else [] for server_id in self.static_data["server_library"]})
+        if self.layer_keys:
+            self._load_layers(database, start_time, end_time)
+        for t, state in self._iter_state("server", start_time, end_time, ["server_id", "left_storage", "left_computing"]):
+            server_ids = state["server_id"].tolist()
+            database.add(t, "state", "server_left_storage", dict(zip(server_ids, state["left_storage"].tolist())))
+            database.add(t, "state", "server_left_computing", dict(zip(server_ids, state["left_computing"].tolist())))
+        return database
+
+    def _load_layers(self, database:Database, start_time:int, end_time:int):
+        """按导出时的顺序填入每个时刻每台服务器的镜像层"""
+        for t, state in self._iter_state("layers", start_time, end_time, ["server_id", "kind", "layer", "count"]):
+            for server_id, kind, layer, count in zip(*(state[key].tolist() for key in ["server_id", "kind", "layer", "count"])):
+                layers = database.data[t]["state"][self.layer_keys[kind]][server_id]
+                if isinstance(layers, dict):
+                    layers[layer] = count
+                else:
+                    layers.append(layer)
+
+    def _iter_state(self, name:str, start_time:int, end_time:int, columns:list):
+        """按时刻分组读取表，表在导出时已经按time排序"""
+        table = self.read(name, ["time"] + columns, start_time, end_time)
+        arrays = {key: table.column(key).to_numpy() for key in ["time"] + columns}
+        times, starts = np.unique(arrays["time"], return_index=True)
+        ends = np.append(starts[1:], len(arrays["time"]))
+        for t, start, end in zip(times.tolist(), starts, ends):
+            yield t, {key: arrays[key][start:end] for key in columns}
+
+def save_run(database:Database, name:str = "run", format:str = "parquet"):
+    """导出到output目录下带时间戳的目录中，返回目录路径"""
+    timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+    return export_run(database, os.getcwd() + "/output/" + name + "_" + timestamp, format)
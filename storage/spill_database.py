@@ -0,0 +1,133 @@
+# 有保留窗口的数据库，只在内存中保留最近的若干个时刻，更早的时刻写入磁盘，读取时再按需加载
+import os
+import copy
+import shutil
+import pickle
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from database import Database
+
+class SpillDict(MutableMapping):
+    """
+    时刻 -> 该时刻数据的字典，最近retention个时刻放在内存中，超出的最早时刻用pickle写入spill_dir下的文件，
+    读取已写入磁盘的时刻时加载并缓存最近的cache_size个
+    """
+    def __init__(self, retention:int, spill_dir:str, cache_size:int = 2):
+        self.retention = retention
+        self.cache_size = cache_size
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+        # 每个实例使用单独的目录，深拷贝的数据库不会覆盖原有的文件
+        self.path = tempfile.mkdtemp(prefix="spill_", dir=spill_dir)
+        self.hot = OrderedDict()
+        self.spilled = set()
+        self.loaded = OrderedDict()
+
+    def _file(self, t):
+        return os.path.join(self.path, "{}.pkl".format(t))
+
+    def _spill(self, t):
+        with open(self._file(t), "wb") as f:
+            pickle.dump(self.hot.pop(t), f)
+        self.spilled.add(t)
+
+    def _load(self, t):
+        if t in self.loaded:
+            self.loaded.move_to_end(t)
+            return self.loaded[t]
+        with open(self._file(t), "rb") as f:
+            value = pickle.load(f)
+        self.loaded[t] = value
+        while len(self.loaded) > self.cache_size:
+            self.loaded.popitem(last=False)
+        return value
+
+    def write_back(self, t):
+        """已写入磁盘的时刻被修改后重新写入"""
+        if t in self.spilled and t in self.loaded:
+            with open(self._file(t), "wb") as f:
+                pickle.dump(self.loaded[t], f)
+
+    def __getitem__(self, t):
+        if t in self.hot:
+            return self.hot[t]
+        if t in self.spilled:
+            return self._load(t)
+        raise KeyError(t)
+
+    def __setitem__(self, t, value):
+        if t in self.spilled:
+            self.spilled.remove(t)
+            self.loaded.pop(t, None)
+            os.remove(self._file(t))
+        self.hot[t] = value
+        # 按照写入的顺序，超出保留窗口的最早时刻写入磁盘
+        while len(self.hot) > self.retention:
+            self._spill(next(iter(self.hot)))
+
+    def __delitem__(self, t):
+        if t in self.hot:
+            self.hot.pop(t)
+        elif t in self.spilled:
+            self.spilled.remove(t)
+            self.loaded.pop(t, None)
+            os.remove(self._file(t))
+        else:
+            raise KeyError(t)
+
+    def __contains__(self, t):
+        return t in self.hot or t in self.spilled
+
+    def __iter__(self):
+        return iter(sorted(self.spilled) + list(self.hot))
+
+    def __len__(self):
+        return len(self.hot) + len(self.spilled)
+
+    def clear(self):
+        """删除内存和磁盘中的所有数据"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.hot = OrderedDict()
+        self.spilled = set()
+        self.loaded = OrderedDict()
+
+    def __deepcopy__(self, memo):
+        new = SpillDict(self.retention, self.spill_dir, self.cache_size)
+        memo[id(self)] = new
+        for t in self.spilled:
+            shutil.copyfile(self._file(t), new._file(t))
+        new.spilled = set(self.spilled)
+        new.hot = copy.deepcopy(self.hot, memo)
+        return new
+
+class SpillDatabase(Database):
+    """
+    有保留窗口的数据库，接口与Database相同
+    求解算法和评估模块只读取t和t-1时刻，因此内存中只保留最近retention个时刻，更早的时刻写入spill_dir，
+    仍然可以通过data[t]读取，长时间的实时运行占用的内存不随时间增长
+    """
+    def __init__(self, retention:int = 4, spill_dir:str = None):
+        super().__init__()
+        if retention < 2:
+            raise ValueError("retention must be at least 2, evaluate needs time t and t-1")
+        self.retention = retention
+        self.spill_dir = spill_dir if spill_dir is not None else os.getcwd() + "/output/spill"
+        self.data = SpillDict(retention, self.spill_dir)
+
+    def add(self, t:int, type:str, key, value):
+        super().add(t, type, key, value)
+        self.data.write_back(t)
+
+    def add_dict(self, t:int, type:str, data:dict):
+        super().add_dict(t, type, data)
+        self.data.write_back(t)
+
+    def reset(self):
+        self.data.clear()
+
+    def reset_complete(self):
+        self.data.clear()
+        super().reset_complete()
+        self.data = SpillDict(self.retention, self.spill_dir)
@@ -0,0 +1,331 @@
+# SQLite数据库，运行数据写入本地文件，每个时刻的数据在一个事务中批量写入
+import os
+import copy
+import time
+import pickle
+import sqlite3
+import numbers
+from collections import OrderedDict
+from collections.abc import Mapping
+from database import Database, LazyState
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS record (time INTEGER, type TEXT, key TEXT, storage TEXT, PRIMARY KEY (time, type, key));
+CREATE TABLE IF NOT EXISTS deployment (time INTEGER, device_id INTEGER, app_id INTEGER, ms_id INTEGER, server_id INTEGER, PRIMARY KEY (time, device_id, app_id, ms_id));
+CREATE TABLE IF NOT EXISTS connection (time INTEGER, device_id INTEGER, server_id INTEGER, PRIMARY KEY (time, device_id));
+CREATE TABLE IF NOT EXISTS server_resource (time INTEGER, key TEXT, server_id INTEGER, value REAL, PRIMARY KEY (time, key, server_id));
+CREATE TABLE IF NOT EXISTS action (time INTEGER, type TEXT, device_id INTEGER, app_id INTEGER, ms_id INTEGER, server_id INTEGER);
+CREATE INDEX IF NOT EXISTS action_index ON action (time, device_id, app_id, ms_id);
+CREATE TABLE IF NOT EXISTS evaluate (time INTEGER, key TEXT, value, PRIMARY KEY (time, key));
+CREATE TABLE IF NOT EXISTS blob (time INTEGER, type TEXT, key TEXT, value BLOB, PRIMARY KEY (time, type, key));
+CREATE TABLE IF NOT EXISTS static (key TEXT PRIMARY KEY, value BLOB, version INTEGER);
+"""
+
+class SQLiteData(Mapping):
+    """
+    时刻 -> {"state", "action", "evaluate"}，与Database.data的读取方式相同，每次读取时从SQLite中还原
+    """
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, t):
+        self.database.refresh()
+        if t not in self.database.times:
+            raise KeyError(t)
+        return self.database.restore_record(t)
+
+    def __contains__(self, t):
+        self.database.refresh()
+        return t in self.database.times
+
+    def __iter__(self):
+        self.database.refresh()
+        return iter(sorted(self.database.times))
+
+    def __len__(self):
+        self.database.refresh()
+        return len(self.database.times)
+
+class SQLiteDatabase(Database):
+    """
+    SQLite存储的数据库，接口与Database相同，不需要单独的数据库服务
+    部署、设备连接、服务器剩余资源和动作存放在按(时刻, 设备, 应用, 微服务)建立索引的表中，标量评估指标单独一张表，其余数据pickle后存放，
+    同一时刻的写入先缓存在内存中，时刻变化或者调用commit时在一个事务中批量写入，
+    使用WAL模式，仿真运行时其他进程可以用SQLiteDatabase(path)只读打开同一个文件进行分析
+    静态数据在内存中保留一份供环境和算法使用，同时写入static表，每次写入时版本号加一，
+    读取时发现其他连接写入了文件（PRAGMA data_version变化）就重新读取写入的时刻、版本号更新过的静态数据，并清空还原的缓存
+    """
+    # 由同一时刻的微服务部署推导的状态
+    DERIVED_KEYS = ["server_microservice_deployment", "server_deployed_layers"]
+    SERVER_KEYS = ["server_left_storage", "server_left_computing"]
+
+    def __init__(self, path:str = None, cache_size:int = 8):
+        super().__init__()
+        if path is None:
+            timestamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
+            path = os.getcwd() + "/output/run_" + timestamp + ".db"
+        self.path = path
+        self.cache_size = cache_size
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        if "version" not in [row[1] for row in self.connection.execute("PRAGMA table_info(static)")]:
+            # 旧版本的文件中静态数据没有版本号
+            with self.connection:
+                self.connection.execute("ALTER TABLE static ADD COLUMN version INTEGER DEFAULT 0")
+        self.data = SQLiteData(self)
+        # 尚未写入的时刻和数据，type -> key -> value
+        self.pending_time = None
+        self.pending = {}
+        # (时刻, 键) -> 还原后的状态，时刻 -> 还原后的{"state", "action", "evaluate"}
+        self.state_cache = OrderedDict()
+        self.record_cache = OrderedDict()
+        # 已经读取的静态数据的最大版本号和文件的data_version，打开已有文件时读取其中的静态数据和时刻
+        self.static_version = -1
+        self.data_version = None
+        self.refresh()
+
+    # ------------------------写入------------------------
+
+    def add(self, t:int, type:str, key, value):
+        if type not in ["state", "action", "evaluate"]:
+            raise ValueError("type must be 'state' or 'action' or 'evaluate'")
+        self._switch_pending(t)
+        self.pending.setdefault(type, {})[key] = value
+        self.times.add(t)
+        self.state_cache.pop((t, key), None)
+        self.record_cache.pop(t, None)
+
+    def add_dict(self, t:int, type:str, data:dict):
+        if type not in ["state", "action", "evaluate"]:
+            raise ValueError("type must be 'state' or 'action' or 'evaluate'")
+        if t in self.times and type in self.restore_record(t):
+            return
+        self._switch_pending(t)
+        # 动作作为一个整体存储，与Database.add_dict相同
+        if type == "action":
+            self.pending["action"] = {None: data}
+        else:
+            self.pending[type] = dict(data)
+        self.times.add(t)
+        self.record_cache.pop(t, None)
+
+    def add_static_data(self, key, value):
+        super().add_static_data(key, value)
+        with self.connection:
+            self._write_static(key, value)
+
+    def add_topo_data(self, t:int, topo_data:dict):
+        super().add_topo_data(t, topo_data)
+        with self.connection:
+            self._write_static("topo_history", self.static_data["topo_history"])
+            self._write_static("topo_times", self.topo_times)
+
+    def _write_static(self, key, value):
+        self.static_version += 1
+        self.connection.execute("INSERT OR REPLACE INTO static VALUES (?, ?, ?)", (key, pickle.dumps(value), self.static_version))
+
+    def _switch_pending(self, t:int):
+        if self.pending_time is not None and self.pending_time != t:
+            self.commit()
+        self.pending_time = t
+
+    def commit(self):
+        """将缓存的时刻在一个事务中写入"""
+        if self.pending_time is None:
+            return
+        t = self.pending_time
+        with self.connection:
+            for type, values in self.pending.items():
+                for key, value in values.items():
+                    self._write(t, type, key, value)
+        self.pending_time = None
+        self.pending = {}
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def _write(self, t:int, type:str, key, value):
+        execute = self.connection.execute
+        executemany = self.connection.executemany
+        if type == "state" and key == "microservice_deployment":
+            storage = "deployment"
+            execute("DELETE FROM deployment WHERE time = ?", (t,))
+            executemany("INSERT INTO deployment VALUES (?, ?, ?, ?, ?)", ((t, device_id, app_id, ms_id, server_id)
+                        for device_id, app_dict in value.items() for app_id, ms_dict in app_dict.items() for ms_id, server_id in ms_dict.items()))
+        elif type == "state" and key == "device_connect_to_server":
+            storage = "connection"
+            execute("DELETE FROM connection WHERE time = ?", (t,))
+            executemany("INSERT INTO connection VALUES (?, ?, ?)", ((t, device_id, server_id) for device_id, server_id in value.items()))
+        elif type == "state" and key in self.SERVER_KEYS:
+            storage = "server_resource"
+            execute("DELETE FROM server_resource WHERE time = ? AND key = ?", (t, key))
+            executemany("INSERT INTO server_resource VALUES (?, ?, ?, ?)", ((t, key, server_id, server_value) for server_id, server_value in value.items()))
+        elif type == "state" and key in self.DERIVED_KEYS and "microservice_deployment" in self.pending.get("state", {}):
+            storage = "derived"
+        elif type == "action" and key is None:
+            storage = "action"
+            execute("DELETE FROM action WHERE time = ?", (t,))
+            rows = []
+            for action_type, device_dict in value.items():
+                rows.append((t, action_type, None, None, None, None))
+                for device_id, app_dict in device_dict.items():
+                    for app_id, ms_dict in app_dict.items():
+                        for ms_id in ms_dict:
+                            # 卸载动作中的微服务可以是列表，此时服务器为空
+                            rows.append((t, action_type, device_id, app_id, ms_id, ms_dict[ms_id] if isinstance(ms_dict, dict) else None))
+            executemany("INSERT INTO action VALUES (?, ?, ?, ?, ?, ?)", rows)
+            key = ""
+        elif type == "evaluate" and (value is None or isinstance(value, (numbers.Number, str))):
+            storage = "evaluate"
+            execute("INSERT OR REPLACE INTO evaluate VALUES (?, ?, ?)", (t, key, value.item() if hasattr(value, "item") else value))
+        else:
+            storage = "blob"
+            execute("INSERT OR REPLACE INTO blob VALUES (?, ?, ?, ?)", (t, type, key, pickle.dumps(value)))
+        execute("INSERT OR REPLACE INTO record VALUES (?, ?, ?, ?)", (t, type, key, storage))
+
+    # ------------------------读取------------------------
+
+    def refresh(self):
+        """其他连接写入文件后，重新读取写入的时刻和更新过的静态数据，自己写入时data_version不变"""
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+        for key, value, version in self.connection.execute("SELECT key, value, version FROM static WHERE version > ? ORDER BY version", (self.static_version,)):
+            if key == "topo_times":
+                self.topo_times = pickle.loads(value)
+            else:
+                self.static_data[key] = pickle.loads(value)
+            self.static_version = version
+        self.times = set(row[0] for row in self.connection.execute("SELECT DISTINCT time FROM record"))
+        if self.pending_time is not None:
+            self.times.add(self.pending_time)
+        self.state_cache.clear()
+        self.record_cache.clear()
+
+    def get_topo_data(self, key:str, t:int = None):
+        self.refresh()
+        return super().get_topo_data(key, t)
+
+    def restore_record(self, t:int):
+        """还原t时刻的{"state", "action", "evaluate"}，尚未写入的数据直接使用缓存，状态在读取具体的键时才还原"""
+        if t in self.record_cache:
+            self.record_cache.move_to_end(t)
+            return self.record_cache[t]
+        record = {}
+        for type, key, storage in self.connection.execute("SELECT type, key, storage FROM record WHERE time = ? ORDER BY rowid", (t,)):
+            if type == "state":
+                state:LazyState = record.setdefault("state", LazyState(self, t))
+                state.key_restored[key] = True
+            elif storage == "action":
+                record["action"] = self._restore_action(t)
+            else:
+                record.setdefault(type, {})[key] = self._restore_value(t, type, key, storage)
+        if t == self.pending_time:
+            for type, values in self.pending.items():
+                if type == "state":
+                    state:LazyState = record.setdefault("state", LazyState(self, t))
+                    for key in values:
+                        state.key_restored[key] = True
+                elif type == "action" and None in values:
+                    record["action"] = values[None]
+                else:
+                    record.setdefault(type, {}).update(values)
+        self.record_cache[t] = record
+        while len(self.record_cache) > self.cache_size:
+            self.record_cache.popitem(last=False)
+        return record
+
+    def restore_state(self, t:int, key:str):
+        if t == self.pending_time and key in self.pending.get("state", {}):
+            return self.pending["state"][key]
+        if (t, key) in self.state_cache:
+            self.state_cache.move_to_end((t, key))
+            return self.state_cache[(t, key)]
+        row = self.connection.execute("SELECT storage FROM record WHERE time = ? AND type = 'state' AND key = ?", (t, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        storage = row[0]
+        if storage == "deployment":
+            value = {}
+            for device_id, app_id, ms_id, server_id in self._query_deployment(t):
+                value.setdefault(device_id, {}).setdefault(app_id, {})[ms_id] = server_id
+        elif storage == "connection":
+            value = dict(self.connection.execute("SELECT device_id, server_id FROM connection WHERE time = ? ORDER BY rowid", (t,)))
+        elif storage == "server_resource":
+            value = dict(self.connection.execute("SELECT server_id, value FROM server_resource WHERE time = ? AND key = ? ORDER BY rowid", (t, key)))
+        elif storage == "derived":
+            deployment_rows = self._query_deployment(t)
+            value = self.derive_server_deployment(deployment_rows) if key == "server_microservice_deployment" else self.derive_server_layers(deployment_rows)
+        else:
+            value = pickle.loads(self.connection.execute("SELECT value FROM blob WHERE time = ? AND type = 'state' AND key = ?", (t, key)).fetchone()[0])
+        self.state_cache[(t, key)] = value
+        while len(self.state_cache) > self.cache_size:
+            self.state_cache.popitem(last=False)
+        return value
+
+    def _query_deployment(self, t:int):
+        if t == self.pending_time and "microservice_deployment" in self.pending.get("state", {}):
+            deployment = self.pending["state"]["microservice_deployment"]
+            return [(device_id, app_id, ms_id, server_id) for device_id, app_dict in deployment.items() for app_id, ms_dict in app_dict.items() for ms_id, server_id in ms_dict.items()]
+        return self.connection.execute("SELECT device_id, app_id, ms_id, server_id FROM deployment WHERE time = ? ORDER BY rowid", (t,)).fetchall()
+
+    def _restore_action(self, t:int):
+        action = {}
+        for action_type, device_id, app_id, ms_id, server_id in self.connection.execute(
+                "SELECT type, device_id, app_id, ms_id, server_id FROM action WHERE time = ? ORDER BY rowid", (t,)):
+            device_dict = action.setdefault(action_type, {})
+            if device_id is not None:
+                device_dict.setdefault(device_id, {}).setdefault(app_id, {})[ms_id] = server_id
+        return action
+
+    def _restore_value(self, t:int, type:str, key:str, storage:str):
+        if storage == "evaluate":
+            return self.connection.execute("SELECT value FROM evaluate WHERE time = ? AND key = ?", (t, key)).fetchone()[0]
+        return pickle.loads(self.connection.execute("SELECT value FROM blob WHERE time = ? AND type = ? AND key = ?", (t, type, key)).fetchone()[0])
+
+    # ------------------------其他------------------------
+
+    def reset(self):
+        self.pending_time = None
+        self.pending = {}
+        self.state_cache = OrderedDict()
+        self.record_cache = OrderedDict()
+        with self.connection:
+            for table in ["record", "deployment", "connection", "server_resource", "action", "evaluate", "blob"]:
+                self.connection.execute("DELETE FROM " + table)
+        self.times = set()
+
+    def reset_complete(self):
+        self.reset()
+        super().reset_complete()
+        self.data = SQLiteData(self)
+        with self.connection:
+            self.connection.execute("DELETE FROM static")
+
+    def __deepcopy__(self, memo):
+        """复制到同一目录下的新文件，静态数据与其他对象一起深拷贝"""
+        self.commit()
+        root, extension = os.path.splitext(self.path)
+        path = root + "_copy_" + str(id(memo)) + extension
+        new = SQLiteDatabase.__new__(SQLiteDatabase)
+        memo[id(self)] = new
+        new.path = path
+        new.cache_size = self.cache_size
+        new.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.backup(new.connection)
+        new.connection.execute("PRAGMA journal_mode=WAL")
+        new.static_data = copy.deepcopy(self.static_data, memo)
+        new.topo_times = list(self.topo_times)
+        new.times = set(self.times)
+        new.data = SQLiteData(new)
+        new.pending_time = None
+        new.pending = {}
+        new.state_cache = OrderedDict()
+        new.record_cache = OrderedDict()
+        new.static_version = self.static_version
+        new.data_version = None
+        return new
@@ -0,0 +1,36 @@
+# 测试共用的小规模环境，使用贪婪算法和随机算法运行，不依赖gurobi
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from environment.migration_environment import Prodution
+from database import Database
+from config import get_config
+
+
+def build_production(database:Database = None, algorithm_type:str = "greedy", end_time:int = 6, seed:int = 1, config_update:dict = None, **config_params):
+    """创建并预部署一个小规模的生产环境，返回(环境, 配置)"""
+    database = Database() if database is None else database
+    config_params.setdefault("device_number", 8)
+    config_params.setdefault("server_number", 6)
+    config_params.setdefault("application_number", 8)
+    config_params.setdefault("microservice_number", 16)
+    config_params.setdefault("start_mode", "greedy")
+    config = get_config(seed = seed, end_time = end_time, **config_params)
+    config.update(config_update or {})
+    production = Prodution(database = database, end_time = end_time, algorithm_type = algorithm_type, no_output = True)
+    production.create_environment_from_config(config)
+    production.deploy_start(config["start"])
+    return production, config
+
+
+def run_step(production:Prodution, action:dict = None):
+    """前进一个时刻并执行动作，action为None时使用环境自带的算法求解，时间结束时返回False"""
+    if not production.time_next():
+        return False
+    production.get_state()
+    if action is None:
+        action = production.algorithm_solve(production.algorithm)
+    production.step(action)
+    return True
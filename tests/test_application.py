@@ -0,0 +1,41 @@
+import numpy as np
+
+import conftest  # noqa: F401
+from environment.application import Application, Microservice, Message
+
+
+def create_fan_in_app():
+    """1 -> 2 -> 4 -> 5, 1 -> 3 -> 4，汇聚节点4之后的消息有两条路径"""
+    app = Application(name = "fan_in", app_id = 1)
+    app.add_microservices([Microservice(id = ms_id, layers = {"layer{}".format(ms_id): 1}, cpu = 0.1) for ms_id in range(1, 6)])
+    app.add_messages([Message(data = 10, sender = 1, receiver = 2), Message(data = 20, sender = 1, receiver = 3),
+                      Message(data = 30, sender = 2, receiver = 4), Message(data = 40, sender = 3, receiver = 4),
+                      Message(data = 50, sender = 4, receiver = 5)])
+    return app
+
+
+def recursive_communication(app, ms_id, distance):
+    """原有的沿头节点递归累计的通讯开销"""
+    cost = 0
+    for next_ms in app.microservice_library[ms_id].next_ms:
+        cost += distance(ms_id, next_ms) * app.get_data_from_message(ms_id, next_ms)
+        cost += recursive_communication(app, next_ms, distance)
+    return cost
+
+
+def test_edge_paths_match_recursive_communication():
+    app = create_fan_in_app()
+    np.testing.assert_array_equal(app.get_edge_paths(), [1, 1, 1, 1, 2])
+    server = {1: 0, 2: 1, 3: 2, 4: 0, 5: 3}
+    distance_matrix = np.array([[0, 1, 2, 3], [1, 0, 1, 2], [2, 1, 0, 1], [3, 2, 1, 0]])
+    ms_ids, sender, receiver, data = app.get_edges()
+    server_index = np.array([server[ms_id] for ms_id in ms_ids])
+    cost = (distance_matrix[server_index[sender], server_index[receiver]] * data * app.get_edge_paths()).sum()
+    assert cost == recursive_communication(app, app.find_head(), lambda u, v: distance_matrix[server[u], server[v]])
+
+
+def test_instance_shares_template_edges():
+    app = create_fan_in_app()
+    instance = app.instantiate()
+    assert instance.get_edges() is app.get_edges()
+    assert instance.get_edge_paths() is app.get_edge_paths()
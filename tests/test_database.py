@@ -0,0 +1,19 @@
+import pandas as pd
+
+from conftest import build_production, run_step
+from evaluate import Evaluate
+
+
+def test_save_to_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    production, _ = build_production(end_time = 3)
+    evaluate = Evaluate(production.db)
+    while run_step(production):
+        evaluate.evaluate_migration_cost(production.current_time)
+    full = pd.read_csv(production.db.save_to_csv(name = "full", scalar_only = False), header = [0, 1])
+    assert len(full) == len(production.db.data)
+    assert {("state", "microservice_deployment"), ("action", "migrate"), ("evaluate", "migration_cost")} <= set(full.columns)
+    scalar = pd.read_csv(production.db.save_to_csv(name = "scalar"))
+    assert list(scalar["time"]) == sorted(production.db.data.keys())
+    assert "migration_cost" in scalar.columns and "microservice_deployment" not in scalar.columns
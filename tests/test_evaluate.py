@@ -0,0 +1,43 @@
+import numpy as np
+
+from conftest import build_production, run_step
+from evaluate import Evaluate, ArrayEvaluate, IncrementalEvaluate
+
+COSTS = ["migration_cost", "image_pull_cost", "communication_cost", "communication_cost_after_move"]
+
+
+def assert_same_costs(production, evaluate_class, **kwargs):
+    """运行环境，每个时刻evaluate_class与Evaluate的四项成本一致"""
+    reference = Evaluate(production.db, **kwargs)
+    evaluate = evaluate_class(production.db, **kwargs)
+    steps = 0
+    while run_step(production):
+        time = production.current_time
+        for name in COSTS:
+            expected = getattr(reference, "evaluate_" + name)(time)
+            np.testing.assert_allclose(getattr(evaluate, "evaluate_" + name)(time), expected, err_msg = "{} at {}".format(name, time))
+        steps += 1
+    assert steps > 0
+
+
+def test_array_evaluate_matches_evaluate():
+    production, _ = build_production(end_time = 6)
+    assert_same_costs(production, ArrayEvaluate)
+
+
+def test_array_evaluate_matches_evaluate_with_latency():
+    production, _ = build_production(end_time = 4, image_type = "shared")
+    assert_same_costs(production, ArrayEvaluate, distance = "latency")
+
+
+def test_incremental_evaluate_matches_evaluate():
+    production, _ = build_production(end_time = 6)
+    assert_same_costs(production, IncrementalEvaluate)
+
+
+def test_incremental_evaluate_with_request_cancel():
+    # 设备在运行过程中取消请求的应用，增量状态需要重新建立
+    request = {2: [{"device_id": 1, "app_id": []}], 4: [{"device_id": 2, "app_id": []}]}
+    production, _ = build_production(end_time = 6, config_update = {"request": request})
+    assert_same_costs(production, IncrementalEvaluate)
+    assert production.device_library[1].request_app_library == {}
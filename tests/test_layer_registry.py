@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from environment.layer_registry import LayerRegistry
+
+
+def test_intern_keeps_sizes_in_id_order():
+    sizes = np.arange(1, 1001) / 5
+    registry = LayerRegistry.from_sizes(sizes)
+    np.testing.assert_array_equal(registry.sizes, sizes)
+    assert registry.L == 1000
+    # 重复注册返回相同的层id，不增加层
+    assert registry.intern(10, sizes[10]) == 10 and registry.L == 1000
+    with pytest.raises(ValueError):
+        registry.intern(10, sizes[10] + 1)
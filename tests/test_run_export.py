@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from conftest import build_production, run_step
+from evaluate import Evaluate, EVALUATE_METRICS, evaluate_run
+
+pytest.importorskip("pyarrow")
+from storage.run_export import RunData, export_run, LAYER_KEYS
+
+# 启用镜像层缓存和预取，拉取成本依赖运行时记录的缓存状态
+CACHE_CONFIG = {"layer_cache": {"policy": "lru", "capacity": 0.5}}
+
+
+def run_and_record(config_update:dict = None, end_time:int = 6):
+    """运行环境，每个时刻用Evaluate计算评估指标，返回(数据库, {时刻: {指标: 数值}})"""
+    production, _ = build_production(end_time = end_time, config_update = config_update)
+    evaluate = Evaluate(production.db)
+    recorded = {}
+    while run_step(production):
+        time = production.current_time
+        recorded[time] = {metric: getattr(evaluate, "evaluate_" + metric)(time) for metric in EVALUATE_METRICS}
+    assert recorded
+    return production.db, recorded
+
+
+def assert_matches_recorded(table, recorded:dict):
+    assert table["time"].tolist() == sorted(recorded.keys())
+    for metric in EVALUATE_METRICS:
+        np.testing.assert_allclose(table[metric].to_numpy(), [recorded[t][metric] for t in table["time"]], err_msg = metric)
+
+
+def test_evaluate_run_matches_recorded_metrics():
+    database, recorded = run_and_record()
+    assert_matches_recorded(evaluate_run(database, evaluate_class = Evaluate, workers = 1), recorded)
+    assert_matches_recorded(evaluate_run(database, workers = 1), recorded)
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_exported_run_keeps_layer_state(tmp_path, format):
+    database, recorded = run_and_record(CACHE_CONFIG)
+    path = export_run(database, str(tmp_path / "run"), format)
+    loaded = RunData(path).to_database()
+    assert RunData(path).layer_keys == LAYER_KEYS
+    for t in database.data:
+        for key in LAYER_KEYS:
+            assert loaded.get_state(t)[key] == database.get_state(t)[key], (t, key)
+    assert_matches_recorded(evaluate_run(path, workers = 1), recorded)
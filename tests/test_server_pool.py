@@ -0,0 +1,86 @@
+import random
+import warnings
+
+import numpy as np
+import pytest
+
+from conftest import build_production, run_step
+from environment.application import Microservice
+from environment.hardware import Server
+from environment.layer_registry import LayerRegistry
+from environment.server_pool import ServerPool, to_units
+
+
+def make_microservices(rng:random.Random, number:int = 12, layer_number:int = 8):
+    """大小为0.2到2.0的共享层，与ConfigGenerate生成的数值精度相同"""
+    sizes = {"layer" + str(i): rng.randint(1, 10) / 5 for i in range(layer_number)}
+    microservices = []
+    for ms_id in range(1, number+1):
+        names = rng.sample(sorted(sizes), rng.randint(1, 3))
+        microservices.append(Microservice(ms_id, {name: sizes[name] for name in names}, rng.randint(1, 10) / 2))
+    return microservices
+
+
+def test_server_pool_matches_float_accounting():
+    rng = random.Random(0)
+    templates = make_microservices(rng)
+    registry = LayerRegistry()
+    for ms in templates:
+        registry.add_microservice(ms)
+    storage, computing = [6.4, 8.2, 5.0], [12.5, 20, 9.5]
+    pool = ServerPool(storage, computing, registry)
+    float_servers = [Server(n+1, storage[n], computing[n], 1) for n in range(3)]
+    pool_servers = [Server(n+1, storage[n], computing[n], 1) for n in range(3)]
+    for n, server in enumerate(pool_servers):
+        server.attach_pool(pool, n)
+    deployed = []
+    for step in range(500):
+        n = rng.randrange(3)
+        if deployed and rng.random() < 0.4:
+            n, float_ms, pool_ms = deployed.pop(rng.randrange(len(deployed)))
+            float_servers[n].undeploy_ms(float_ms)
+            pool_servers[n].undeploy_ms(pool_ms)
+        else:
+            template = rng.choice(templates)
+            float_ms, pool_ms = Microservice(template.id, template.layers, template.cpu), Microservice(template.id, template.layers, template.cpu)
+            for ms in (float_ms, pool_ms):
+                ms.subordinate_device, ms.subordinate_app = step, 1
+            feasible = float_servers[n].feasibility_of_deploy(float_ms)
+            assert pool_servers[n].feasibility_of_deploy(pool_ms) == feasible, step
+            if feasible:
+                float_servers[n].deploy_ms(float_ms)
+                pool_servers[n].deploy_ms(pool_ms)
+                deployed.append((n, float_ms, pool_ms))
+        for float_server, pool_server in zip(float_servers, pool_servers):
+            assert np.isclose(pool_server.left_storage, float_server.left_storage), step
+            assert np.isclose(pool_server.left_computing, float_server.left_computing), step
+            assert pool_server.deployed_layers == float_server.deployed_layers, step
+    assert any(server.deployed_ms_number for server in pool_servers)
+
+
+def test_to_units_warns_when_rounding():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        np.testing.assert_array_equal(to_units([0.1, 0.2, 1.15, 33.33]), [10, 20, 115, 3333])
+        assert to_units(0.125, exact = False) == 12
+    with pytest.warns(RuntimeWarning):
+        assert to_units(0.123) == 12
+    with pytest.warns(RuntimeWarning):
+        to_units([1.0, 2.005])
+
+
+def test_layer_cache_invariants_during_run():
+    # 缓存和预取的层与部署的层不重叠，服务器存储由剩余存储、缓存和部署的层组成
+    config_update = {"layer_cache": {"policy": "lfu", "capacity": 0.5}, "layer_prefetch": {"min_probability": 0.0},
+                     "server": [{"id": server_id, "computing": 110, "storage": 8, "bandwidth": 0.1} for server_id in range(1, 7)]}
+    production, _ = build_production(end_time = 6, config_update = config_update)
+    pool = production.server_pool
+    cache = pool.cache
+    while run_step(production):
+        deployed = pool.layer_count > 0
+        assert not (cache.cached & deployed).any()
+        assert not (cache.prefetched & ~cache.cached).any()
+        np.testing.assert_array_equal(cache.cached_size, cache.cached @ pool.layer_sizes)
+        assert (cache.cached_size <= cache.capacity).all() and (pool.left_storage >= 0).all()
+        np.testing.assert_array_equal(pool.left_storage + cache.cached_size + deployed @ pool.layer_sizes, pool.storage)
+    assert cache.cached.any()
@@ -0,0 +1,99 @@
+import numpy as np
+
+from conftest import build_production, run_step
+from database import Database
+from storage.columnar_database import ColumnarDatabase
+from storage.delta_database import DeltaDatabase
+from storage.spill_database import SpillDatabase
+from storage.sqlite_database import SQLiteDatabase
+
+# 运行过程中设备取消请求的应用，部署中会出现没有应用的设备
+CANCEL_REQUEST = {2: [{"device_id": 1, "app_id": []}]}
+
+
+def assert_same_value(value, expected, path:str):
+    if isinstance(expected, dict):
+        assert isinstance(value, dict) and value.keys() == expected.keys(), path
+        for key in expected:
+            assert_same_value(value[key], expected[key], "{}/{}".format(path, key))
+    elif isinstance(expected, tuple):
+        # 推导的服务器部署中微服务id元组的顺序可能不同
+        assert sorted(value) == sorted(expected), path
+    elif isinstance(expected, (list, np.ndarray)):
+        assert len(value) == len(expected), path
+        for index in range(len(expected)):
+            assert_same_value(value[index], expected[index], "{}/{}".format(path, index))
+    else:
+        assert value == expected or np.isclose(value, expected), path
+
+
+def run_with(database:Database, end_time:int = 6, request:dict = None):
+    production, _ = build_production(database = database, end_time = end_time, config_update = {"request": request or {}})
+    while run_step(production):
+        pass
+    return database
+
+
+def assert_same_state(database:Database, end_time:int = 6, request:dict = None, keys:list = None):
+    """与字典实现的Database运行相同的环境，每个时刻读取的状态相同，keys为None时比较所有的键"""
+    expected = run_with(Database(), end_time, request)
+    run_with(database, end_time, request)
+    assert sorted(database.data.keys()) == sorted(expected.data.keys())
+    for t in expected.data:
+        state, expected_state = database.get_state(t), expected.get_state(t)
+        assert set(state) == set(expected_state), t
+        for key in keys or expected_state:
+            assert_same_value(state[key], expected_state[key], "{}/{}".format(t, key))
+
+
+def test_columnar_database_matches_database():
+    assert_same_state(ColumnarDatabase(capacity = 2))
+
+
+def test_columnar_database_restores_cancelled_requests():
+    assert_same_state(ColumnarDatabase(), request = CANCEL_REQUEST, keys = ["microservice_deployment", "device_request_app"])
+
+
+def test_columnar_database_restores_empty_devices():
+    database = ColumnarDatabase()
+    database.add(1, "state", "microservice_deployment", {1: {}, 2: {3: {}}, 3: {4: {1: 2}}})
+    assert database.get_state(1)["microservice_deployment"] == {1: {}, 2: {3: {}}, 3: {4: {1: 2}}}
+
+
+def test_delta_database_matches_database():
+    assert_same_state(DeltaDatabase(checkpoint_interval = 3))
+
+
+def test_delta_database_restores_cancelled_requests():
+    assert_same_state(DeltaDatabase(checkpoint_interval = 3), request = CANCEL_REQUEST)
+
+
+def test_spill_database_matches_database(tmp_path):
+    database = SpillDatabase(retention = 2, spill_dir = str(tmp_path))
+    assert_same_state(database)
+    # 只有最近的时刻留在内存中，其余的时刻在磁盘上
+    assert len(database.data.hot) == 2 and len(database.data.spilled) == len(database.data) - 2
+
+
+def test_sqlite_database_matches_database(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "run.db"), cache_size = 2)
+    assert_same_state(database)
+    database.close()
+
+
+def test_sqlite_reader_sees_later_static_data(tmp_path):
+    # 运行过程中只读打开同一个文件，之后写入的时刻和拓扑变化在读取时可见
+    path = str(tmp_path / "run.db")
+    production, _ = build_production(database = SQLiteDatabase(path), server_number = 6)
+    run_step(production)
+    production.db.commit()
+    reader = SQLiteDatabase(path)
+    initial = reader.get_topo_hop()
+    server_1, server_2 = next((i, j) for i in range(1, 7) for j in range(i+1, 7) if not production.G.has_edge(i, j))
+    production.add_link(server_1, server_2, output = False)
+    run_step(production)
+    production.db.commit()
+    assert reader.get_topo_hop()[server_1-1, server_2-1] == 1
+    np.testing.assert_array_equal(reader.get_topo_hop(0), initial)
+    assert sorted(reader.data) == sorted(production.db.data)
+    assert_same_value(dict(reader.get_state(production.current_time)), dict(production.db.get_state(production.current_time)), "state")
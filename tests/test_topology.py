@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+
+from conftest import build_production
+
+
+def assert_matches_rebuild(production):
+    """增量维护的距离矩阵与完全重建的结果一致"""
+    matrices = (production.hop_matrix, production.latency_matrix, production.bandwidth_matrix)
+    production.topo_build_distance_matrix()
+    for matrix, rebuilt in zip(matrices, (production.hop_matrix, production.latency_matrix, production.bandwidth_matrix)):
+        np.testing.assert_allclose(matrix, rebuilt)
+
+
+def test_hop_matches_rebuild_after_link_changes():
+    production, _ = build_production(server_number = 10)
+    rng = random.Random(0)
+    for _ in range(100):
+        server_1, server_2 = rng.sample(range(1, 11), 2)
+        if production.G.has_edge(server_1, server_2):
+            production.remove_link(server_1, server_2, output = False)
+        else:
+            production.add_link(server_1, server_2, output = False)
+        assert_matches_rebuild(production)
+
+
+def test_topo_hop_is_versioned_by_time():
+    production, _ = build_production(server_number = 6)
+    database = production.db
+    initial = database.get_topo_hop(0)
+    server_1, server_2 = next((i, j) for i in range(1, 7) for j in range(i+1, 7) if not production.G.has_edge(i, j))
+    for _ in range(3):
+        production.time_next()
+    production.add_link(server_1, server_2, output = False)
+    assert database.get_topo_hop(2) is initial
+    assert database.get_topo_hop(3)[server_1-1, server_2-1] == 1
+    # 不给出时刻时使用最近一次拓扑变化后的跳数表
+    assert database.get_topo_hop() is database.get_topo_hop(3)
+    assert database.get_topo_distance("hop") is database.get_topo_hop(3)
+
+
+def test_weighted_matrices_match_rebuild_after_link_changes():
+    production, _ = build_production(server_number = 12)
+    production.topo_check = True
+    rng = random.Random(1)
+    for _ in range(200):
+        server_1, server_2 = rng.sample(range(1, 13), 2)
+        if production.G.has_edge(server_1, server_2):
+            production.remove_link(server_1, server_2, output = False)
+        else:
+            production.add_link(server_1, server_2, latency = rng.choice([0.5, 1, 2, 3]), bandwidth = rng.choice([1.0, 5.0, np.inf]), output = False)
+        assert_matches_rebuild(production)
+
+
+def test_device_server_distance():
+    production, _ = build_production(server_number = 6)
+    device_id = 1
+    server_id = production.device_library[device_id].connected_server_id
+    assert production.get_device_server_hop(device_id, server_id) == 0
+    assert production.get_device_server_latency(device_id, server_id) == 0
+    for other_id in production.server_library:
+        assert production.get_device_server_latency(device_id, other_id) == production.latency_matrix[server_id-1, other_id-1]
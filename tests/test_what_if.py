@@ -0,0 +1,81 @@
+import copy
+
+import numpy as np
+import pytest
+
+from conftest import build_production, run_step
+from evaluate import WhatIfEvaluate
+
+
+def step_result(production, action):
+    """在环境副本上执行动作，返回(是否可行, 执行后的部署数组)"""
+    production = copy.deepcopy(production)
+    try:
+        production.step(action)
+    except ValueError:
+        return False, None
+    evaluate = WhatIfEvaluate(production.db)
+    return True, evaluate.get_deployment_array(production.current_time)
+
+
+def candidate_actions(production, action):
+    """算法给出的动作，把一个设备的微服务迁移到某台服务器上的动作，以及把所有微服务迁移到同一台服务器上的动作（通常不可行）"""
+    actions = [action]
+    for server_id in production.server_library:
+        migrate = {}
+        for device_id, device in production.device_library.items():
+            for app_id, app in device.request_app_library.items():
+                migrate.setdefault(device_id, {})[app_id] = {ms_id: server_id for ms_id in app.microservice_library}
+        actions.append({"migrate": {1: migrate[1]}})
+        actions.append({"migrate": migrate})
+    return actions
+
+
+def assert_check_action_matches_step(production, steps:int = 3):
+    checked = 0
+    for _ in range(steps):
+        if not production.time_next():
+            break
+        production.get_state()
+        time = production.current_time
+        action = production.algorithm_solve(production.algorithm)
+        evaluate = WhatIfEvaluate(production.db)
+        for candidate in candidate_actions(production, action):
+            deployment, reason = evaluate.check_action(time, candidate)
+            feasible, expected = step_result(production, candidate)
+            assert (deployment is not None) == feasible, reason
+            if feasible:
+                np.testing.assert_array_equal(deployment, expected)
+            checked += 1
+        production.step(action)
+    assert checked > 0
+
+
+def test_check_action_matches_step():
+    production, _ = build_production(end_time = 4)
+    assert_check_action_matches_step(production)
+
+
+def test_score_actions_does_not_modify_database():
+    production, _ = build_production(end_time = 4)
+    run_step(production)
+    production.time_next()
+    production.get_state()
+    time = production.current_time
+    action = production.algorithm_solve(production.algorithm)
+    evaluate = WhatIfEvaluate(production.db)
+    before = copy.deepcopy(production.db.data[time])
+    result = evaluate.score_actions(time, candidate_actions(production, action), theta = (1, 1, 1))
+    assert result["feasible"][0]
+    assert production.db.data[time].keys() == before.keys()
+    assert production.db.data[time].get("evaluate", {}).keys() == before.get("evaluate", {}).keys()
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu", "size"])
+def test_check_action_matches_step_with_layer_cache(policy):
+    # 服务器存储较小，缓存的层占用了剩余存储，很多候选动作只有淘汰缓存才可行
+    config_update = {"layer_cache": {"policy": policy, "capacity": 0.5}, "layer_prefetch": {"min_probability": 0.0},
+                     "server": [{"id": server_id, "computing": 110, "storage": 8, "bandwidth": 0.1} for server_id in range(1, 7)]}
+    production, _ = build_production(end_time = 6, config_update = config_update)
+    run_step(production)
+    assert_check_action_matches_step(production, steps = 4)